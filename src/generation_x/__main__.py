@@ -1,13 +1,24 @@
+import random
+import time
 from argparse import ArgumentParser, Namespace
-from pprint import pprint
+from typing import List
 
-import mido
-
-from app import generate_sequences_by_config_params, run_sequences
+from app import generate_sequences_by_config_params, run_sequences, reload_sequences, sequence_channels
 from elektron_cycles import get_outport_elektron
-from models import MusicScale, MusicScaleType, RunSettings
+from models import MusicScale, MusicScaleType, RunSettings, TONICS
 from config import sequences_config_parser
-from machine_jam import reset_jam, get_outport_jam
+from config_watcher import ConfigWatcher, load_sequences_config
+from pattern_cache import PatternCache, DEFAULT_CACHE_DIR
+from render import render_to_file
+from machine_jam import reset_jam, get_outport_jam, init_tracks, generate_control_map, parse_control_map, \
+    bank_controls, JAM_ACTIONS
+from transport import Transport
+from log import get_logger, configure, parse_subsystem_levels, LEVELS
+import metrics
+import midi_backends
+from midi_clock import CLOCK_MODES
+
+_log = get_logger('app')
 
 
 def _get_input_args() -> Namespace:
@@ -22,7 +33,7 @@ def _get_input_args() -> Namespace:
         type=str,
         default='c',
         help="Music scale tonic",
-        choices=['c', 'c#', 'd', 'd#', 'e', 'f', 'f#', 'g', 'g#', 'a', 'a#', 'b']
+        choices=TONICS
     )
     parser.add_argument(
         "-mss",
@@ -51,21 +62,264 @@ def _get_input_args() -> Namespace:
         choices=range(0, 100),
         metavar='0-100'
     )
+    parser.add_argument(
+        "-c",
+        "--config",
+        type=str,
+        default=None,
+        help="Sequences config file, one sequence per line, {tempo} and {rest_factor} are replaced with the values "
+             "of -t and -r. The file is watched while playing, changed sequences are regenerated and swapped in "
+             "on their next bar",
+    )
+    parser.add_argument(
+        "--config_poll",
+        type=float,
+        default=1.0,
+        help="Seconds between checks of the config file, 0 disables reloading",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=str,
+        default='threads',
+        help="Sequencing engine: a thread per sequence, a single scheduler thread firing all sequences "
+             "on absolute deadlines (drift-free and phase locked) or all sequences as coroutines on one asyncio loop",
+        choices=['threads', 'scheduler', 'asyncio']
+    )
+    parser.add_argument(
+        "--jam_fps",
+        type=int,
+        default=30,
+        help="Maschine Jam display refresh rate, only changed pads are sent on every frame",
+        choices=range(1, 121),
+        metavar='1-120'
+    )
+
+    parser.add_argument(
+        "--pool_size",
+        type=int,
+        default=4,
+        help="Pre-generated variations kept per sequence, a dice press only swaps in the next one, "
+             "0 generates on every press",
+    )
+    parser.add_argument(
+        "--pool_refill",
+        type=float,
+        default=4.0,
+        help="Max pre-generated variations per second, generated only while no dice press is waiting",
+    )
+    parser.add_argument(
+        "--clock",
+        type=str,
+        default='off',
+        help="MIDI clock (24 PPQN): master sends clock, start, stop and song position to the Elektron port at the root "
+             "tempo, slave follows the Elektron clock and transport, sequence tempos stay multiples of the clock. "
+             "The Jam tempo knob glides the master clock and all sequences, a slave ignores it",
+        choices=CLOCK_MODES
+    )
+    parser.add_argument(
+        "--jam_bank_controls",
+        type=int,
+        nargs=2,
+        default=list(bank_controls),
+        metavar=('PREV', 'NEXT'),
+        help="Maschine Jam controls switching to the previous / next bank of 8 tracks, the number of tracks is "
+             "the number of sequences in the config",
+    )
+    parser.add_argument(
+        "--jam_control",
+        type=str,
+        action='append',
+        metavar='CC=ACTION',
+        help=f"Maps a Maschine Jam control (CC number) to an action: {', '.join(JAM_ACTIONS)}, mute and regenerate "
+             f"take the column of the bank (0-7): CC=ACTION:COLUMN, none unmaps the control, applied over the "
+             f"default map and --jam_bank_controls, e.g. --jam_control 43=tempo --jam_control 42=none",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default='rtmidi',
+        help="MIDI backend: hardware ports, null (drops everything), recorder (in memory) or file "
+             "(sent messages written to --backend_file on exit), ports are opened on first use",
+        choices=midi_backends.BACKENDS
+    )
+    parser.add_argument(
+        "--backend_file",
+        type=str,
+        default='generation-x-session.mid',
+        help="Output .mid file of the file backend",
+    )
+    parser.add_argument(
+        "--elektron_port",
+        type=str,
+        default=None,
+        help=f"Elektron output port name, default: {midi_backends.PORT_NAMES['elektron_output']}",
+    )
+    parser.add_argument(
+        "--elektron_input_port",
+        type=str,
+        default=None,
+        help=f"Elektron input port name (MIDI clock slave), default: {midi_backends.PORT_NAMES['elektron_input']}",
+    )
+    parser.add_argument(
+        "--jam_output_port",
+        type=str,
+        default=None,
+        help=f"Maschine Jam output port name, default: {midi_backends.PORT_NAMES['jam_output']}",
+    )
+    parser.add_argument(
+        "--jam_input_port",
+        type=str,
+        default=None,
+        help=f"Maschine Jam input port name, default: {midi_backends.PORT_NAMES['jam_input']}",
+    )
+    parser.add_argument(
+        "--log_level",
+        type=str,
+        default='info',
+        help="Default log level of all subsystems",
+        choices=list(LEVELS.keys())
+    )
+    parser.add_argument(
+        "--log",
+        type=str,
+        action='append',
+        metavar='SUBSYSTEM=LEVEL',
+        help="Log level of one subsystem: app, seq (played steps), gen, jam, midi, metrics (timing summaries), "
+             "e.g. --log seq=warn",
+    )
+    parser.add_argument(
+        "--silent",
+        action='store_true',
+        help="Performance mode, nothing is logged",
+    )
+    parser.add_argument(
+        "--timing",
+        action='store_true',
+        help="Measure timing of every step (scheduled, dequeued and sent time) and Jam input latency, "
+             "summary is logged periodically and on exit",
+    )
+    parser.add_argument(
+        "--timing_interval",
+        type=float,
+        default=10,
+        help="Seconds between timing summaries, 0 logs the summary only on exit",
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        type=int,
+        default=None,
+        help="Master seed, the same config, scale and seed always generate the same sequences. "
+             "Seeded runs reuse earlier generated sequences from the pattern cache. "
+             "Random seed is used (and printed) when not provided",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+        help="Pattern cache directory",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action='store_true',
+        help="Do not use the pattern cache",
+    )
+
+    subparsers = parser.add_subparsers(dest='command', help='Play live (default) or run one of the commands')
+    render_parser = subparsers.add_parser(
+        'render',
+        help='Render the generated sequences faster than real time to a Standard MIDI File, no devices are used',
+    )
+    render_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default='generation-x.mid',
+        help="Output .mid file",
+    )
+    render_parser.add_argument(
+        "-d",
+        "--duration",
+        type=float,
+        default=600,
+        help="Rendered length in seconds",
+    )
+
+    generate_parser = subparsers.add_parser(
+        'generate',
+        help='Generate a large corpus of patterns of every sequence config in many tonics and scales over a '
+             'process pool, written as JSON lines',
+    )
+    generate_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default='generation-x-corpus.jsonl',
+        help="Output .jsonl file, one pattern per line",
+    )
+    generate_parser.add_argument(
+        "-n",
+        "--count",
+        type=int,
+        default=100,
+        help="Patterns of every (config, tonic, scale) combination",
+    )
+    generate_parser.add_argument(
+        "--tonics",
+        type=str,
+        nargs='+',
+        default=list(TONICS),
+        help="Tonics, all by default",
+        choices=TONICS,
+    )
+    generate_parser.add_argument(
+        "--scales",
+        type=str,
+        nargs='+',
+        default=MusicScaleType.all_values(),
+        help="Scale types, all by default",
+        choices=MusicScaleType.all_values(),
+    )
+    generate_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Worker processes, number of CPUs by default",
+    )
+    generate_parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=250,
+        help="Patterns generated and sent back by a worker at once",
+    )
+    generate_parser.add_argument(
+        "--batch",
+        action='store_true',
+        help="Generate random type configs vectorized (needs numpy: poetry install -E batch), their patterns then "
+             "depend on --chunk_size and are marked with \"batch\", arpeggio and walk configs are not affected",
+    )
 
     return parser.parse_args()
 
 
 def _log_input_output_devices():
-    onn = mido.get_output_names()
-    print(f'all available outputs: {onn}')
+    backend = midi_backends.get_backend()
+    _log.info('all available outputs: %s', backend.output_names())
+    _log.info('all available inputs: %s', backend.input_names())
 
-    inn = mido.get_input_names()
-    print(f'all available inputs: {inn}')
 
+def _config_values(input_args) -> dict:
+    return dict(tempo=input_args.tempo_bpm, rest_factor=input_args.rest_factor)
+
+
+def _sequences_config(input_args) -> List[str]:
+    if input_args.config:
+        return load_sequences_config(input_args.config, **_config_values(input_args))
 
-def _setup_and_run(input_args):
     prj_base_tempo = input_args.tempo_bpm
-    sequences_config = [
+    return [
         f'a|3|6|4|{prj_base_tempo}|3th down|c|8/16',
         f'a|3|5|6|{int(prj_base_tempo / 2)}|3th down|d|8/16',
         f'a|3|6|4|{int(prj_base_tempo / 4)}|5th up|f|12/16',
@@ -74,34 +328,143 @@ def _setup_and_run(input_args):
         f'r|1|3|{prj_base_tempo + 10}:-10.10|{input_args.rest_factor}|13/8',
     ]
 
-    prj_music_scale = MusicScale(
+
+def _music_scale(input_args) -> MusicScale:
+    return MusicScale(
         scale=MusicScaleType(input_args.music_scale_type),
         tonic=input_args.music_scale_tonic,
     )
-    prj_sequences_config_params = sequences_config_parser(sequences_config)
-    prj_generated_sequences = generate_sequences_by_config_params(prj_sequences_config_params, prj_music_scale)
+
+
+def _generate(input_args, sequences_config: List[str], music_scale: MusicScale) -> (List[dict], list):
+    seed = input_args.seed if input_args.seed is not None else random.getrandbits(32)
+    _log.info('seed=%d', seed)
+
+    cache = PatternCache(input_args.cache_dir) if input_args.seed is not None and not input_args.no_cache else None
+    sequences_config_params = sequences_config_parser(sequences_config, seed=seed)
+    return sequences_config_params, generate_sequences_by_config_params(sequences_config_params, music_scale, cache)
+
+
+def _render(input_args):
+    prj_sequences_config_params, prj_generated_sequences = _generate(
+        input_args, _sequences_config(input_args), _music_scale(input_args)
+    )
+
+    started = time.perf_counter()
+    render_to_file(
+        prj_generated_sequences,
+        path=input_args.output,
+        duration=input_args.duration,
+        base_tempo=input_args.tempo_bpm,
+        # same channels as played live
+        channels=sequence_channels(prj_sequences_config_params),
+    )
+    _log.info('rendered %ss of %d sequences to %s in %ss', input_args.duration, len(prj_generated_sequences),
+              input_args.output, round(time.perf_counter() - started, 2))
+
+
+def _generate_corpus(input_args):
+    # imported only for the command, process pool is not needed live
+    from corpus import generate_corpus
+    if input_args.batch:
+        # fails here, not in the workers, when numpy is missing
+        import batch  # noqa: F401
+
+    seed = input_args.seed if input_args.seed is not None else random.getrandbits(32)
+    _log.info('seed=%d', seed)
+    generate_corpus(
+        input_args.output,
+        _sequences_config(input_args),
+        tonics=input_args.tonics,
+        scale_types=input_args.scales,
+        count=input_args.count,
+        master_seed=seed,
+        jobs=input_args.jobs,
+        chunk_size=input_args.chunk_size,
+        batch=input_args.batch,
+    )
+
+
+def _setup_and_run(input_args):
+    _log_input_output_devices()
+    # wrong mappings fail before anything is generated
+    jam_control_map = parse_control_map(input_args.jam_control,
+                                        generate_control_map(banks=tuple(input_args.jam_bank_controls)))
+
+    prj_base_tempo = input_args.tempo_bpm
+    sequences_config = _sequences_config(input_args)
+
+    prj_music_scale = _music_scale(input_args)
+    prj_sequences_config_params, prj_generated_sequences = _generate(input_args, sequences_config, prj_music_scale)
 
     prj_run_settings = RunSettings(
         sequencers=list(),
-        sequence_play=False,
+        transport=Transport(),
         quantize_to_scale=None,
         music_scale=prj_music_scale,
         sequences_config_params=prj_sequences_config_params,
         generated_sequences=prj_generated_sequences,
     )
 
-    print(f'music scale={prj_run_settings.music_scale}')
-    print(f'root tempo={prj_base_tempo}')
-    print(f'rest factor={input_args.rest_factor}')
+    _log.info('music scale=%s', prj_run_settings.music_scale)
+    _log.info('root tempo=%d', prj_base_tempo)
+    _log.info('rest factor=%d', input_args.rest_factor)
+
+    _log.info('===================================================== MUSIC GENERATED')
+    for seq_no, (tempo_and_meter, pattern) in enumerate(prj_generated_sequences):
+        _log.info('SEQ%d %s: %d bars, %d steps', seq_no, tempo_and_meter, pattern.bars_count, len(pattern))
+        _log.debug('SEQ%d %s', seq_no, pattern.bar_names())
+    _log.info('=====================================================')
+
+    init_tracks(len(prj_sequences_config_params))
+    reset_jam(get_outport_jam(), fps=input_args.jam_fps)
+
+    reporter = None
+    if input_args.timing:
+        metrics.enable()
+        if input_args.timing_interval > 0:
+            reporter = metrics.TimingReporter(input_args.timing_interval)
+            reporter.start()
+
+    watcher = None
+    if input_args.config and input_args.config_poll > 0:
+        watcher = ConfigWatcher(
+            input_args.config,
+            lambda sequences_config: reload_sequences(prj_run_settings, sequences_config),
+            values=_config_values(input_args),
+            interval=input_args.config_poll,
+        )
+        watcher.start()
 
-    print('===================================================== MUSIC GENERATED')
-    pprint(prj_generated_sequences)
-    print('=====================================================')
+    run_sequences(get_outport_elektron(), prj_run_settings, engine=input_args.engine, clock=input_args.clock,
+                  base_tempo=prj_base_tempo, pool_size=input_args.pool_size, pool_refill=input_args.pool_refill,
+                  jam_control_map=jam_control_map)
+    midi_backends.close()
+    if watcher:
+        watcher.stop()
 
-    reset_jam(get_outport_jam())
-    run_sequences(get_outport_elektron(), prj_run_settings)
+    if reporter:
+        reporter.stop()
+    if input_args.timing:
+        metrics.log_summary()
 
 
-_log_input_output_devices()
 input_arguments = _get_input_args()
-_setup_and_run(input_arguments)
+configure(
+    level=input_arguments.log_level,
+    levels=parse_subsystem_levels(input_arguments.log),
+    silent=input_arguments.silent,
+)
+midi_backends.set_backend(midi_backends.create_backend(input_arguments.backend, input_arguments.backend_file))
+midi_backends.configure_ports(
+    elektron_output=input_arguments.elektron_port,
+    elektron_input=input_arguments.elektron_input_port,
+    jam_output=input_arguments.jam_output_port,
+    jam_input=input_arguments.jam_input_port,
+)
+if input_arguments.command == 'render':
+    _render(input_arguments)
+elif input_arguments.command == 'generate':
+    _generate_corpus(input_arguments)
+else:
+    _setup_and_run(input_arguments)
@@ -1,56 +1,73 @@
 import random
-from typing import List, Tuple
+from array import array
+from threading import Thread
+from typing import List, Optional, Tuple
 
 import mido
 
+from config import parse_sequences_config
+from config_watcher import diff_sequences_config
 from generators import NoteGeneratorFromSequence
-from machine_jam import mute, get_outport_jam, velocity, refresh_col, tracker_midi_notes, register_jam_control
+from machine_jam import mute, show_step, register_jam_control, stop_jam_control
 from models import RunSettings, TempoAndMeter, NoteLength, MusicScale
-from music_utils import generate_random_melody, generate_arpeggio_in_tempo, quantize
-from sequencer import Sequencer
+from midi_clock import ClockSlave, start_clock, set_tempo_ratio
+from midi_data import midi_note_from_no
+from midi_writer import MidiWriter
+from note_off import NoteOffScheduler
+from metrics import SequenceTiming, sequence_timing
+from music_utils import generate_random_melody, generate_arpeggio_in_tempo, generate_random_walk_melody_in_range, \
+    get_random_velocity, quantize_tables
+from pattern import PackedPattern
+from pattern_cache import PatternCache
+from regeneration import RegenerationWorker
+from scheduler import Scheduler
+from sequencer import Sequencer, SequenceControl
+from transport import Transport, TransportState
+from log import get_logger, INFO
 
+_log = get_logger('app')
+_seq_log = get_logger('seq')
+_gen_log = get_logger('gen')
 
-def _flat_generated_notes(notes_with_lengths: List[List[NoteLength]]) -> List[str]:
-    notes = []
-    for bar in range(0, len(notes_with_lengths)):
-        notes.append(','.join([nl.note.full_name if nl.note else '-' for nl in notes_with_lengths[bar]]))
-    return notes
+# regeneration worker of the running sequences
+_regeneration: Optional[RegenerationWorker] = None
 
 
-def regenerate_seq(run_settings: RunSettings, generated_sequences_no: int):
-    if not len(run_settings.sequencers) >= generated_sequences_no:
-        return
+def generate_variation(run_settings: RunSettings, generated_sequences_no: int) -> Tuple[TempoAndMeter, PackedPattern]:
+    """
+    Generates a new variation of a sequence from its config, called from the regeneration worker only.
+    """
+    return generate_sequence(run_settings.sequences_config_params[generated_sequences_no], run_settings.music_scale)
 
-    if run_settings.sequences_config_params[generated_sequences_no]['generation_type'] != "random":
-        print(f'{generated_sequences_no} is not a random, unsupported type!')
-        return
 
-    sequencer_instance = run_settings.sequencers[generated_sequences_no]
+def apply_variation(run_settings: RunSettings,
+                    generated_sequences_no: int,
+                    variation: Tuple[TempoAndMeter, PackedPattern]):
+    """
+    Queues variation to the sequencer back buffer, it is swapped in on the next bar boundary.
+    Tempo and meter of the playing sequence are kept.
+    """
+    if generated_sequences_no >= len(run_settings.sequencers) or not run_settings.sequencers[generated_sequences_no]:
+        return
 
-    curr_notes = _flat_generated_notes(run_settings.generated_sequences[generated_sequences_no][1])
+    curr_pattern = run_settings.generated_sequences[generated_sequences_no][1]
+    run_settings.generated_sequences[generated_sequences_no] = variation
+    run_settings.sequencers[generated_sequences_no].swap_at_bar(variation[1])
+    if _gen_log.enabled(INFO):
+        _gen_log.info('----------- regenerated %d: %s to %s', generated_sequences_no + 1, curr_pattern.bar_names(),
+                      variation[1].bar_names())
 
-    seq_cfg: dict = run_settings.sequences_config_params[generated_sequences_no]
-    tempo_and_meter = TempoAndMeter(
-        tempo=seq_cfg['tempo_fn'](),
-        upper_meter=seq_cfg['upper_meter'],
-        lower_meter=seq_cfg['lower_meter'],
-    )
 
-    run_settings.generated_sequences[generated_sequences_no] = \
-        (
-            tempo_and_meter,
-            generate_random_melody(
-                run_settings.music_scale,
-                octave=seq_cfg['root_octave_fn'](),
-                tempo_and_meter=tempo_and_meter,
-                pause_fn=lambda: random.randint(0, 100) < seq_cfg['pause_factor'],
-                bars=seq_cfg['bars_length_fn']()
-            )
-        )
+def regenerate_seq(run_settings: RunSettings, generated_sequences_no: int):
+    """
+    Generates a new pattern of any type and queues it to the sequencer back buffer, see apply_variation.
 
-    new_notes = _flat_generated_notes(run_settings.generated_sequences[generated_sequences_no][1])
-    sequencer_instance.set_generator_bars_notes(run_settings.generated_sequences[generated_sequences_no][1])
-    print(f'----------- regenerated {generated_sequences_no + 1}: {curr_notes} to {new_notes}')
+    :param run_settings: run settings with generated sequences and running sequencers
+    :param generated_sequences_no: sequence number
+    """
+    if generated_sequences_no >= len(run_settings.sequencers):
+        return
+    apply_variation(run_settings, generated_sequences_no, generate_variation(run_settings, generated_sequences_no))
 
 
 def test_input_midi(midi_in_name):
@@ -60,130 +77,338 @@ def test_input_midi(midi_in_name):
     try:
         mido.open_input(name=midi_in_name, callback=midi_in_callback)
     except Exception as e:
-        print(f'Could not open input to: {midi_in_name} or other error: {e}')
+        _log.error('Could not open input to: %s or other error: %s', midi_in_name, e)
         return
 
-    while True:
-        pass
+    transport = Transport()
+    transport.install_signal_handlers()
+    transport.wait_shutdown()
+
+
+def generate_sequence(seq_cfg: dict, music_scale: MusicScale) -> Tuple[TempoAndMeter, PackedPattern]:
+    """
+    Generates one sequence from its parsed config, see config.sequences_config_parser.
+
+    :param seq_cfg: parsed sequence config
+    :param music_scale: tonic and scale
+    :return: tempo and meter, generated pattern
+    """
+    rng = seq_cfg.get('rng', random)
+    velocity_fn = lambda n, t: get_random_velocity(n, t, rng=rng)
+    tempo_and_meter = TempoAndMeter(
+        tempo=seq_cfg['tempo_fn'](),
+        upper_meter=seq_cfg['upper_meter'],
+        lower_meter=seq_cfg['lower_meter'],
+    )
+
+    if seq_cfg.get('generation_type') == 'arpeggio':
+        pattern = generate_arpeggio_in_tempo(
+            root_note=seq_cfg['start_note'],
+            music_scale=music_scale,
+            tempo_and_meter=tempo_and_meter,
+            bars=seq_cfg['bars_length_fn'](),
+            mode=seq_cfg['mode'],
+            total_notes=seq_cfg['total_notes_fn'](),
+            root_octave=seq_cfg['root_octave_fn'](),
+        )
+    elif seq_cfg.get('generation_type') == 'random':
+        pattern = generate_random_melody(
+            music_scale,
+            octave=seq_cfg['root_octave_fn'](),
+            tempo_and_meter=tempo_and_meter,
+            pause_fn=lambda: rng.randint(0, 100) < seq_cfg['pause_factor'],
+            bars=seq_cfg['bars_length_fn'](),
+            velocity_fn=velocity_fn,
+            rng=rng,
+        )
+    elif seq_cfg.get('generation_type') == 'walk':
+        pattern = generate_random_walk_melody_in_range(
+            music_scale,
+            octave=seq_cfg['root_octave_fn'](),
+            bars=seq_cfg['bars_length_fn'](),
+            min_pitch=seq_cfg['min_pitch'],
+            max_pitch=seq_cfg['max_pitch'],
+            tempo_and_meter=tempo_and_meter,
+            steps_deviation=seq_cfg['steps_deviation'],
+            velocity_fn=velocity_fn,
+            rng=rng,
+        )
+    else:
+        raise ValueError(f'Unsupported generation type: {seq_cfg.get("generation_type")}')
+
+    pattern.set_gate(seq_cfg.get('gate', 100))
+    return tempo_and_meter, pattern
 
 
 def generate_sequences_by_config_params(
         config_params: List[dict],
-        music_scale: MusicScale
-) -> List[Tuple[TempoAndMeter, List[List[NoteLength]]]]:
+        music_scale: MusicScale,
+        cache: Optional[PatternCache] = None,
+) -> List[Tuple[TempoAndMeter, PackedPattern]]:
+    """
+    Generates all sequences, seeded sequences are reused from the cache when available.
+
+    :param config_params: parsed sequences config
+    :param music_scale: tonic and scale
+    :param cache: pattern cache, None disables caching
+    :return: (tempo and meter, pattern) per sequence
+    """
     sequences = list()
     for seq_cfg in config_params:
-        if seq_cfg.get('generation_type') == 'arpeggio':
-            tempo = seq_cfg['tempo_fn']()
-            arp_tempo = TempoAndMeter(
-                tempo=tempo,
-                upper_meter=seq_cfg['upper_meter'],
-                lower_meter=seq_cfg['lower_meter'],
-            )
-            sequences.append(
-                (
-                    arp_tempo,
-                    generate_arpeggio_in_tempo(
-                        root_note=seq_cfg['start_note'],
-                        music_scale=music_scale,
-                        tempo_and_meter=arp_tempo,
-                        bars=seq_cfg['bars_length_fn'](),
-                        mode=seq_cfg['mode'],
-                        total_notes=seq_cfg['total_notes_fn'](),
-                        root_octave=seq_cfg['root_octave_fn'](),
-                    )
-                )
-            )
-        if seq_cfg.get('generation_type') == 'random':
-            tempo = seq_cfg['tempo_fn']()
-            ran_tempo = TempoAndMeter(
-                tempo=tempo,
-                upper_meter=seq_cfg['upper_meter'],
-                lower_meter=seq_cfg['lower_meter'],
-            )
-            sequences.append(
-                (ran_tempo,
-                 generate_random_melody(
-                     music_scale,
-                     octave=seq_cfg['root_octave_fn'](),
-                     tempo_and_meter=ran_tempo,
-                     pause_fn=lambda: random.randint(0, 100) < seq_cfg['pause_factor'],
-                     bars=seq_cfg['bars_length_fn']()
-                 )
-                 )
-            )
+        key = None
+        if cache and seq_cfg.get('seed') is not None:
+            key = cache.key(seq_cfg['config'], music_scale, seq_cfg['seed'])
+            cached = cache.get(key)
+            if cached:
+                tempo_and_meter, pattern, rng_state = cached
+                seq_cfg['rng'].setstate(rng_state)
+                sequences.append((tempo_and_meter, pattern))
+                continue
+
+        tempo_and_meter, pattern = generate_sequence(seq_cfg, music_scale)
+        if key:
+            cache.put(key, tempo_and_meter, pattern, seq_cfg['rng'].getstate())
+        sequences.append((tempo_and_meter, pattern))
+
     return sequences
 
 
-def play_note_from_sequence_to_midi_msg(seq_no: int, note: NoteLength, outport, run_settings: RunSettings):
+def reload_sequences(run_settings: RunSettings, sequences_config: List[str]) -> List[int]:
+    """
+    Regenerates only the sequences which config changed, each is swapped in on its next bar boundary,
+    the others keep playing untouched. Every sequence keeps its seed.
+
+    :param run_settings: run settings with generated sequences and running sequencers
+    :param sequences_config: new sequence configs
+    :return: regenerated sequence numbers
+    """
+    changed, added, removed = diff_sequences_config(run_settings.sequences_config_params, sequences_config)
+    if added or removed:
+        _gen_log.warn('sequences added %s / removed %s, number of sequences changes only on restart', added, removed)
+
+    regenerated = []
+    for seq_no in changed:
+        old_cfg = run_settings.sequences_config_params[seq_no]
+        try:
+            seq_cfg = parse_sequences_config(sequences_config[seq_no], random.Random(old_cfg.get('seed')))
+            seq_cfg['seed'] = old_cfg.get('seed')
+            tempo_and_meter, pattern = generate_sequence(seq_cfg, run_settings.music_scale)
+        except Exception as e:
+            _gen_log.error('SEQ%d config %s not applied: %s', seq_no, sequences_config[seq_no], e)
+            continue
+
+        run_settings.sequences_config_params[seq_no] = seq_cfg
+        if _regeneration:
+            _regeneration.invalidate(seq_no)
+        run_settings.generated_sequences[seq_no] = (tempo_and_meter, pattern)
+        if seq_no < len(run_settings.sequencers) and run_settings.sequencers[seq_no]:
+            run_settings.sequencers[seq_no].swap_at_bar(pattern, tempo_and_meter.model_copy())
+        regenerated.append(seq_no)
+        _gen_log.info('----------- reloaded SEQ%d %s %s: %s', seq_no, seq_cfg['config'], tempo_and_meter,
+                      pattern.bar_names())
+    return regenerated
+
+
+def play_note_from_sequence_to_midi_msg(
+        seq_no: int,
+        note: NoteLength,
+        outport,
+        run_settings: RunSettings,
+        note_offs: Optional[NoteOffScheduler] = None,
+        timing: Optional[SequenceTiming] = None,
+        channel: Optional[int] = None,
+):
     i_play = note
+    channel = seq_no if channel is None else channel
 
-    pp = f"{seq_no * 10 * ' '}"
     if i_play and i_play.note:
         note = i_play.note
 
-        if run_settings.quantize_to_scale:
-            p_note = quantize(note, run_settings.quantize_to_scale)
+        q_table = run_settings.quantize_table
+        if q_table:
+            p_note = midi_note_from_no(q_table[note.midi_no]) or note
         else:
             p_note = note
 
-        q_info = f"{note.name} quantized to {p_note.name}" if run_settings.quantize_to_scale else ""
-
         if outport and mute[seq_no]:
             msg = mido.Message(
                 'note_on',
-                channel=seq_no,
+                channel=channel,
                 note=p_note.midi_no,
                 time=i_play.note_length,
-                velocity=p_note.velocity,
+                velocity=i_play.velocity,
             )
-            outport.send(msg)
-            print(f"\n{pp}S{seq_no}: {msg} {q_info}")
+            if note_offs:
+                note_offs.note_on(
+                    channel, p_note.midi_no, i_play.velocity, i_play.note_length, i_play.gate,
+                    trace=(timing, timing.scheduled) if timing else None, track=seq_no,
+                )
+            else:
+                outport.send(msg)
+            if q_table:
+                _seq_log.info('\n%*sS%d: %s %s quantized to %s', seq_no * 10, '', seq_no, msg, note.name, p_note.name)
+            else:
+                _seq_log.info('\n%*sS%d: %s', seq_no * 10, '', seq_no, msg)
         else:
-            print(
-                f"\n{pp}S{seq_no}: {p_note.full_name} {i_play.note_length} "
-                f"{' muted' if not mute[seq_no] else ''} {q_info}")
+            _seq_log.info(
+                '\n%*sS%d: %s %s %s', seq_no * 10, '', seq_no, p_note.full_name, i_play.note_length,
+                ' muted' if not mute[seq_no] else '',
+            )
     else:
-        print(f"\n{pp}S{seq_no}: -")
+        _seq_log.info('\n%*sS%d: -', seq_no * 10, '', seq_no)
+
+    # only marks the pixel, display thread sends the changes
+    show_step(seq_no, i_play.velocity if i_play and i_play.note else 0)
+
 
-    outport_jam = get_outport_jam()
-    if outport_jam:
-        velocity[seq_no].insert(0, i_play.note.velocity if i_play.note else 0)
-        velocity[seq_no].pop(-1)
-        refresh_col(outport_jam, tracker_midi_notes[seq_no], velocity[seq_no])
+def sequence_channels(config_params: List[dict]) -> array:
+    """
+    MIDI channel (0-15) of every sequence, the ch= config part or the sequence number wrapped after 16.
+    """
+    return array('B', (seq_cfg.get('channel', seq_no % 16) for seq_no, seq_cfg in enumerate(config_params)))
 
 
-def run_sequences(outport, run_settings: RunSettings):
-    play_fn = lambda: run_settings.sequence_play
+def run_sequences(outport, run_settings: RunSettings, engine: str = 'threads', clock: str = 'off',
+                  base_tempo: float = 120, pool_size: int = 4, pool_refill: float = 4.0,
+                  jam_control_map: Optional[dict] = None):
+    """
+    Starts all generated sequences.
+
+    :param outport: MIDI output port
+    :param run_settings: run settings with generated sequences
+    :param engine: 'threads' runs every sequence in its own thread,
+                   'scheduler' fires all sequences from one timing thread with absolute deadlines,
+                   'asyncio' runs all sequences as coroutines on one event loop
+    :param clock: MIDI clock 'off', 'master' sends clock to the Elektron port, 'slave' follows the Elektron clock
+    :param base_tempo: tempo from which the sequence tempos were generated, tempo of the master clock
+    :param pool_size: pre-generated variations kept per sequence for the dice, 0 generates on every press
+    :param pool_refill: max pre-generated variations per second
+    :param jam_control_map: Jam control -> action mapping, machine_jam.DEFAULT_CONTROL_MAP when None
+    """
+    transport = run_settings.transport
+    # key changes only swap precomputed tables
+    quantize_tables()
+    # one writer owns the port, sequencers only queue their messages
+    writer = MidiWriter(outport, desc='MidiWriter Elektron') if outport else None
+    note_offs = NoteOffScheduler(writer) if writer else None
+    if note_offs:
+        # no hanging notes after stop
+        transport.add_listener(lambda state: note_offs.notes_off() if state == TransportState.STOPPED else None)
+
+    scheduler = Scheduler(transport=transport) if engine == 'scheduler' else None
+    async_transport = None
+    if engine == 'asyncio':
+        # asyncio is slow to import, only loaded when used
+        from async_engine import AsyncTransport, AsyncSequencer
+        async_transport = AsyncTransport(transport=transport)
+
+    # MIDI channel of every track
+    channels = sequence_channels(run_settings.sequences_config_params)
 
     for idx in range(0, len(run_settings.sequences_config_params)):
         tempo_and_meter = run_settings.generated_sequences[idx][0]
         generator = NoteGeneratorFromSequence(bars=run_settings.generated_sequences[idx][1])
-        run_settings.sequencers.append(
-            Sequencer(
-                generator=generator,
-                play_target=lambda note, _id=idx: play_note_from_sequence_to_midi_msg(
-                    seq_no=_id,
-                    note=note,
-                    outport=outport,
-                    run_settings=run_settings
-                ),
-                play_fn=play_fn,
-                tempo_and_meter=tempo_and_meter,
-                desc=f'SEQ{idx} [{generator.bars_length}]',
-            )
+        desc = f'SEQ{idx} [{generator.bars_length}]'
+        timing = sequence_timing(idx, desc, tempo_and_meter.upper_meter)
+        play_target = lambda note, _id=idx, _timing=timing: play_note_from_sequence_to_midi_msg(
+            seq_no=_id,
+            note=note,
+            outport=writer,
+            run_settings=run_settings,
+            note_offs=note_offs,
+            timing=_timing,
+            channel=channels[_id],
         )
 
-    print('=====================================================')
+        if async_transport:
+            run_settings.sequencers.append(
+                async_transport.add(
+                    AsyncSequencer(
+                        generator=generator,
+                        play_target=play_target,
+                        tempo_and_meter=tempo_and_meter,
+                        desc=desc,
+                        timing=timing,
+                    )
+                )
+            )
+        elif scheduler:
+            run_settings.sequencers.append(
+                scheduler.add(
+                    SequenceControl(
+                        generator=generator,
+                        play_target=play_target,
+                        tempo_and_meter=tempo_and_meter,
+                        desc=desc,
+                        timing=timing,
+                    )
+                )
+            )
+        else:
+            run_settings.sequencers.append(
+                Sequencer(
+                    generator=generator,
+                    play_target=play_target,
+                    transport=transport,
+                    tempo_and_meter=tempo_and_meter,
+                    desc=desc,
+                    timing=timing,
+                )
+            )
+
+    if scheduler:
+        scheduler.start()
+
+    midi_clock = start_clock(clock, writer, transport, run_settings.sequencers, base_tempo)
+
+    # dice presses pop a pooled variation or queue the sequence number, patterns are built off the input thread
+    global _regeneration
+    regeneration = RegenerationWorker(
+        generate=lambda seq_no: generate_variation(run_settings, seq_no),
+        apply=lambda seq_no, variation: apply_variation(run_settings, seq_no, variation),
+        sequences=len(run_settings.sequences_config_params),
+        pool_size=pool_size,
+        refill_rate=pool_refill,
+    )
+    regeneration.start()
+    _regeneration = regeneration
+
+    _log.info('=====================================================')
     jam_register_result = register_jam_control(
         run_settings,
         functions={
-            'regenerate_seq': lambda seq_no: regenerate_seq(run_settings, seq_no),
-        }
+            'regenerate_seq': regeneration.request,
+            # tracks may share a channel, a muted track releases only its own notes
+            'notes_off': lambda seq_no: note_offs.track_off(seq_no) if note_offs else None,
+            # tempo is a ratio to the shared clock, sequences keep their own ratio to it
+            'set_tempo_ratio': lambda ratio, beats: set_tempo_ratio(midi_clock, run_settings.sequencers, base_tempo,
+                                                                    ratio, beats),
+        },
+        dispatch=async_transport.call_soon_threadsafe if async_transport else None,
+        control_map=jam_control_map,
     )
-    if not jam_register_result:
-        # no JAM, we start automatically
-        run_settings.sequence_play = True
+    if not jam_register_result and not isinstance(midi_clock, ClockSlave):
+        # no JAM, we start automatically, slave waits for the clock start
+        transport.play()
+
+    transport.install_signal_handlers()
+    if async_transport:
+        async_transport.run_until_shutdown()
+    else:
+        transport.wait_shutdown()
 
-    while True:
-        pass
+    stop_jam_control()
+    regeneration.stop()
+    _regeneration = None
+    _gen_log.info('variation pool: %s', regeneration.stats())
+    for sequencer in run_settings.sequencers:
+        if isinstance(sequencer, Thread):
+            sequencer.join(timeout=1.0)
+    if scheduler:
+        scheduler.join(timeout=1.0)
+    if note_offs:
+        note_offs.notes_off()
+        note_offs.close()
+    if writer:
+        writer.close()
+        _log.info('%s: %s', writer.name, writer.stats())
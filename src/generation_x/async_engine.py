@@ -0,0 +1,155 @@
+import asyncio
+from typing import List, Optional
+
+from models import TempoAndMeter
+from generators import NoteGenerator
+from metrics import SequenceTiming
+from sequencer import SequenceControl
+from transport import Transport
+from log import get_logger
+
+_log = get_logger('seq')
+
+
+class AsyncSequencer(SequenceControl):
+
+    def __init__(self,
+                 generator: NoteGenerator,
+                 play_target,
+                 tempo_and_meter: TempoAndMeter,
+                 desc='AsyncSequencer',
+                 timing: Optional[SequenceTiming] = None):
+        """
+        Sequencer running as a coroutine on the AsyncTransport event loop, every note is scheduled with
+        loop.call_at against the loop clock.
+
+        :param generator: note generator, returns next note on every sequence cycle
+        :param play_target: function responsible for playing note from generator
+        :param tempo_and_meter: tempo and meter
+        :param desc: description
+        :param timing: records scheduled / dequeued times of the steps, None disables instrumentation
+        """
+        super().__init__(generator, play_target, tempo_and_meter, desc, timing)
+        self._pending: Optional[asyncio.TimerHandle] = None
+        self._fired: Optional[asyncio.Future] = None
+
+    def _fire(self, fired: asyncio.Future, deadline: float):
+        if not fired.done():
+            fired.set_result(self.step(deadline))
+
+    def interrupt(self):
+        """
+        Cancels the pending step, must be called from the event loop.
+        """
+        if self._pending:
+            self._pending.cancel()
+        if self._fired and not self._fired.done():
+            self._fired.set_result(None)
+
+    async def run(self, transport: 'AsyncTransport'):
+        loop = asyncio.get_running_loop()
+        _log.info('%s %s: %s', self.desc, self.tempo_and_meter, self.tempo_and_meter.to_bar_and_note_length())
+        rewinds = transport.rewinds
+        while True:
+            epoch, deadline = await transport.wait_for_play()
+            if transport.rewinds != rewinds:
+                rewinds = transport.rewinds
+                self.reset()
+            self.started()
+
+            while transport.is_playing and transport.epoch == epoch:
+                self._fired = loop.create_future()
+                self._pending = loop.call_at(deadline, self._fire, self._fired, deadline)
+                step_length = await self._fired
+                if step_length is None:
+                    break
+
+                deadline = deadline + step_length
+                if deadline + step_length < loop.time():
+                    # fell behind more than a whole step, re-anchor instead of bursting
+                    deadline = loop.time()
+
+
+class AsyncTransport:
+
+    def __init__(self, transport: Transport, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Runs all AsyncSequencers as coroutines on one event loop.
+
+        Transport state changes are bridged into the loop, every play start anchors all sequencers to the same loop
+        time, so they stay phase locked.
+
+        :param transport: play / pause / stop state
+        :param loop: event loop, new one is created when not provided
+        """
+        self._transport = transport
+        self._loop = loop if loop else asyncio.new_event_loop()
+        self._playing = asyncio.Event()
+        self._shutdown = asyncio.Event()
+        self._sequencers: List[AsyncSequencer] = []
+        self._running = False
+        self.epoch = 0
+        self.rewinds = transport.rewinds
+        self.started_at = None
+
+        self._transport.add_listener(lambda state: self._loop.call_soon_threadsafe(self._on_transport_state))
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    @property
+    def is_playing(self) -> bool:
+        return self._playing.is_set()
+
+    def add(self, sequencer: AsyncSequencer) -> AsyncSequencer:
+        self._sequencers.append(sequencer)
+        if self._running:
+            self._loop.call_soon_threadsafe(self._loop.create_task, sequencer.run(self))
+        return sequencer
+
+    def call_soon_threadsafe(self, callback, *args):
+        """
+        Bridges a call from any other thread (e.g. MIDI input callback) into the event loop.
+        """
+        return self._loop.call_soon_threadsafe(callback, *args)
+
+    async def wait_for_play(self) -> (int, float):
+        """
+        Waits until playback is started.
+
+        :return: (epoch, loop time at which playback started)
+        """
+        await self._playing.wait()
+        return self.epoch, self.started_at
+
+    def _on_transport_state(self):
+        if self._transport.is_shutdown:
+            self._shutdown.set()
+
+        playing = self._transport.is_playing
+        if playing and (not self._playing.is_set() or self.epoch != self._transport.epoch):
+            if self._playing.is_set():
+                # restarted in between, pending steps belong to the previous epoch
+                for sequencer in self._sequencers:
+                    sequencer.interrupt()
+            self.epoch = self._transport.epoch
+            self.rewinds = self._transport.rewinds
+            self.started_at = self._loop.time()
+            self._playing.set()
+        elif not playing and self._playing.is_set():
+            self._playing.clear()
+            for sequencer in self._sequencers:
+                sequencer.interrupt()
+
+    async def _main(self):
+        self._running = True
+        self._on_transport_state()
+        tasks = [asyncio.create_task(sequencer.run(self)) for sequencer in self._sequencers]
+        await self._shutdown.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def run_until_shutdown(self):
+        self._loop.run_until_complete(self._main())
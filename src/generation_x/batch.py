@@ -0,0 +1,258 @@
+from array import array
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError('batch generation requires numpy, install it with: poetry install -E batch') from e
+
+from models import TempoAndMeter, MusicScale
+from midi_data import midi_no_from_name_and_octave
+from music_utils import get_scale, scale_pitches, scale_position
+from pattern import PackedPattern
+
+
+@lru_cache(maxsize=None)
+def accent_vector(upper_meter: int, accent_value: int = 30) -> np.ndarray:
+    """
+    Returns accent value for every note in bar, same rule as music_utils.get_accent (every second note is strong).
+
+    :param upper_meter: notes in bar
+    :param accent_value: accent added to strong notes
+    :return: read-only int16 array of size upper_meter
+    """
+    accents = np.zeros(upper_meter, dtype=np.int16)
+    accents[0::2] = accent_value
+    accents.setflags(write=False)
+    return accents
+
+
+def pause_probability(pause_factor: int) -> float:
+    """
+    Probability of a rest for the live pause function: random.randint(0, 100) < pause_factor.
+    """
+    return min(max(pause_factor, 0), 101) / 101
+
+
+def scale_midi_numbers(music_scale: MusicScale, octave: int) -> np.ndarray:
+    """
+    Midi numbers of the scale notes (index as in get_scale) starting in octave, with the octave change applied.
+    """
+    _, scale_notes, octave_change_at = get_scale(music_scale)
+    midi_numbers = []
+    for idx, note in enumerate(scale_notes):
+        midi_no = midi_no_from_name_and_octave(note, octave + (1 if idx >= octave_change_at else 0))
+        if midi_no is None:
+            raise ValueError(f'{note} in octave {octave} is out of midi range!')
+        midi_numbers.append(midi_no)
+    return np.array(midi_numbers, dtype=np.uint8)
+
+
+class MelodyBatch:
+    """
+    Batch of random melodies, every array has shape (candidates, bars, upper meter).
+    """
+
+    __slots__ = ('pitch_idx', 'rest', 'octave_offset', 'velocity', 'midi_no', 'note_length')
+
+    def __init__(self, pitch_idx, rest, octave_offset, velocity, midi_no, note_length: float):
+        self.pitch_idx = pitch_idx
+        self.rest = rest
+        self.octave_offset = octave_offset
+        self.velocity = velocity
+        self.midi_no = midi_no
+        self.note_length = note_length
+
+    def __len__(self):
+        return self.midi_no.shape[0]
+
+    def to_pattern(self, candidate: int = 0) -> PackedPattern:
+        """
+        Packs one candidate into PackedPattern, columns are copied as raw bytes.
+        """
+        bars, upper_meter = self.midi_no.shape[1:]
+        steps = bars * upper_meter
+
+        pattern = PackedPattern()
+        pattern.midi_no.frombytes(self.midi_no[candidate].astype(np.uint8).tobytes())
+        pattern.velocity.frombytes(self.velocity[candidate].astype(np.uint8).tobytes())
+        pattern.rest.frombytes(self.rest[candidate].astype(np.uint8).tobytes())
+        pattern.length.frombytes(np.full(steps, self.note_length, dtype=np.float64).tobytes())
+        pattern.gate.frombytes(np.where(self.rest[candidate], 0, 100).astype(np.uint8).tobytes())
+        pattern.bar_offsets = array('I', range(0, steps + 1, upper_meter))
+        return pattern
+
+
+def generate_random_melody_batch(
+        music_scale: MusicScale,
+        rng: np.random.Generator,
+        octave=4,
+        bars=1,
+        tempo_and_meter: TempoAndMeter = TempoAndMeter(),
+        rest_probability=0.5,
+        candidates=1,
+        velocity: int = 64,
+        min_deviation: int = 0,
+        max_deviation: int = 10,
+        accent_value: int = 30,
+) -> MelodyBatch:
+    """
+    Vectorized music_utils.generate_random_melody, generates all candidates in one pass with the same distributions:
+    uniform scale note index, rest with rest_probability, velocity + uniform deviation + accent clipped to 127.
+
+    :param music_scale: tonic and scale
+    :param rng: seeded numpy random generator
+    :param octave: octave no
+    :param bars: melody length in bars
+    :param tempo_and_meter: melody tempo and meter (used to calculate note length)
+    :param rest_probability: probability of a rest, see pause_probability for the live pause factor
+    :param candidates: amount of melodies
+    :param velocity: base velocity
+    :param min_deviation: min random velocity deviation
+    :param max_deviation: max random velocity deviation
+    :param accent_value: accent added to strong notes
+    :return: batch of melodies
+    """
+    scale_midi = scale_midi_numbers(music_scale, octave)
+    _, _, octave_change_at = get_scale(music_scale)
+    shape = (candidates, bars, tempo_and_meter.upper_meter)
+
+    rest = rng.random(shape) < rest_probability
+    pitch_idx = rng.integers(0, len(scale_midi), shape, dtype=np.uint8)
+    octave_offset = (pitch_idx >= octave_change_at).astype(np.uint8)
+
+    velocities = rng.integers(min_deviation, max_deviation + 1, shape, dtype=np.int16)
+    velocities += np.int16(velocity)
+    velocities += accent_vector(tempo_and_meter.upper_meter, accent_value)
+    np.minimum(velocities, 127, out=velocities)
+    velocities[rest] = 0
+
+    midi_no = scale_midi[pitch_idx]
+    midi_no[rest] = 0
+
+    return MelodyBatch(
+        pitch_idx=pitch_idx,
+        rest=rest,
+        octave_offset=octave_offset,
+        velocity=velocities.astype(np.uint8),
+        midi_no=midi_no,
+        note_length=tempo_and_meter.to_bar_and_note_length().note_length,
+    )
+
+
+# from this many candidates clipped walks are stepped column by column, fewer use the prefix scan
+CLIP_COLUMNS_MIN_CANDIDATES = 64
+
+
+def _clip_walk(starts: np.ndarray, steps: np.ndarray, min_idx: int, max_idx: int) -> np.ndarray:
+    """
+    Clipped cumulative sum without a Python call per element.
+
+    Many candidates: one vectorized clip per step over all candidates (the Python loop runs over steps only).
+
+    Few candidates: every step is a map p -> clip(p + shift, low, high) and a composition of two such maps is
+    again one, first (a1, l1, h1) then (a2, l2, h2) is (a1 + a2, clip(l1 + a2, l2, h2), clip(h1 + a2, l2, h2)).
+    The maps of all prefixes are composed with log2(steps) vectorized doubling passes (Hillis-Steele scan) and the
+    positions are the prefix maps applied to the start.
+    """
+    candidates, count = steps.shape
+    if candidates >= CLIP_COLUMNS_MIN_CANDIDATES:
+        positions = np.empty((candidates, count + 1), dtype=np.int64)
+        positions[:, 0] = starts[:, 0]
+        for step in range(0, count):
+            np.add(positions[:, step], steps[:, step], out=positions[:, step + 1])
+            np.clip(positions[:, step + 1], min_idx, max_idx, out=positions[:, step + 1])
+        return positions
+
+    shift = steps.astype(np.int64)
+    low = np.full_like(shift, min_idx)
+    high = np.full_like(shift, max_idx)
+    distance = 1
+    while distance < count:
+        # compose the map of the prefix ending distance steps earlier with the current one
+        cur_shift, cur_low, cur_high = shift[:, distance:], low[:, distance:], high[:, distance:]
+        composed_low = np.minimum(np.maximum(low[:, :-distance] + cur_shift, cur_low), cur_high)
+        composed_high = np.minimum(np.maximum(high[:, :-distance] + cur_shift, cur_low), cur_high)
+        composed_shift = shift[:, :-distance] + cur_shift
+        shift[:, distance:] = composed_shift
+        low[:, distance:] = composed_low
+        high[:, distance:] = composed_high
+        distance = distance * 2
+    return np.concatenate([starts, np.minimum(np.maximum(starts + shift, low), high)], axis=1)
+
+
+def walk_positions_batch(
+        steps: np.ndarray,
+        start: int,
+        min_idx: int = None,
+        max_idx: int = None,
+        boundary='clip',
+) -> np.ndarray:
+    """
+    Vectorized music_utils.walk_positions for every row of steps.
+
+    Reflection is computed in closed form by folding the cumulative sum into the range. Clipping depends on the whole
+    path, it is stepped column by column over all candidates or composed as a prefix scan, see _clip_walk.
+
+    :param steps: int array of shape (candidates, steps)
+    :param start: initial position
+    :param min_idx: lower bound, None for unbounded
+    :param max_idx: upper bound, None for unbounded
+    :param boundary: 'clip' stops at the bound, 'reflect' bounces back from it
+    :return: int array of shape (candidates, steps + 1)
+    """
+    starts = np.full((steps.shape[0], 1), start, dtype=np.int64)
+    if min_idx is None or max_idx is None:
+        return np.cumsum(np.concatenate([starts, steps], axis=1), axis=1)
+
+    if boundary == 'reflect':
+        width = max_idx - min_idx
+        positions = np.cumsum(np.concatenate([starts, steps], axis=1), axis=1)
+        if width <= 0:
+            return np.full_like(positions, min_idx)
+        folded = np.mod(positions - min_idx, 2 * width)
+        return min_idx + np.where(folded <= width, folded, 2 * width - folded)
+
+    if boundary == 'clip':
+        return _clip_walk(starts, steps, min_idx, max_idx)
+
+    raise ValueError(f'Unsupported boundary: {boundary}')
+
+
+def generate_random_walk_batch(
+        music_scale: MusicScale,
+        rng: np.random.Generator,
+        octave=4,
+        bars=1,
+        tempo_and_meter: TempoAndMeter = TempoAndMeter(),
+        min_pitch=-8,
+        max_pitch=8,
+        steps_deviation=3,
+        boundary='clip',
+        candidates=1,
+) -> np.ndarray:
+    """
+    Vectorized music_utils.generate_random_walk_melody_in_range for long melodies or many candidates,
+    step with function: integers(-1, 1) * steps_deviation.
+
+    :param music_scale: Music scale
+    :param rng: seeded numpy random generator
+    :param octave: initial octave
+    :param bars: amount of bars
+    :param tempo_and_meter: tempo and meter
+    :param min_pitch: min pitch from music scale tonic
+    :param max_pitch: max pitch from music scale tonic
+    :param steps_deviation: deviation for random steps
+    :param boundary: 'clip' stops at the range bounds, 'reflect' bounces back from them
+    :param candidates: amount of melodies
+    :return: uint8 midi numbers of shape (candidates, bars * upper meter)
+    """
+    pitches = np.array(scale_pitches(music_scale), dtype=np.uint8)
+    start_idx = scale_position(music_scale, music_scale.tonic, octave)
+    min_pitch_idx = max(start_idx + min_pitch, 0)
+    max_pitch_idx = min(start_idx + max_pitch, len(pitches) - 1)
+
+    total_steps = bars * tempo_and_meter.upper_meter
+    steps = rng.integers(-1, 2, (candidates, total_steps - 1)) * steps_deviation
+
+    return pitches[walk_positions_batch(steps, start_idx, min_pitch_idx, max_pitch_idx, boundary)]
@@ -0,0 +1,599 @@
+import json
+import platform
+import random
+import os
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from argparse import ArgumentParser, Namespace
+from threading import Thread
+from typing import Callable, Dict, List, Optional
+
+import mido
+
+import machine_jam
+from app import play_note_from_sequence_to_midi_msg, sequence_channels
+from generators import NoteGeneratorFromSequence
+from jam_display import JamFramebuffer
+from log import configure
+from metrics import SequenceTiming
+from midi_data import midi_note_from_name_and_octave
+from midi_writer import MidiWriter
+from models import MusicScale, MusicScaleType, TempoAndMeter, NoteLength, RunSettings
+from music_utils import get_scale, quantize, quantize_table, generate_random_melody, generate_arpeggio_in_tempo, \
+    generate_random_walk_melody, generate_random_walk_melody_in_range, generate_random_walk_melody_in_range_and_mean, \
+    walk_positions
+from note_off import NoteOffScheduler
+from scheduler import Scheduler
+from sequencer import Sequencer, SequenceControl
+from transport import Transport
+
+BENCH_SCALE = MusicScale(tonic='c', scale=MusicScaleType.NATURAL_MINOR)
+BENCH_TEMPO = TempoAndMeter(tempo=120, upper_meter=4, lower_meter=16)
+
+# name -> factory returning the measured operation, setup is done in the factory
+MICRO_BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {}
+# name -> function(duration) running a headless playback and returning its metrics
+PLAYBACK_BENCHMARKS: Dict[str, Callable[[float], dict]] = {}
+
+# modules imported on the way to the first played note
+STARTUP_MODULES = ('app', 'config', 'pattern_cache', 'render', 'machine_jam', 'elektron_cycles', 'midi_backends')
+STARTUP_SCRIPT = '''
+import time
+started = time.perf_counter()
+import {modules}
+import midi_backends
+print(time.perf_counter() - started, len(midi_backends._outputs))
+'''
+
+# lateness and drift of the playback track benchmarks, compared with the 6 track run of the same engine
+TRACK_SCALING_METRICS = ('dequeued_p99_ms', 'dequeued_max_ms', 'sent_p99_ms', 'sent_max_ms', 'drift_per_bar_max_ms')
+
+# lower is better for these metrics, higher for all others
+LOWER_IS_BETTER = ('p50_ms', 'p99_ms', 'max_ms', 'peak_kib', 'retained_kib', 'seconds', 'cpu_percent')
+
+
+def micro_benchmark(name: str):
+    def register(factory):
+        MICRO_BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+def playback_benchmark(name: str):
+    def register(fn):
+        PLAYBACK_BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+class NullOutport:
+
+    def __init__(self):
+        """
+        Headless output port, counts sent messages.
+        """
+        self.sent = 0
+
+    def send(self, msg: mido.Message):
+        self.sent = self.sent + 1
+
+
+@micro_benchmark('get_scale')
+def _get_scale():
+    return lambda: get_scale(BENCH_SCALE)
+
+
+@micro_benchmark('quantize')
+def _quantize():
+    note = midi_note_from_name_and_octave('c#', 4)
+    other_scale = MusicScale(tonic='d', scale=MusicScaleType.MAJOR)
+    return lambda: quantize(note, other_scale)
+
+
+@micro_benchmark('quantize_table_lookup')
+def _quantize_table_lookup():
+    table = quantize_table(MusicScale(tonic='d', scale=MusicScaleType.MAJOR))
+    return lambda: table[61]
+
+
+@micro_benchmark('midi_note_from_name_and_octave')
+def _midi_note_from_name_and_octave():
+    return lambda: midi_note_from_name_and_octave('f#', 3)
+
+
+@micro_benchmark('generate_random_melody')
+def _generate_random_melody():
+    rng = random.Random(1)
+    return lambda: generate_random_melody(
+        BENCH_SCALE, octave=4, bars=4, tempo_and_meter=BENCH_TEMPO,
+        pause_fn=lambda: rng.randint(0, 100) < 30, rng=rng,
+    )
+
+
+@micro_benchmark('generate_arpeggio_in_tempo')
+def _generate_arpeggio_in_tempo():
+    return lambda: generate_arpeggio_in_tempo(
+        'c', BENCH_SCALE, tempo_and_meter=BENCH_TEMPO, bars=4, mode='3th down', total_notes=6, root_octave=4,
+    )
+
+
+@micro_benchmark('generate_random_walk_melody')
+def _generate_random_walk_melody():
+    rng = random.Random(1)
+    return lambda: generate_random_walk_melody(BENCH_SCALE, bars=4, tempo_and_meter=BENCH_TEMPO, rng=rng)
+
+
+@micro_benchmark('generate_random_walk_melody_in_range')
+def _generate_random_walk_melody_in_range():
+    rng = random.Random(1)
+    return lambda: generate_random_walk_melody_in_range(BENCH_SCALE, bars=4, tempo_and_meter=BENCH_TEMPO, rng=rng)
+
+
+@micro_benchmark('generate_random_walk_melody_in_range_and_mean')
+def _generate_random_walk_melody_in_range_and_mean():
+    rng = random.Random(1)
+    return lambda: generate_random_walk_melody_in_range_and_mean(
+        BENCH_SCALE, bars=4, tempo_and_meter=BENCH_TEMPO, rng=rng,
+    )
+
+
+# (candidates, steps) of the walk position benchmarks
+BENCH_WALKS = ((1000, 256), (1, 4096))
+
+
+def _bench_walk_steps(candidates: int, steps: int):
+    rng = random.Random(1)
+    return [[rng.randint(-1, 1) * 3 for _ in range(0, steps)] for _ in range(0, candidates)]
+
+
+for _candidates, _steps in BENCH_WALKS:
+    @micro_benchmark(f'walk_positions_clip_{_candidates}x{_steps}')
+    def _walk_positions_clip(candidates=_candidates, steps=_steps):
+        walks = _bench_walk_steps(candidates, steps)
+        return lambda: [walk_positions(20, walk, 0, 40) for walk in walks]
+
+
+try:
+    # optional batch extra
+    import numpy as np
+    from batch import walk_positions_batch
+except ImportError:
+    walk_positions_batch = None
+
+if walk_positions_batch:
+    for _candidates, _steps in BENCH_WALKS:
+        for _boundary in ('clip', 'reflect'):
+            @micro_benchmark(f'walk_positions_batch_{_boundary}_{_candidates}x{_steps}')
+            def _walk_positions_batch(candidates=_candidates, steps=_steps, boundary=_boundary):
+                walks = np.array(_bench_walk_steps(candidates, steps))
+                return lambda: walk_positions_batch(walks, 20, 0, 40, boundary)
+
+
+@micro_benchmark('generator_next')
+def _generator_next():
+    rng = random.Random(1)
+    generator = NoteGeneratorFromSequence(
+        generate_random_melody(BENCH_SCALE, bars=8, tempo_and_meter=BENCH_TEMPO, rng=rng)
+    )
+    return generator.next
+
+
+@micro_benchmark('sequence_step')
+def _sequence_step():
+    """
+    One step of the playback path without waiting: generator, quantization table and port writer.
+    """
+    rng = random.Random(1)
+    table = quantize_table(MusicScale(tonic='d', scale=MusicScaleType.MAJOR))
+    outport = NullOutport()
+
+    def play(note: NoteLength):
+        if note.note:
+            outport.send(mido.Message('note_on', note=table[note.note.midi_no], velocity=note.velocity))
+
+    sequence = SequenceControl(
+        generator=NoteGeneratorFromSequence(
+            generate_random_melody(BENCH_SCALE, bars=8, tempo_and_meter=BENCH_TEMPO, rng=rng)
+        ),
+        play_target=play,
+        tempo_and_meter=BENCH_TEMPO.model_copy(),
+    )
+    return sequence.step
+
+
+def _flush_display(framebuffer: JamFramebuffer, transport: Transport, fps: float = 30):
+    # display thread of the live app, stopped with the transport
+    while transport.wait_for_play():
+        framebuffer.flush()
+        transport.sleep(1 / fps)
+
+
+def _playback(engine: str, duration: float, sequences: int = 6, tempo: float = 240) -> dict:
+    """
+    Plays generated sequences against headless ports with the given engine and returns timing of all steps.
+
+    Steps go through the live play target (app.play_note_from_sequence_to_midi_msg): key quantization, mute flags,
+    channels of sequence_channels, note offs and the Jam step display flushed by its own thread. Every eighth
+    track is muted.
+    """
+    rng = random.Random(1)
+    transport = Transport()
+    outport = NullOutport()
+    writer = MidiWriter(outport, desc='MidiWriter Bench')
+    note_offs = NoteOffScheduler(writer)
+    scheduler = Scheduler(transport=transport) if engine == 'scheduler' else None
+
+    run_settings = RunSettings(
+        sequencers=[],
+        transport=transport,
+        quantize_to_scale=BENCH_SCALE,
+        quantize_table=quantize_table(BENCH_SCALE),
+        music_scale=BENCH_SCALE,
+        sequences_config_params=[dict() for _ in range(0, sequences)],
+        generated_sequences=[],
+    )
+    channels = sequence_channels(run_settings.sequences_config_params)
+    machine_jam.init_tracks(sequences)
+    for seq_no in range(0, sequences, 8):
+        machine_jam.mute[seq_no] = 0
+    framebuffer = JamFramebuffer(NullOutport(), machine_jam.tracker_midi_notes)
+    shown_framebuffer, machine_jam._jam_framebuffer = machine_jam._jam_framebuffer, framebuffer
+    display = Thread(target=_flush_display, args=(framebuffer, transport), name='JamFramebuffer Bench', daemon=True)
+    display.start()
+
+    timings = []
+    sequencers = []
+    for seq_no in range(0, sequences):
+        tempo_and_meter = TempoAndMeter(tempo=tempo + (seq_no % 8) * 7, upper_meter=4, lower_meter=16)
+        timing = SequenceTiming(f'SEQ{seq_no}', tempo_and_meter.upper_meter)
+        timings.append(timing)
+        play = lambda note, _id=seq_no, _timing=timing: play_note_from_sequence_to_midi_msg(
+            seq_no=_id,
+            note=note,
+            outport=writer,
+            run_settings=run_settings,
+            note_offs=note_offs,
+            timing=_timing,
+            channel=channels[_id],
+        )
+
+        generator = NoteGeneratorFromSequence(
+            generate_random_melody(BENCH_SCALE, bars=4, tempo_and_meter=tempo_and_meter,
+                                   pause_fn=lambda: rng.randint(0, 100) < 30, rng=rng)
+        )
+        if scheduler:
+            scheduler.add(SequenceControl(generator, play, tempo_and_meter, desc=f'SEQ{seq_no}', timing=timing))
+        else:
+            sequencers.append(Sequencer(generator, play, transport, tempo_and_meter, desc=f'SEQ{seq_no}',
+                                        timing=timing))
+
+    if scheduler:
+        scheduler.start()
+
+    cpu_started = time.process_time()
+    transport.play()
+    time.sleep(duration)
+    transport.shutdown()
+    cpu = time.process_time() - cpu_started
+    # nothing may send into the closed writer or record timings of the next benchmark
+    for sequencer in sequencers:
+        sequencer.join(timeout=1.0)
+    if scheduler:
+        scheduler.join(timeout=1.0)
+    display.join(timeout=1.0)
+    machine_jam._jam_framebuffer = shown_framebuffer
+    note_offs.notes_off()
+    note_offs.close()
+    writer.close()
+
+    dequeued = [timing.dequeued for timing in timings]
+    sent = [timing.sent for timing in timings if timing.sent.count]
+    steps = sum(histogram.count for histogram in dequeued)
+    return {
+        'steps_per_sec': round(steps / duration, 1),
+        'cpu_percent': round(cpu / duration * 100, 1),
+        'dequeued_p50_ms': round(statistics.median(h.percentile(50) for h in dequeued) * 1000, 3),
+        'dequeued_p99_ms': round(max(h.percentile(99) for h in dequeued) * 1000, 3),
+        'dequeued_max_ms': round(max(h.max for h in dequeued) * 1000, 3),
+        'sent_p50_ms': round(statistics.median(h.percentile(50) for h in sent) * 1000, 3),
+        'sent_p99_ms': round(max(h.percentile(99) for h in sent) * 1000, 3),
+        'sent_max_ms': round(max(h.max for h in sent) * 1000, 3),
+        'drift_per_bar_max_ms': round(max(abs(timing.max_drift) for timing in timings) * 1000, 3),
+        'messages': outport.sent,
+        'display_messages': framebuffer.messages_sent,
+    }
+
+
+@playback_benchmark('playback_threads')
+def _playback_threads(duration: float) -> dict:
+    return _playback('threads', duration)
+
+
+@playback_benchmark('playback_scheduler')
+def _playback_scheduler(duration: float) -> dict:
+    return _playback('scheduler', duration)
+
+
+# timing must stay stable as the number of tracks grows, see track_scaling
+
+
+@playback_benchmark('playback_threads_16_tracks')
+def _playback_threads_16_tracks(duration: float) -> dict:
+    return _playback('threads', duration, sequences=16)
+
+
+@playback_benchmark('playback_scheduler_16_tracks')
+def _playback_scheduler_16_tracks(duration: float) -> dict:
+    return _playback('scheduler', duration, sequences=16)
+
+
+@playback_benchmark('playback_threads_64_tracks')
+def _playback_threads_64_tracks(duration: float) -> dict:
+    return _playback('threads', duration, sequences=64)
+
+
+@playback_benchmark('playback_scheduler_64_tracks')
+def _playback_scheduler_64_tracks(duration: float) -> dict:
+    return _playback('scheduler', duration, sequences=64)
+
+
+def measure_startup(repeat: int = 5) -> dict:
+    """
+    Imports the live path modules in a fresh interpreter repeat times.
+
+    :return: best import and whole process (interpreter start included) time in seconds, ports opened by the imports
+    """
+    script = STARTUP_SCRIPT.format(modules=', '.join(STARTUP_MODULES))
+    imports = []
+    processes = []
+    opened = 0
+    for _ in range(0, repeat):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, '-c', script],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        processes.append(time.perf_counter() - started)
+        import_seconds, ports = completed.stdout.split()
+        imports.append(float(import_seconds))
+        opened = max(opened, int(ports))
+    return {
+        'import_seconds': round(min(imports), 4),
+        'seconds': round(min(processes), 4),
+        'opened_ports': opened,
+    }
+
+
+def measure_ops(op: Callable[[], object], min_time: float = 0.2, repeat: int = 5) -> dict:
+    """
+    :return: best and median ops/sec of repeat runs, every run takes at least min_time / repeat seconds
+    """
+    timer = timeit.Timer(op)
+    number, taken = timer.autorange()
+    number = max(1, int(number * min_time / repeat / taken))
+    runs = timer.repeat(repeat=repeat, number=number)
+    return {
+        'ops_per_sec': round(number / min(runs), 1),
+        'median_ops_per_sec': round(number / statistics.median(runs), 1),
+    }
+
+
+def measure_allocations(op: Callable[[], object], number: int = 100) -> dict:
+    """
+    :return: peak and retained memory (KiB) allocated by number calls of op
+    """
+    op()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(0, number):
+            op()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'peak_kib': round((peak - before) / 1024, 2),
+        'retained_kib': round((current - before) / 1024, 2),
+    }
+
+
+def run(selected: Optional[List[str]] = None, duration: float = 3.0, min_time: float = 0.2) -> dict:
+    """
+    Runs benchmarks.
+
+    :param selected: names (or their parts) of benchmarks to run, all when None
+    :param duration: seconds of every playback benchmark
+    :param min_time: seconds spent measuring every micro benchmark
+    :return: results by benchmark name
+    """
+    def is_selected(name: str) -> bool:
+        return not selected or any(part in name for part in selected)
+
+    results = {}
+    for name, factory in MICRO_BENCHMARKS.items():
+        if not is_selected(name):
+            continue
+        op = factory()
+        results[name] = measure_ops(op, min_time=min_time) | measure_allocations(op)
+        print(f'{name:48} {_format(results[name])}')
+
+    for name, fn in PLAYBACK_BENCHMARKS.items():
+        if not is_selected(name):
+            continue
+        results[name] = fn(duration)
+        print(f'{name:48} {_format(results[name])}')
+
+    if is_selected('startup'):
+        results['startup'] = measure_startup()
+        print(f'{"startup":48} {_format(results["startup"])}')
+
+    return results
+
+
+def _format(result: dict) -> str:
+    return ', '.join(f'{key}={value}' for key, value in result.items())
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.25, min_ms: float = 2.0) -> List[str]:
+    """
+    Compares results with a baseline.
+
+    Throughput regresses when it drops more than threshold (relative), latency and memory when they grow more than
+    threshold, latencies below min_ms are never regressions (scheduler noise).
+
+    :return: regression descriptions, empty when none
+    """
+    regressions = []
+    for name, result in results.items():
+        for metric, value in result.items():
+            base = baseline.get(name, {}).get(metric)
+            if not isinstance(base, (int, float)) or metric in ('messages', 'display_messages', 'retained_kib', 'opened_ports'):
+                continue
+            if metric.endswith(LOWER_IS_BETTER):
+                if metric.endswith('_ms') and value < min_ms:
+                    continue
+                if value > base * (1 + threshold) and value - base > (min_ms if metric.endswith('_ms') else 0):
+                    regressions.append(f'{name}.{metric}: {base} -> {value}')
+            elif value < base * (1 - threshold):
+                regressions.append(f'{name}.{metric}: {base} -> {value}')
+    return regressions
+
+
+def track_scaling(results: dict, factor: float = 2.0, slack_ms: float = 10.0) -> List[str]:
+    """
+    Checks that timing stays stable as the number of tracks grows: p99 / max lateness and drift of every
+    playback_<engine>_<n>_tracks result may be at most factor times the playback_<engine> (6 tracks) result plus
+    slack_ms.
+
+    :return: descriptions of the exceeded bounds, empty when none or when the 6 track result is missing
+    """
+    exceeded = []
+    for name, result in results.items():
+        if not name.startswith('playback_') or not name.endswith('_tracks'):
+            continue
+        base = results.get(name.rsplit('_', 2)[0])
+        if not base:
+            continue
+        for metric in TRACK_SCALING_METRICS:
+            bound = round(base[metric] * factor + slack_ms, 3)
+            if result[metric] > bound:
+                exceeded.append(f'{name}.{metric}: {result[metric]} > {bound} (6 tracks: {base[metric]})')
+    return exceeded
+
+
+def _get_input_args() -> Namespace:
+    parser = ArgumentParser(
+        prog='Generation-X benchmarks',
+        description='Headless benchmarks of generation, lookups, quantization and playback loops, '
+                    'no MIDI hardware is needed',
+    )
+    parser.add_argument(
+        "-k",
+        "--select",
+        type=str,
+        action='append',
+        help="Run only benchmarks which name contains the value, can be repeated",
+    )
+    parser.add_argument(
+        "-d",
+        "--duration",
+        type=float,
+        default=3.0,
+        help="Seconds of every playback benchmark",
+    )
+    parser.add_argument(
+        "--min_time",
+        type=float,
+        default=0.2,
+        help="Seconds spent measuring every micro benchmark",
+    )
+    parser.add_argument(
+        "--save",
+        type=str,
+        help="Save results as JSON baseline",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        help="Compare results with JSON baseline, exits with 1 on regressions",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Allowed relative regression against the baseline",
+    )
+    parser.add_argument(
+        "--startup_budget",
+        type=float,
+        default=1.0,
+        help="Allowed seconds from interpreter start to imported live path, exits with 1 when exceeded "
+             "or when an import opens a MIDI port",
+    )
+    parser.add_argument(
+        "--track_factor",
+        type=float,
+        default=2.0,
+        help="Allowed growth of lateness and drift of the 16 and 64 track playback over the 6 track playback, "
+             "exits with 1 when exceeded",
+    )
+    parser.add_argument(
+        "--track_slack_ms",
+        type=float,
+        default=10.0,
+        help="Milliseconds allowed on top of --track_factor times the 6 track playback",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    input_args = _get_input_args()
+    configure(levels={'seq': 'warn', 'gen': 'warn'})
+    results = run(input_args.select, duration=input_args.duration, min_time=input_args.min_time)
+
+    failed = False
+    startup = results.get('startup')
+    if startup and (startup['seconds'] > input_args.startup_budget or startup['opened_ports']):
+        print(f'STARTUP BUDGET EXCEEDED {_format(startup)} (budget {input_args.startup_budget}s, no opened ports)')
+        failed = True
+
+    for exceeded in track_scaling(results, factor=input_args.track_factor, slack_ms=input_args.track_slack_ms):
+        print(f'TRACK SCALING EXCEEDED {exceeded}')
+        failed = True
+
+    if input_args.save:
+        with open(input_args.save, 'w') as f:
+            json.dump(
+                {
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'results': results,
+                },
+                f,
+                indent=2,
+            )
+        print(f'baseline saved to {input_args.save}')
+
+    if input_args.baseline:
+        with open(input_args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, threshold=input_args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+        print(f'no regressions against {input_args.baseline} (threshold {input_args.threshold})')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,16 @@
+import hashlib
 import random
-from typing import List
+from typing import List, Optional
 
 
-def parse_sequences_config(config: str) -> dict:
+def derive_seed(master_seed: int, idx: int) -> int:
+    """
+    Derives independent, stable seed of a sequence RNG stream from the master seed.
+    """
+    return int.from_bytes(hashlib.sha256(f'{master_seed}:{idx}'.encode()).digest()[:8], 'big')
+
+
+def parse_sequences_config(config: str, rng: random.Random = None) -> dict:
     def parse_range(config_part: str) -> (int, int):
         param_parts = config_part.split(":")
         if len(param_parts) == 2:
@@ -17,6 +25,7 @@ def parse_sequences_config(config: str) -> dict:
             root_octave_fn=lambda: 4,
             tempo_fn=lambda: 30,
             pause_factor=30,
+            gate=90,
             upper_meter=4,
             lower_meter=4,
         )
@@ -29,22 +38,52 @@ def parse_sequences_config(config: str) -> dict:
             tempo_fn=lambda: 30,
             mode="3th",
             start_note="c",
+            gate=90,
+            upper_meter=4,
+            lower_meter=4,
+    )
+
+    default_walk = dict(
+            generation_type="walk",
+            bars_length_fn=lambda: 2,
+            root_octave_fn=lambda: 4,
+            tempo_fn=lambda: 30,
+            steps_deviation=1,
+            min_pitch=-8,
+            max_pitch=8,
+            gate=90,
             upper_meter=4,
             lower_meter=4,
     )
 
+    rng = rng if rng else random.Random()
+    source = config
+
     config_parts = config.split("|")
     if not config_parts:
         return default_random
 
-    config = dict()
+    config = dict(config=source, rng=rng)
+
+    # optional gate=<%> and ch=<1-16> parts, can be placed anywhere after the type
+    gate_parts = [part for part in config_parts[1:] if part.startswith('gate=')]
+    if gate_parts:
+        config['gate'] = int(gate_parts[-1].split('=')[1])
+        config_parts = [part for part in config_parts if not part.startswith('gate=')]
+    channel_parts = [part for part in config_parts[1:] if part.startswith('ch=')]
+    if channel_parts:
+        channel = int(channel_parts[-1].split('=')[1])
+        if not 1 <= channel <= 16:
+            raise ValueError(f'Wrong MIDI channel: {channel}, use 1-16!')
+        config['channel'] = channel - 1
+        config_parts = [part for part in config_parts if not part.startswith('ch=')]
 
     def set_config_param_with_range(idx, param_name) -> None:
         if len(config_parts) > idx:
             config_param_parts = config_parts[idx].split(":")
             left_range, right_range = parse_range(config_parts[idx])
             if left_range is not None and right_range is not None:
-                config[param_name] = lambda: int(config_param_parts[0]) + random.randint(left_range, right_range)
+                config[param_name] = lambda: int(config_param_parts[0]) + rng.randint(left_range, right_range)
             else:
                 config[param_name] = lambda: int(config_param_parts[0])
 
@@ -81,10 +120,30 @@ def parse_sequences_config(config: str) -> dict:
 
         return default_arp | config
 
+    if config_parts[0] == 'w':
+        config['generation_type'] = "walk"
+        set_config_param_with_range(1, 'bars_length_fn')
+        set_config_param_with_range(2, 'root_octave_fn')
+        set_config_param_with_range(3, 'tempo_fn')
+        if len(config_parts) > 4:
+            config['steps_deviation'] = int(config_parts[4])
+        if len(config_parts) > 5:
+            range_parts = config_parts[5].split('.')
+            config['min_pitch'] = int(range_parts[0])
+            if len(range_parts) > 1:
+                config['max_pitch'] = int(range_parts[1])
+        if len(config_parts) > 6:
+            meter_parts = config_parts[6].split('/')
+            config['upper_meter'] = meter_parts[0]
+            if len(meter_parts) > 1:
+                config['lower_meter'] = meter_parts[1]
+
+        return default_walk | config
+
     raise ValueError('Unsupported sequence type')
 
 
-def sequences_config_parser(sequences_config: List[str]) -> List[dict]:
+def sequences_config_parser(sequences_config: List[str], seed: Optional[int] = None) -> List[dict]:
     """
     Frames specifying the sequence configuration.
 
@@ -94,12 +153,26 @@ def sequences_config_parser(sequences_config: List[str]) -> List[dict]:
     # a|3:-1.1|6:-1.1|2:-1.1|30:-5.5|3th|g|4/4
     # arpeggio - bars_length_fn - total_notes_fn - root_octave_fn - tempo_fn - mode - start_note - meter
 
+    # w|2:-1.1|4|30:-5.5|2|-8.8|4/4
+    # walk - bars_length_fn - root_octave_fn - tempo_fn - steps_deviation - min_pitch.max_pitch (scale steps) - meter
+
     # -x.x specify optional randomization for the value
 
+    # |gate=80 optional part of any type, % of the step length notes sound (default 90)
+
+    # |ch=3 optional part of any type, MIDI channel 1-16 (default: sequence number + 1, wrapped after 16)
+
+    Every sequence gets its own RNG stream ('rng'), seeded from the master seed, which is used by all its
+    randomized values and by its generator, so the same config and seed always generate the same sequences.
+
     :param sequences_config:
+    :param seed: master seed, None for unseeded (not reproducible) sequences
     :return: dict with config values and functions
     """
     result = list()
-    for c in sequences_config:
-        result.append(parse_sequences_config(c))
+    for idx, c in enumerate(sequences_config):
+        seq_seed = derive_seed(seed, idx) if seed is not None else None
+        seq_config = parse_sequences_config(c, random.Random(seq_seed))
+        seq_config['seed'] = seq_seed
+        result.append(seq_config)
     return result
@@ -0,0 +1,101 @@
+import os
+from threading import Thread, Event
+from typing import Callable, List, Optional, Tuple
+
+from log import get_logger
+
+_log = get_logger('app')
+
+
+def load_sequences_config(path: str, **values) -> List[str]:
+    """
+    Reads sequences config file, one sequence config (see config.sequences_config_parser) per line,
+    empty lines and lines starting with # are skipped.
+
+    Placeholders like {tempo} or {rest_factor} are replaced with values, e.g.:
+
+        a|3|6|4|{tempo}|3th down|c|8/16
+        r|3|3|{tempo}:-5.5|{rest_factor}|5/4
+
+    :param path: config file
+    :param values: placeholder values
+    :return: sequence configs
+    """
+    with open(path) as f:
+        lines = [line.strip() for line in f]
+    return [line.format(**values) for line in lines if line and not line.startswith('#')]
+
+
+def diff_sequences_config(config_params: List[dict], sequences_config: List[str]) -> Tuple[List[int], List[int], List[int]]:
+    """
+    Compares new sequence configs with the parsed ones.
+
+    :param config_params: currently parsed sequences config
+    :param sequences_config: new sequence configs
+    :return: (changed, added, removed) sequence numbers
+    """
+    changed = [idx for idx, (params, config) in enumerate(zip(config_params, sequences_config))
+               if params['config'] != config]
+    added = list(range(len(config_params), len(sequences_config)))
+    removed = list(range(len(sequences_config), len(config_params)))
+    return changed, added, removed
+
+
+class ConfigWatcher(Thread):
+
+    def __init__(self,
+                 path: str,
+                 on_change: Callable[[List[str]], None],
+                 values: Optional[dict] = None,
+                 interval: float = 1.0,
+                 desc='ConfigWatcher'):
+        """
+        Polls modification time and size of the sequences config file and calls on_change with the reloaded
+        configs whenever it changes. Polling is a single stat call, no file is read while it is unchanged.
+
+        :param path: config file
+        :param on_change: called with the new sequence configs from the watcher thread
+        :param values: placeholder values, see load_sequences_config
+        :param interval: seconds between two checks
+        :param desc: description
+        """
+        super().__init__(name=desc)
+        self._path = path
+        self._on_change = on_change
+        self._values = values or {}
+        self._interval = interval
+        self._stopped = Event()
+        self._signature = self._stat()
+        self.reloads = 0
+        self.daemon = True
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self._path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def stop(self):
+        self._stopped.set()
+
+    def check(self) -> bool:
+        """
+        :return: True if the file changed and on_change was called
+        """
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        try:
+            sequences_config = load_sequences_config(self._path, **self._values)
+        except Exception as e:
+            _log.error('could not load %s: %s', self._path, e)
+            return False
+        self.reloads = self.reloads + 1
+        self._on_change(sequences_config)
+        return True
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            self.check()
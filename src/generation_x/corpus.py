@@ -0,0 +1,205 @@
+import itertools
+import json
+import os
+import random
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Tuple
+
+from app import generate_sequence
+from config import derive_seed, parse_sequences_config
+from models import MusicScale, MusicScaleType, TempoAndMeter
+from pattern import PackedPattern
+from log import get_logger
+
+_log = get_logger('gen')
+
+
+def _record(config: str, tonic: str, scale_type: str, seed: int, tempo_and_meter: TempoAndMeter,
+            pattern: PackedPattern, **extra) -> str:
+    return json.dumps({
+        'config': config,
+        'tonic': tonic,
+        'scale': scale_type,
+        'seed': seed,
+        'tempo': tempo_and_meter.tempo,
+        'upper_meter': tempo_and_meter.upper_meter,
+        'lower_meter': tempo_and_meter.lower_meter,
+        'pattern': pattern.to_dict(),
+        **extra,
+    })
+
+
+def _generate_random_batch(seq_cfgs: List[dict],
+                           music_scale: MusicScale,
+                           seed: int) -> List[Tuple[TempoAndMeter, PackedPattern]]:
+    """
+    Generates the melodies of random type configs with batch.generate_random_melody_batch.
+
+    Tempo, octave and bars are still drawn from every pattern RNG stream (in the order of app.generate_sequence),
+    the patterns with the same bars, octave and meter are generated in one batch from a numpy RNG seeded with seed.
+    Note lengths follow the tempo of every pattern.
+
+    :param seq_cfgs: parsed random type configs
+    :param music_scale: tonic and scale
+    :param seed: seed of the numpy RNG
+    :return: tempo and meter, pattern for every config
+    """
+    # imported only for --batch, numpy is an optional dependency
+    import numpy as np
+    from batch import generate_random_melody_batch, pause_probability
+
+    drawn = []
+    groups: Dict[Tuple[int, int, int, int, int], List[int]] = {}
+    for idx, seq_cfg in enumerate(seq_cfgs):
+        tempo_and_meter = TempoAndMeter(
+            tempo=seq_cfg['tempo_fn'](),
+            upper_meter=seq_cfg['upper_meter'],
+            lower_meter=seq_cfg['lower_meter'],
+        )
+        octave = seq_cfg['root_octave_fn']()
+        bars = seq_cfg['bars_length_fn']()
+        drawn.append(tempo_and_meter)
+        key = (bars, octave, tempo_and_meter.upper_meter, tempo_and_meter.lower_meter, seq_cfg['pause_factor'])
+        groups.setdefault(key, []).append(idx)
+
+    rng = np.random.default_rng(seed)
+    patterns: List[Optional[PackedPattern]] = [None] * len(seq_cfgs)
+    for (bars, octave, _, _, pause_factor), indexes in groups.items():
+        melodies = generate_random_melody_batch(
+            music_scale,
+            rng,
+            octave=octave,
+            bars=bars,
+            tempo_and_meter=drawn[indexes[0]],
+            rest_probability=pause_probability(pause_factor),
+            candidates=len(indexes),
+        )
+        for candidate, idx in enumerate(indexes):
+            pattern = melodies.to_pattern(candidate)
+            pattern.length = array('d', [drawn[idx].to_bar_and_note_length().note_length]) * len(pattern)
+            pattern.set_gate(seq_cfgs[idx].get('gate', 100))
+            patterns[idx] = pattern
+    return list(zip(drawn, patterns))
+
+
+def generate_chunk(task: Tuple[str, str, str, int, int, int, bool]) -> Tuple[int, str]:
+    """
+    Generates one chunk of patterns of a single (config, tonic, scale) combination, runs in a worker process.
+
+    Every pattern gets its own RNG stream derived from the master seed and its index, so the corpus does not
+    depend on the number of workers or the chunk size.
+
+    With batch, random type configs are generated vectorized (see _generate_random_batch), their notes come from
+    one numpy RNG per chunk, so they depend on the chunk size and the records are marked with 'batch'. Arpeggio and
+    walk configs are always generated per pattern.
+
+    :param task: (config, tonic, scale type, master seed, first index, count, batch)
+    :return: number of patterns, JSON lines with the patterns
+    """
+    config, tonic, scale_type, master_seed, first, count, batch = task
+    music_scale = MusicScale(tonic=tonic, scale=MusicScaleType(scale_type))
+    seeds = [derive_seed(master_seed, idx) for idx in range(first, first + count)]
+    seq_cfgs = [parse_sequences_config(config, random.Random(seed)) for seed in seeds]
+
+    if batch and seq_cfgs and seq_cfgs[0]['generation_type'] == 'random':
+        generated = _generate_random_batch(seq_cfgs, music_scale, derive_seed(master_seed, first))
+        extra = dict(batch=True)
+    else:
+        generated = [generate_sequence(seq_cfg, music_scale) for seq_cfg in seq_cfgs]
+        extra = dict()
+
+    lines = [_record(config, tonic, scale_type, seed, tempo_and_meter, pattern, **extra)
+             for seed, (tempo_and_meter, pattern) in zip(seeds, generated)]
+    return count, '\n'.join(lines) + '\n'
+
+
+def corpus_tasks(sequences_config: List[str],
+                 tonics: List[str],
+                 scale_types: List[str],
+                 count: int,
+                 master_seed: int,
+                 chunk_size: int,
+                 batch: bool = False) -> List[Tuple[str, str, str, int, int, int, bool]]:
+    """
+    Splits the corpus into chunks, count patterns of every (config, tonic, scale) combination.
+    """
+    tasks = []
+    combination = 0
+    for config in sequences_config:
+        for tonic in tonics:
+            for scale_type in scale_types:
+                first = combination * count
+                for chunk_first in range(first, first + count, chunk_size):
+                    tasks.append((config, tonic, scale_type, master_seed, chunk_first,
+                                  min(chunk_size, first + count - chunk_first), batch))
+                combination = combination + 1
+    return tasks
+
+
+def generate_corpus(path: str,
+                    sequences_config: List[str],
+                    tonics: List[str],
+                    scale_types: List[str],
+                    count: int,
+                    master_seed: int,
+                    jobs: Optional[int] = None,
+                    chunk_size: int = 250,
+                    batch: bool = False,
+                    progress_interval: float = 1.0) -> dict:
+    """
+    Generates patterns of every config in every tonic and scale over a process pool and writes them as JSON lines.
+
+    Workers serialize their chunks, the main process only appends them to the file as they complete. At most
+    a few chunks per worker are in flight, so memory stays flat however big the corpus is.
+
+    :param path: output .jsonl file
+    :param sequences_config: sequence configs, see config.sequences_config_parser
+    :param tonics: tonics
+    :param scale_types: MusicScaleType values
+    :param count: patterns of every (config, tonic, scale) combination
+    :param master_seed: master seed, the same arguments always generate the same corpus
+    :param jobs: worker processes, number of CPUs when None
+    :param chunk_size: patterns generated and sent back by a worker at once
+    :param batch: generate random type configs vectorized (needs numpy), see generate_chunk
+    :param progress_interval: seconds between progress logs
+    :return: patterns, seconds, patterns per second, jobs
+    """
+    jobs = jobs or os.cpu_count() or 1
+    tasks = corpus_tasks(sequences_config, tonics, scale_types, count, master_seed, chunk_size, batch)
+    total = sum(task[5] for task in tasks)
+    _log.info('generating %d patterns (%d configs, %d tonics, %d scales) in %d chunks on %d processes to %s',
+              total, len(sequences_config), len(tonics), len(scale_types), len(tasks), jobs, path)
+
+    done = 0
+    started = time.perf_counter()
+    reported = started
+    with open(path, 'w') as f, ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending_tasks = iter(tasks)
+        in_flight = {executor.submit(generate_chunk, task) for task in itertools.islice(pending_tasks, jobs * 4)}
+        while in_flight:
+            completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in completed:
+                generated, lines = future.result()
+                f.write(lines)
+                done = done + generated
+            in_flight.update(executor.submit(generate_chunk, task)
+                             for task in itertools.islice(pending_tasks, len(completed)))
+
+            now = time.perf_counter()
+            if now - reported >= progress_interval:
+                reported = now
+                _log.info('%d / %d patterns (%d%%), %s patterns/sec', done, total, done * 100 // total,
+                          round(done / (now - started), 1))
+
+    seconds = time.perf_counter() - started
+    stats = {
+        'patterns': done,
+        'seconds': round(seconds, 2),
+        'patterns_per_sec': round(done / seconds, 1) if seconds else 0.0,
+        'jobs': jobs,
+    }
+    _log.info('generated %d patterns to %s in %ss, %s patterns/sec on %d processes', done, path, stats['seconds'],
+              stats['patterns_per_sec'], jobs)
+    return stats
@@ -1,14 +1,8 @@
-import mido
-
-output_device = 'Elektron Model:Cycles'
-
-_elektron_outport = None
-try:
-    _elektron_outport = mido.open_output(output_device)
-except Exception as e:
-    print(f'warn: could not open {output_device} MIDI output port!')
-    elektron_outport = None
+from midi_backends import get_output
 
 
 def get_outport_elektron():
-    return _elektron_outport
+    """
+    Elektron Model:Cycles output, opened on first call, None when not available.
+    """
+    return get_output('elektron_output')
@@ -1,6 +1,8 @@
-from typing import Optional
+from threading import Lock
+from typing import Callable, Optional, Tuple
 
 from models import NoteLength
+from pattern import PackedPattern
 
 
 class NoteGenerator:
@@ -8,38 +10,84 @@ class NoteGenerator:
     def next(self) -> Optional[NoteLength]:
         pass
 
+    def reset(self):
+        """
+        Rewinds generator to the beginning.
+        """
+        pass
+
 
 class NoteGeneratorFromSequence(NoteGenerator):
 
-    def __init__(self, bars):
+    def __init__(self, bars: PackedPattern):
         """
-        Create simple generator which just reads notes from bars and iterate in loop.
-        :param bars: list of list
+        Create simple generator which just reads notes from the pattern and iterate in loop.
+
+        The played pattern is the front buffer, a pattern queued by swap_at_bar waits in the back buffer and is
+        swapped in by the playing thread on the next bar boundary.
+
+        :param bars: packed pattern, list of bars with notes is converted
         """
-        self.bars = bars
-        self.bars_length = len(bars)
-        self.current_bar = None
-        self.current_length = None
-        self.current_bar_idx = 0 if bars else None
-        self.current_note = None
-        self.current_note_idx = 0 if bars else None
+        self._swap_lock = Lock()
+        # (pattern, on_swap) waiting for the next bar boundary
+        self._back: Optional[Tuple[PackedPattern, Optional[Callable[[], None]]]] = None
+        self._set_front(bars)
 
-    def set_new_bars(self, new_bars):
-        self.bars = new_bars
+    def _set_front(self, bars: PackedPattern):
+        self.bars = bars if isinstance(bars, PackedPattern) else PackedPattern.from_bars(bars)
+        self.bars_length = self.bars.bars_count
+        self._bar_starts = frozenset(self.bars.bar_offsets)
+        self.current_note_idx = 0
 
-    def next(self) -> Optional[NoteLength]:
-        if not self.bars:
-            return None
+    def set_new_bars(self, new_bars: PackedPattern):
+        """
+        Replaces the playing pattern straight away from the beginning, only safe from the playing thread or while
+        stopped, use swap_at_bar otherwise.
+        """
+        with self._swap_lock:
+            self._back = None
+        self._set_front(new_bars)
 
-        self.current_bar = self.bars[self.current_bar_idx]
-        self.current_note = self.current_bar[self.current_note_idx]
+    def swap_at_bar(self, new_bars: PackedPattern, on_swap: Optional[Callable[[], None]] = None):
+        """
+        Queues pattern to the back buffer, it replaces the playing one on the next bar boundary, a pattern queued
+        before and not yet swapped in is dropped.
+
+        :param new_bars: next pattern
+        :param on_swap: called by the playing thread right after the swap, before the first step of the new pattern
+        """
+        with self._swap_lock:
+            self._back = (new_bars if isinstance(new_bars, PackedPattern) else PackedPattern.from_bars(new_bars),
+                          on_swap)
+
+    @property
+    def swap_pending(self) -> bool:
+        return self._back is not None
+
+    def _swap(self):
+        with self._swap_lock:
+            back, self._back = self._back, None
+        if back:
+            self._set_front(back[0])
+            if back[1]:
+                back[1]()
 
-        self.current_note_idx = self.current_note_idx + 1
-        if self.current_note_idx >= len(self.current_bar):
-            self.current_note_idx = 0
+    def reset(self):
+        self.current_note_idx = 0
+
+    def next(self) -> Optional[NoteLength]:
+        idx = self.current_note_idx
+        if self._back is not None and (idx in self._bar_starts or idx >= len(self.bars)):
+            self._swap()
+            idx = 0
+
+        bars = self.bars
+        steps = len(bars)
+        if not steps:
+            return None
 
-            self.current_bar_idx = self.current_bar_idx + 1
-            if self.current_bar_idx >= self.bars_length:
-                self.current_bar_idx = 0
+        if idx >= steps:
+            idx = 0
+        self.current_note_idx = idx + 1 if idx + 1 < steps else 0
 
-        return self.current_note
+        return bars.step(idx)
@@ -0,0 +1,116 @@
+import time
+from array import array
+from threading import Thread, Lock
+from typing import Dict, List
+
+import mido
+
+
+class JamFramebuffer(Thread):
+
+    def __init__(self, outport, columns: List[List[int]], fps: float = 30, desc='JamFramebuffer'):
+        """
+        Pad and button state of the Maschine Jam display.
+
+        Sequencers only push values into per column ring buffers (O(1), nothing is sent from their threads),
+        the display thread flushes at a fixed frame rate and sends only the pads and controls which changed since
+        the previous frame.
+
+        :param outport: Jam MIDI output port or its MidiWriter
+        :param columns: pad midi notes of every column, ordered from the newest value
+        :param fps: frames per second
+        :param desc: description
+        """
+        super().__init__(name=desc)
+        self._outport = outport
+        self._columns = columns
+        self._rows = [len(column) for column in columns]
+        self._rings = [array('B', bytes(rows)) for rows in self._rows]
+        self._heads = [0] * len(columns)
+        self._ccs: Dict[int, int] = {}
+        self._sent_pads: Dict[int, int] = {}
+        self._sent_ccs: Dict[int, int] = {}
+        self._flush_lock = Lock()
+        self._frame_length = 1.0 / fps
+        self.frames = 0
+        self.messages_sent = 0
+
+        self.daemon = True
+
+    def push(self, column: int, value: int):
+        """
+        Shifts column by one and puts value on top, called from the sequencer threads.
+        """
+        rows = self._rows[column]
+        head = self._heads[column] - 1
+        if head < 0:
+            head = rows - 1
+        self._rings[column][head] = 127 if value > 0 else 0
+        self._heads[column] = head
+
+    def set_cc(self, control: int, value: int):
+        self._ccs[control] = value
+
+    def set_column(self, column: int, values: List[int]):
+        """
+        Replaces the whole column, values ordered from the newest (top) one.
+        """
+        rows = self._rows[column]
+        self._rings[column] = array('B', (127 if value > 0 else 0 for value in values[:rows]))
+        self._rings[column].extend(bytes(rows - len(self._rings[column])))
+        self._heads[column] = 0
+
+    def clear(self):
+        for column in range(0, len(self._columns)):
+            self._rings[column] = array('B', bytes(self._rows[column]))
+            self._heads[column] = 0
+
+    def invalidate(self):
+        """
+        Forgets what was sent, next flush redraws the whole display.
+        """
+        with self._flush_lock:
+            self._sent_pads.clear()
+            self._sent_ccs.clear()
+
+    def column_values(self, column: int) -> List[int]:
+        rows = self._rows[column]
+        ring = self._rings[column]
+        head = self._heads[column]
+        return [ring[(head + row) % rows] for row in range(0, rows)]
+
+    def flush(self) -> int:
+        """
+        Sends pads and controls changed since the last flush.
+
+        :return: amount of sent messages
+        """
+        with self._flush_lock:
+            sent = 0
+            for column, pads in enumerate(self._columns):
+                for midi_no, value in zip(pads, self.column_values(column)):
+                    if self._sent_pads.get(midi_no) != value:
+                        self._outport.send(mido.Message('note_on', note=midi_no, velocity=value))
+                        self._sent_pads[midi_no] = value
+                        sent = sent + 1
+
+            for control, value in list(self._ccs.items()):
+                if self._sent_ccs.get(control) != value:
+                    self._outport.send(mido.Message('control_change', control=control, value=value))
+                    self._sent_ccs[control] = value
+                    sent = sent + 1
+
+            self.frames = self.frames + 1
+            self.messages_sent = self.messages_sent + sent
+            return sent
+
+    def run(self):
+        next_frame = time.monotonic()
+        while True:
+            self.flush()
+            next_frame = next_frame + self._frame_length
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_frame = time.monotonic()
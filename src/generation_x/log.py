@@ -0,0 +1,173 @@
+import atexit
+import sys
+import time
+from collections import deque
+from threading import Thread, Lock
+from typing import Dict, Optional
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+OFF = 100
+
+LEVELS = {
+    'debug': DEBUG,
+    'info': INFO,
+    'warn': WARN,
+    'error': ERROR,
+    'off': OFF,
+}
+
+_PREFIXES = {
+    WARN: 'warn: ',
+    ERROR: 'error: ',
+}
+
+# subsystems: app (startup), seq (played steps, sequencers), gen (generation), jam (controller), midi (ports),
+# metrics (timing summaries)
+_default_level = INFO
+_levels: Dict[str, int] = {}
+_loggers: Dict[str, 'Logger'] = {}
+_records = deque(maxlen=8192)
+_consumer: Optional['_Consumer'] = None
+_consumer_lock = Lock()
+_stream = sys.stdout
+
+
+class Logger:
+
+    __slots__ = ('subsystem', 'level')
+
+    def __init__(self, subsystem: str, level: int):
+        """
+        Logger of one subsystem, use get_logger.
+
+        Logging only appends a record (time, level, format, args) to a bounded ring buffer, formatting and writing
+        is done by the background consumer, so a slow terminal never stalls the caller. When the buffer is full
+        the oldest records are dropped.
+        """
+        self.subsystem = subsystem
+        self.level = level
+
+    def enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def log(self, level: int, fmt: str, *args):
+        if level < self.level:
+            return
+        _records.append((time.time(), level, fmt, args))
+        if _consumer is None:
+            _start_consumer()
+
+    def debug(self, fmt: str, *args):
+        if DEBUG >= self.level:
+            self.log(DEBUG, fmt, *args)
+
+    def info(self, fmt: str, *args):
+        if INFO >= self.level:
+            self.log(INFO, fmt, *args)
+
+    def warn(self, fmt: str, *args):
+        if WARN >= self.level:
+            self.log(WARN, fmt, *args)
+
+    def error(self, fmt: str, *args):
+        if ERROR >= self.level:
+            self.log(ERROR, fmt, *args)
+
+
+class _Consumer(Thread):
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(name='LogConsumer')
+        self._interval = interval
+        self._write_lock = Lock()
+        self.daemon = True
+
+    def drain(self):
+        with self._write_lock:
+            lines = []
+            while _records:
+                _, level, fmt, args = _records.popleft()
+                try:
+                    message = fmt % args if args else fmt
+                except Exception as e:
+                    message = f'{fmt} {args} ({e})'
+                lines.append(_PREFIXES.get(level, '') + message)
+            if lines:
+                _stream.write('\n'.join(lines) + '\n')
+                _stream.flush()
+
+    def run(self):
+        while True:
+            time.sleep(self._interval)
+            if _records:
+                self.drain()
+
+
+def _start_consumer():
+    global _consumer
+    with _consumer_lock:
+        if _consumer is None:
+            _consumer = _Consumer()
+            _consumer.start()
+
+
+def get_logger(subsystem: str) -> Logger:
+    if subsystem not in _loggers:
+        _loggers[subsystem] = Logger(subsystem, _levels.get(subsystem, _default_level))
+    return _loggers[subsystem]
+
+
+def parse_level(level: str) -> int:
+    if level.lower() not in LEVELS:
+        raise ValueError(f'Unsupported log level: {level}, use one of {list(LEVELS.keys())}')
+    return LEVELS[level.lower()]
+
+
+def configure(level: str = 'info', levels: Dict[str, str] = None, silent: bool = False, stream=None):
+    """
+    Sets log levels, can be called any time, loggers already handed out are updated.
+
+    :param level: default level of all subsystems
+    :param levels: level per subsystem, e.g. {'seq': 'warn'}
+    :param silent: performance mode, nothing is logged at all
+    :param stream: output stream, stdout by default
+    """
+    global _default_level, _stream
+    _default_level = OFF if silent else parse_level(level)
+    if silent:
+        _records.clear()
+    _levels.clear()
+    if not silent:
+        for subsystem, subsystem_level in (levels or {}).items():
+            _levels[subsystem] = parse_level(subsystem_level)
+    if stream:
+        _stream = stream
+
+    for subsystem, logger in _loggers.items():
+        logger.level = _levels.get(subsystem, _default_level)
+
+
+def parse_subsystem_levels(values) -> Dict[str, str]:
+    """
+    Parses ['seq=warn', 'jam=debug'] command line values.
+    """
+    levels = {}
+    for value in values or []:
+        subsystem, _, level = value.partition('=')
+        parse_level(level)
+        levels[subsystem] = level
+    return levels
+
+
+def flush():
+    """
+    Writes all pending records from the calling thread.
+    """
+    if _consumer is not None:
+        _consumer.drain()
+
+
+atexit.register(flush)
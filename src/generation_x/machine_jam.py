@@ -1,251 +1,476 @@
-from typing import Dict, Callable
+import functools
+import time
+from array import array
+from queue import SimpleQueue, Empty
+from threading import Thread
+from typing import Dict, Callable, List, Optional, Tuple, Union
 
 import mido
 
-from models import RunSettings
-from music_utils import get_prev_scale_from_circle, get_next_scale_from_circle
-
-tracker_midi_notes = [
-    [104, 96, 88, 80, 72, 64, 56, 48],
-    [105, 97, 89, 81, 73, 65, 57, 49],
-    [106, 98, 90, 82, 74, 66, 58, 50],
-    [107, 99, 91, 83, 75, 67, 59, 51],
-    [108, 100, 92, 84, 76, 68, 60, 52],
-    [109, 101, 93, 85, 77, 69, 61, 53],
-]
-
-velocity = [
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-]
+from jam_display import JamFramebuffer
+from midi_backends import get_output, open_input
+from midi_writer import MidiWriter, PRIORITY_DISPLAY
+from metrics import record_jam_latency
+from models import RunSettings, MusicScale
+from music_utils import get_prev_scale_from_circle, get_next_scale_from_circle, quantize_table
+from log import get_logger
 
+_log = get_logger('jam')
+
+# tracks shown and controlled at once, one pad column, scene button (mute) and dice button per track
+JAM_BANK_SIZE = 8
+# pads of a column, the last played steps of its track
+JAM_ROWS = 8
+
+# pad midi notes of every column of a bank, from the top row
+tracker_midi_notes = [[104 + column - 8 * row for row in range(0, JAM_ROWS)] for column in range(0, JAM_BANK_SIZE)]
+
+# 1 plays, 0 muted, one per track, resized by init_tracks (in place, the list is shared)
 mute = [1, 1, 1, 1, 1, 1]
+# last JAM_ROWS played steps of every track (pad velocities), a ring of JAM_ROWS values per track starting at
+# its head, kept for hidden tracks too so a bank shows its history as soon as it is switched to
+_steps = bytearray(JAM_ROWS * len(mute))
+_step_heads = array('B', bytes(len(mute)))
+# scene buttons A-H: control=8..15
+mute_controls = [8 + column for column in range(0, JAM_BANK_SIZE)]
+# 1-8 buttons: control=0..7
+dice_controls = [column for column in range(0, JAM_BANK_SIZE)]
+# previous / next bank of tracks
+bank_controls = (44, 45)
+
+JAM_ACTIONS = ('transport', 'mute', 'regenerate', 'scale_prev', 'scale_next', 'tempo', 'bank_prev', 'bank_next')
+# actions taking the column of the button
+JAM_COLUMN_ACTIONS = ('mute', 'regenerate')
+
+
+def generate_control_map(mutes: List[int] = mute_controls,
+                         dices: List[int] = dice_controls,
+                         banks: Tuple[int, int] = bank_controls) -> Dict[int, Union[str, Tuple[str, int]]]:
+    """
+    Generates control map of one bank, mute and dice actions take the column of the button, which is the track
+    bank * JAM_BANK_SIZE + column of the current bank.
+    """
+    return {
+        # play on / off: control=94 value=127 / 0
+        94: 'transport',
+        # column unmute / mute: value=127 / 0
+        **{control: ('mute', column) for column, control in enumerate(mutes)},
+        # column triggers
+        **{control: ('regenerate', column) for column, control in enumerate(dices)},
+        # << / >>: control=91 / 92 value=127
+        91: 'scale_prev',
+        92: 'scale_next',
+        # tempo knob: control=42 value=0..127
+        42: 'tempo',
+        banks[0]: 'bank_prev',
+        banks[1]: 'bank_next',
+    }
+
+
+# control -> action or (action, column)
+DEFAULT_CONTROL_MAP: Dict[int, Union[str, Tuple[str, int]]] = generate_control_map()
+
+# knobs, a burst is reduced to its latest value
+COALESCED_ACTIONS = ('tempo',)
+COALESCED_CONTROLS = tuple(control for control, action in DEFAULT_CONTROL_MAP.items() if action in COALESCED_ACTIONS)
+# tempo knob glides the shared clock and every sequence to the new tempo over quarter notes of the clock, 0 jumps
+TEMPO_GLIDE_BEATS = 4.0
+
+_jam_framebuffer = None
+_jam_control = None
+_tracks = len(mute)
+_bank = 0
+
+
+def init_tracks(tracks: int):
+    """
+    Sizes the track state, all tracks play, the first bank is shown.
+    """
+    global _tracks, _bank, _steps, _step_heads
+    mute[:] = [1] * tracks
+    _steps = bytearray(JAM_ROWS * tracks)
+    _step_heads = array('B', bytes(tracks))
+    _tracks = tracks
+    _bank = 0
+
+
+def track_of_column(column: int) -> Optional[int]:
+    """
+    :return: track of the column in the current bank, None when there is none
+    """
+    track = _bank * JAM_BANK_SIZE + column
+    return track if track < _tracks else None
+
+
+def show_step(track: int, value: int):
+    """
+    Records the played step of a track and marks it when the track is in the shown bank, only the display thread
+    sends it.
+    """
+    if track < _tracks:
+        head = _step_heads[track] - 1 if _step_heads[track] else JAM_ROWS - 1
+        _steps[track * JAM_ROWS + head] = 127 if value > 0 else 0
+        _step_heads[track] = head
+    column = track - _bank * JAM_BANK_SIZE
+    if _jam_framebuffer and 0 <= column < JAM_BANK_SIZE:
+        _jam_framebuffer.push(column, value)
+
+
+def track_steps(track: int) -> List[int]:
+    """
+    :return: last played steps of the track, from the newest
+    """
+    head = _step_heads[track]
+    first = track * JAM_ROWS
+    return [_steps[first + (head + row) % JAM_ROWS] for row in range(0, JAM_ROWS)]
+
 
-_outport_jam = None
-try:
-    _outport_jam = mido.open_output('Maschine Jam - 1 Output')
-except Exception:
-    _outport_jam = None
-    print(f'warn: could not open Maschine Jam - 1 Output MIDI output port!')
+def _show_bank(framebuffer: JamFramebuffer):
+    for column, control in enumerate(mute_controls):
+        track = track_of_column(column)
+        framebuffer.set_column(column, track_steps(track) if track is not None else [])
+        framebuffer.set_cc(control, 127 if track is not None and mute[track] else 0)
+
+
+def set_bank(bank: int) -> int:
+    """
+    Shows and controls another bank of tracks.
+
+    :param bank: bank number, clamped to the existing ones
+    :return: shown bank
+    """
+    global _bank
+    _bank = min(max(bank, 0), max(_tracks - 1, 0) // JAM_BANK_SIZE)
+    if _jam_framebuffer:
+        _show_bank(_jam_framebuffer)
+    _log.info('bank %d: tracks %d-%d', _bank, _bank * JAM_BANK_SIZE + 1, min((_bank + 1) * JAM_BANK_SIZE, _tracks))
+    return _bank
 
 
 def get_outport_jam():
-    return _outport_jam
+    """
+    Maschine Jam output, opened on first call, None when not available.
+    """
+    return get_output('jam_output')
 
 
 def register_callback_on_input_jam(callback):
-    midi_in_jam = 'Maschine Jam - 1 Input'
-    try:
-        mido.open_input(name=midi_in_jam, callback=callback)
-        return True
-    except Exception as e:
-        print(f'Could not open input to: {midi_in_jam} or other error: {e}')
-        return False
-
+    return open_input('jam_input', callback)
 
-def refresh_col(outport_jam, midi_notes, values):
-    if not outport_jam:
-        return
 
-    if len(midi_notes) != len(values) and len(values) != 8:
-        return
+def get_jam_framebuffer(fps: float = 30) -> Optional[JamFramebuffer]:
+    """
+    Returns Jam display framebuffer, created on first use, None when Jam output is not available.
 
-    for idx, midi_no in enumerate(midi_notes):
-        msg = mido.Message(
-            'note_on',
-            note=midi_no,
-            velocity=127 if values[idx] > 0 else 0,
-        )
-        outport_jam.send(msg)
+    :param fps: display frame rate, used only when the framebuffer is created
+    """
+    global _jam_framebuffer
+    if _jam_framebuffer is None and get_outport_jam():
+        writer = MidiWriter(get_outport_jam(), desc='MidiWriter Jam', priority=PRIORITY_DISPLAY)
+        _jam_framebuffer = JamFramebuffer(writer, tracker_midi_notes, fps=fps)
+    return _jam_framebuffer
 
 
-def reset_jam(outport_jam):
+def reset_jam(outport_jam, fps: float = 30):
     if not outport_jam:
         return
 
-    # reset visualisation
-    refresh_col(outport_jam, tracker_midi_notes[0], velocity[0])
-    refresh_col(outport_jam, tracker_midi_notes[1], velocity[1])
-    refresh_col(outport_jam, tracker_midi_notes[2], velocity[2])
-    refresh_col(outport_jam, tracker_midi_notes[3], velocity[3])
-    refresh_col(outport_jam, tracker_midi_notes[4], velocity[4])
-    refresh_col(outport_jam, tracker_midi_notes[5], velocity[5])
+    framebuffer = get_jam_framebuffer(fps)
+    # reset visualisation and mute buttons of the shown bank
+    _show_bank(framebuffer)
     # play off
-    msg = mido.Message(
-        'control_change',
-        control=94,
-        value=0,
-    )
-    outport_jam.send(msg)
-    # mute sequences
-    msg = mido.Message(
-        'control_change',
-        control=8,
-        value=0 if mute[0] == 0 else 127,
-    )
-    outport_jam.send(msg)
-    msg = mido.Message(
-        'control_change',
-        control=9,
-        value=0 if mute[1] == 0 else 127,
-    )
-    outport_jam.send(msg)
-    msg = mido.Message(
-        'control_change',
-        control=10,
-        value=0 if mute[2] == 0 else 127,
-    )
-    outport_jam.send(msg)
-    msg = mido.Message(
-        'control_change',
-        control=11,
-        value=0 if mute[3] == 0 else 127,
-    )
-    outport_jam.send(msg)
-    msg = mido.Message(
-        'control_change',
-        control=12,
-        value=0 if mute[4] == 0 else 127,
-    )
-    outport_jam.send(msg)
-    msg = mido.Message(
-        'control_change',
-        control=13,
-        value=0 if mute[5] == 0 else 127,
-    )
-    outport_jam.send(msg)
-
+    framebuffer.set_cc(94, 0)
     # set knob
-    msg = mido.Message(
-        'control_change',
-        control=42,
-        value=63,
-    )
-    outport_jam.send(msg)
-
-
-def register_jam_control(run_settings: RunSettings, functions: Dict[str, Callable]):
-    def jam_in_callback(message: mido.Message):
-        # play on / off
-        # control_change channel=0 control=94 value=127 time=0
-        # control_change channel=0 control=94 value=0 time=0
-        if message.is_cc(94):
-            if message.value == 127:
-                run_settings.sequence_play = True
-            if message.value == 0:
-                run_settings.sequence_play = False
-
-        # channel unmute / mute
-        # A
-        # control_change channel=0 control=8 value=127 time=0
-        # control_change channel=0 control=8 value=0 time=0
-        if message.is_cc(8):
-            if message.value == 127:
-                mute[0] = 1
-            else:
-                mute[0] = 0
-
-        # B
-        # control_change channel=0 control=9 value=127 time=0
-        # control_change channel=0 control=9 value=0 time=0
-        if message.is_cc(9):
-            if message.value == 127:
-                mute[1] = 1
-            else:
-                mute[1] = 0
-
-        # C
-        # control_change channel=0 control=10 value=127 time=0
-        # control_change channel=0 control=10 value=0 time=0
-        if message.is_cc(10):
-            if message.value == 127:
-                mute[2] = 1
-            else:
-                mute[2] = 0
-
-        # D
-        # control_change channel=0 control=11 value=127 time=0
-        # control_change channel=0 control=11 value=0 time=0
-        if message.is_cc(11):
-            if message.value == 127:
-                mute[3] = 1
-            else:
-                mute[3] = 0
-
-        # E
-        # control_change channel=0 control=12 value=127 time=0
-        # control_change channel=0 control=12 value=0 time=0
-        if message.is_cc(12):
-            if message.value == 127:
-                mute[4] = 1
-            else:
-                mute[4] = 0
-
-        # F
-        # control_change channel=0 control=13 value=127 time=0
-        # control_change channel=0 control=13 value=0 time=0
-        if message.is_cc(13):
-            if message.value == 127:
-                mute[5] = 1
-            else:
-                mute[5] = 0
+    framebuffer.set_cc(42, 63)
 
-        # 1,2,3,4,5 triggers
-        # control_change channel=0 control=0..5 value=127 time=0
+    # whole display is sent once, then only changes
+    framebuffer.invalidate()
+    framebuffer.flush()
+    if not framebuffer.is_alive():
+        framebuffer.start()
+
+
+def parse_control_map(values: Optional[List[str]],
+                      control_map: Optional[Dict[int, Union[str, Tuple[str, int]]]] = None
+                      ) -> Dict[int, Union[str, Tuple[str, int]]]:
+    """
+    Parses ['43=tempo', '20=mute:3', '42=none'] command line values: CC=ACTION, CC=ACTION:COLUMN for actions of a
+    column (mute, regenerate) or CC=none which unmaps the control.
+
+    :param values: command line values
+    :param control_map: mapping the values are applied to, DEFAULT_CONTROL_MAP when None (not changed, copied)
+    :return: control -> action or (action, column)
+    """
+    result = dict(DEFAULT_CONTROL_MAP if control_map is None else control_map)
+    for value in values or []:
+        control_part, _, action_part = value.partition('=')
+        name, _, column_part = action_part.partition(':')
         try:
-            if message.is_cc(0):
-                functions.get("regenerate_seq", lambda s: None)(0)
-            if message.is_cc(1):
-                functions.get("regenerate_seq", lambda s: None)(1)
-            if message.is_cc(2):
-                functions.get("regenerate_seq", lambda s: None)(2)
-            if message.is_cc(3):
-                functions.get("regenerate_seq", lambda s: None)(3)
-            if message.is_cc(4):
-                functions.get("regenerate_seq", lambda s: None)(4)
-            if message.is_cc(5):
-                functions.get("regenerate_seq", lambda s: None)(5)
+            control = int(control_part)
+            column = int(column_part) if column_part else None
+        except ValueError:
+            raise ValueError(f'Wrong Jam control: {value}, use CC=ACTION or CC=ACTION:COLUMN') from None
+        if not 0 <= control <= 127:
+            raise ValueError(f'Wrong Jam control: {control}, use 0-127!')
+        if name == 'none':
+            result.pop(control, None)
+            continue
+        if name not in JAM_ACTIONS:
+            raise ValueError(f'Unsupported Jam action: {name}, use one of {JAM_ACTIONS} or none')
+        if name in JAM_COLUMN_ACTIONS:
+            if column is None or not 0 <= column < JAM_BANK_SIZE:
+                raise ValueError(f'Jam action {name} needs a column 0-{JAM_BANK_SIZE - 1}: {value}')
+            result[control] = (name, column)
+        else:
+            result[control] = name
+    return result
+
+
+def coalesced_controls(control_map: Optional[Dict[int, Union[str, Tuple[str, int]]]] = None) -> Tuple[int, ...]:
+    """
+    :return: controls mapped to knob actions, see COALESCED_ACTIONS
+    """
+    if control_map is None:
+        return COALESCED_CONTROLS
+    return tuple(control for control, action in control_map.items() if action in COALESCED_ACTIONS)
+
+
+def _set_quantize_to_scale(run_settings: RunSettings, music_scale: MusicScale):
+    """
+    Switches live quantization, the table is precomputed so this only swaps the table reference used by the
+    timing critical send path.
+    """
+    if music_scale == run_settings.music_scale:
+        run_settings.quantize_table = None
+        run_settings.quantize_to_scale = None
+    else:
+        run_settings.quantize_table = quantize_table(music_scale)
+        run_settings.quantize_to_scale = music_scale
+
+
+def build_control_table(run_settings: RunSettings,
+                        functions: Dict[str, Callable],
+                        control_map: Optional[Dict[int, Union[str, Tuple[str, int]]]] = None) -> List[Optional[Callable]]:
+    """
+    Builds CC -> handler dispatch table, incoming control change is handled by table[control](value).
+
+    :param run_settings: run settings controlled by Jam
+    :param functions: named functions triggered by Jam buttons and knobs, e.g. regenerate_seq, set_tempo_ratio
+    :param control_map: control -> action or (action, column), actions: see JAM_ACTIONS, DEFAULT_CONTROL_MAP when None
+    :return: 128 handlers, None for ignored controls
+    """
+    def transport(_, value: int):
+        if value == 127:
+            run_settings.transport.play()
+        if value == 0:
+            run_settings.transport.stop()
+
+    def mute_sequence(column: int, value: int):
+        seq_no = track_of_column(column)
+        if seq_no is None:
+            return
+        if value == 127:
+            mute[seq_no] = 1
+        else:
+            mute[seq_no] = 0
+            functions.get("notes_off", lambda s: None)(seq_no)
+
+    def regenerate(column: int, _):
+        seq_no = track_of_column(column)
+        if seq_no is None:
+            return
+        try:
+            functions.get("regenerate_seq", lambda s: None)(seq_no)
         except Exception as e:
-            print(e)
-
-        # <<
-        # control_change channel=0 control=91 value=127 time=0
-        # control_change channel=0 control=91 value=0 time=0
-        if message.is_cc(91):
-            if message.value == 127:
-                run_settings.quantize_to_scale = get_prev_scale_from_circle(
-                    run_settings.music_scale if not run_settings.quantize_to_scale else run_settings.quantize_to_scale
-                )
-                print(f'<< {run_settings.quantize_to_scale}')
-                if run_settings.quantize_to_scale == run_settings.music_scale:
-                    run_settings.quantize_to_scale = None
-
-        # >>
-        # control_change channel=0 control=92 value=127 time=0
-        # control_change channel=0 control=92 value=0 time=0
-        if message.is_cc(92):
-            if message.value == 127:
-                run_settings.quantize_to_scale = get_next_scale_from_circle(
-                    run_settings.music_scale if not run_settings.quantize_to_scale else run_settings.quantize_to_scale
-                )
-                print(f'>> {run_settings.quantize_to_scale}')
-                if run_settings.quantize_to_scale == run_settings.music_scale:
-                    run_settings.quantize_to_scale = None
-
-        # tempo (63 = 0%) (0 = -X%) (127 = +X%)
-        # control_change channel=0 control=42 value=0 time=0
-        for seq in run_settings.sequencers:
-            if not seq:
-                continue
-            if message.is_cc(42):
-                value = message.value - 63
-                value_perc = value * 100 / 63
-                new_tempo = seq.original_tempo + int(value_perc * seq.original_tempo / 100)
-                seq.tempo = new_tempo
-                print(f'{seq.desc} - {message.value} - {value} -> {new_tempo} | {seq.original_tempo}')
-
-    return register_callback_on_input_jam(jam_in_callback)
+            _log.error('%s', e)
+
+    def bank_prev(_, value: int):
+        if value == 127:
+            set_bank(_bank - 1)
+
+    def bank_next(_, value: int):
+        if value == 127:
+            set_bank(_bank + 1)
+
+    def scale_prev(_, value: int):
+        if value == 127:
+            _set_quantize_to_scale(run_settings, get_prev_scale_from_circle(
+                run_settings.music_scale if not run_settings.quantize_to_scale else run_settings.quantize_to_scale
+            ))
+            _log.info('<< %s', run_settings.quantize_to_scale)
+
+    def scale_next(_, value: int):
+        if value == 127:
+            _set_quantize_to_scale(run_settings, get_next_scale_from_circle(
+                run_settings.music_scale if not run_settings.quantize_to_scale else run_settings.quantize_to_scale
+            ))
+            _log.info('>> %s', run_settings.quantize_to_scale)
+
+    def tempo(_, value: int):
+        # (63 = 0%) (0 = -X%) (127 = +X%)
+        value_perc = (value - 63) * 100 / 63
+        clock_tempo = functions.get("set_tempo_ratio", lambda r, b: None)(1 + value_perc / 100, TEMPO_GLIDE_BEATS)
+        if clock_tempo is not None:
+            _log.info('tempo %d (%+d%%): clock %sbpm', value, value_perc, round(clock_tempo, 2))
+
+    actions = {
+        'transport': transport,
+        'mute': mute_sequence,
+        'regenerate': regenerate,
+        'scale_prev': scale_prev,
+        'scale_next': scale_next,
+        'tempo': tempo,
+        'bank_prev': bank_prev,
+        'bank_next': bank_next,
+    }
+
+    table: List[Optional[Callable]] = [None] * 128
+    for control, action in (DEFAULT_CONTROL_MAP if control_map is None else control_map).items():
+        name, arg = (action, 0) if isinstance(action, str) else action
+        if name not in actions:
+            raise ValueError(f'Unsupported Jam action: {name}, use one of {JAM_ACTIONS}')
+        table[control] = functools.partial(actions[name], arg)
+    return table
+
+
+class JamControl(Thread):
+
+    def __init__(self,
+                 table: List[Optional[Callable]],
+                 dispatch: Callable = None,
+                 coalesced: Tuple[int, ...] = COALESCED_CONTROLS,
+                 control_period: float = 0.02,
+                 desc='JamControl'):
+        """
+        Handles Jam input off the MIDI input thread.
+
+        The input callback only queues the message, this thread looks its handler up in the dispatch table.
+        Bursts of coalesced controls (knobs) are reduced to their latest value, applied at most once per control
+        period.
+
+        :param table: dispatch table, see build_control_table
+        :param dispatch: optional function(callback, *args) used to run handlers in another thread or event loop
+        :param coalesced: controls of which only the latest value per control period is applied
+        :param control_period: seconds between two applied values of a coalesced control
+        :param desc: description
+        """
+        super().__init__(name=desc)
+        self._table = table
+        self._dispatch = dispatch
+        self._coalesced = frozenset(coalesced)
+        self._control_period = control_period
+        self._queue = SimpleQueue()
+        # control -> (value, received) of the latest not applied value
+        self._pending: Dict[int, Tuple[int, float]] = {}
+        self._applied_at: Dict[int, float] = {}
+        self.received = 0
+        self.coalesced = 0
+        self.daemon = True
+
+    def put(self, message: mido.Message):
+        """
+        Called from the MIDI input thread.
+        """
+        self._queue.put((message, time.monotonic()))
+
+    def stop(self):
+        self._queue.put(None)
+
+    def _handle(self, handler: Callable, value: int, received: float):
+        try:
+            handler(value)
+        except Exception as e:
+            _log.error('Jam control failed: %s', e)
+        record_jam_latency(received)
+
+    def _apply(self, handler: Callable, value: int, received: float):
+        if self._dispatch:
+            self._dispatch(self._handle, handler, value, received)
+        else:
+            self._handle(handler, value, received)
+
+    def _on_message(self, message: mido.Message, received: float):
+        if message.type != 'control_change':
+            return
+        handler = self._table[message.control]
+        if not handler:
+            return
+        self.received = self.received + 1
+        if message.control in self._coalesced:
+            if message.control in self._pending:
+                self.coalesced = self.coalesced + 1
+            self._pending[message.control] = (message.value, received)
+        else:
+            self._apply(handler, message.value, received)
+
+    def _apply_pending(self) -> Optional[float]:
+        """
+        :return: seconds until the next pending value can be applied, None when nothing is pending
+        """
+        now = time.monotonic()
+        wait = None
+        for control, (value, received) in list(self._pending.items()):
+            due = self._applied_at.get(control, 0.0) + self._control_period
+            if now >= due:
+                del self._pending[control]
+                self._applied_at[control] = now
+                self._apply(self._table[control], value, received)
+            else:
+                wait = due - now if wait is None else min(wait, due - now)
+        return wait
+
+    def run(self):
+        wait = None
+        while True:
+            try:
+                item = self._queue.get(timeout=wait)
+            except Empty:
+                item = ()
+            if item is None:
+                return
+            if item:
+                self._on_message(*item)
+                # take the whole burst at once
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except Empty:
+                        break
+                    if item is None:
+                        return
+                    self._on_message(*item)
+            wait = self._apply_pending() if self._pending else None
+
+
+def register_jam_control(run_settings: RunSettings,
+                         functions: Dict[str, Callable],
+                         dispatch: Callable = None,
+                         control_map: Optional[Dict[int, Union[str, Tuple[str, int]]]] = None,
+                         control_period: float = 0.02) -> bool:
+    """
+    Registers Maschine Jam input handling.
+
+    :param run_settings: run settings controlled by Jam
+    :param functions: named functions triggered by Jam buttons and knobs, e.g. regenerate_seq, set_tempo_ratio
+    :param dispatch: optional function(callback, *args) used to hand the message over to another thread or event
+                     loop instead of handling it in the Jam control thread
+    :param control_map: control -> action mapping, DEFAULT_CONTROL_MAP when None
+    :param control_period: seconds between two applied values of a knob
+    :return: True if Jam input was registered
+    """
+    global _jam_control
+    jam_control = JamControl(build_control_table(run_settings, functions, control_map), dispatch=dispatch,
+                             coalesced=coalesced_controls(control_map), control_period=control_period)
+    if not register_callback_on_input_jam(jam_control.put):
+        return False
+    jam_control.start()
+    _jam_control = jam_control
+    return True
+
+
+def stop_jam_control():
+    global _jam_control
+    if _jam_control:
+        _jam_control.stop()
+        _log.debug('Jam controls received %d, coalesced %d', _jam_control.received, _jam_control.coalesced)
+        _jam_control = None
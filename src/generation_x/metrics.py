@@ -0,0 +1,247 @@
+import time
+from array import array
+from threading import Thread, Event
+from typing import Dict, List, Optional
+
+from log import get_logger
+
+_log = get_logger('metrics')
+
+
+class LatencyHistogram:
+
+    def __init__(self, sub_bucket_bits: int = 5, max_bits: int = 32):
+        """
+        HDR-style log-linear histogram of latencies in microseconds.
+
+        Values below 2 ** sub_bucket_bits are counted exactly, every higher power of two range is split into
+        2 ** sub_bucket_bits linear buckets, so the relative error stays below 1 / 2 ** sub_bucket_bits
+        (~3 % by default) from microseconds up to over an hour. Recording is O(1) and allocation free.
+
+        Example:
+        >>> histogram = LatencyHistogram()
+        >>> for ms in range(1, 101):
+        ...     histogram.record(ms / 1000)
+        >>> histogram.count, round(histogram.percentile(50) * 1000), round(histogram.max * 1000)
+        (100, 50, 100)
+
+        :param sub_bucket_bits: precision, linear buckets per power of two
+        :param max_bits: largest recordable value is 2 ** max_bits microseconds, larger values are clamped
+        """
+        self._sub_bucket_bits = sub_bucket_bits
+        self._sub_buckets = 1 << sub_bucket_bits
+        self._max_value = (1 << max_bits) - 1
+        self._counts = array('Q', bytes(8 * (max_bits - sub_bucket_bits + 1) * self._sub_buckets))
+        self.count = 0
+        self.early = 0
+        self.max = 0.0
+        self._total = 0.0
+
+    def _index(self, value: int) -> int:
+        if value < self._sub_buckets:
+            return value
+        exponent = value.bit_length() - self._sub_bucket_bits - 1
+        return (exponent + 1) * self._sub_buckets + (value >> exponent) - self._sub_buckets
+
+    def _bucket_value(self, idx: int) -> int:
+        """
+        Highest value counted in bucket.
+        """
+        if idx < self._sub_buckets:
+            return idx
+        exponent = idx // self._sub_buckets - 1
+        return ((idx % self._sub_buckets + self._sub_buckets + 1) << exponent) - 1
+
+    def record(self, seconds: float):
+        """
+        :param seconds: latency, negative (early) values are counted as 0 and in early
+        """
+        if seconds < 0:
+            self.early = self.early + 1
+            seconds = 0.0
+        self._counts[self._index(min(int(seconds * 1_000_000), self._max_value))] += 1
+        self.count = self.count + 1
+        self._total = self._total + seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self) -> float:
+        return self._total / self.count if self.count else 0.0
+
+    def percentile(self, percentile: float) -> float:
+        """
+        :param percentile: 0-100
+        :return: latency in seconds
+        """
+        if not self.count:
+            return 0.0
+        threshold = max(1, round(self.count * percentile / 100))
+        seen = 0
+        for idx, bucket_count in enumerate(self._counts):
+            seen = seen + bucket_count
+            if seen >= threshold:
+                return min(self._bucket_value(idx) / 1_000_000, self.max)
+        return self.max
+
+    def reset(self):
+        self._counts = array('Q', bytes(len(self._counts) * 8))
+        self.count = 0
+        self.early = 0
+        self.max = 0.0
+        self._total = 0.0
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class SequenceTiming:
+
+    def __init__(self, desc: str, steps_in_bar: int):
+        """
+        Timing of one sequence: every step records when it was scheduled, when the engine dequeued it (step called)
+        and when its note was sent by the port writer.
+
+        Drift is the change of the dequeue lateness from one bar start to the next, a drift-free engine stays
+        around zero, a drifting one accumulates it bar after bar.
+
+        :param desc: sequence description
+        :param steps_in_bar: steps in one bar
+        """
+        self.desc = desc
+        self.steps_in_bar = steps_in_bar
+        self.dequeued = LatencyHistogram()
+        self.sent = LatencyHistogram()
+        self.scheduled: Optional[float] = None
+        self._step_no = 0
+        self._bar_lateness: Optional[float] = None
+        self.bars = 0
+        self.max_drift = 0.0
+        self._total_drift = 0.0
+
+    def record_dequeued(self, scheduled: float, dequeued: float):
+        self.scheduled = scheduled
+        lateness = dequeued - scheduled
+        self.dequeued.record(lateness)
+
+        if self._step_no % self.steps_in_bar == 0:
+            if self._bar_lateness is not None:
+                drift = lateness - self._bar_lateness
+                self.bars = self.bars + 1
+                self._total_drift = self._total_drift + drift
+                if abs(drift) > abs(self.max_drift):
+                    self.max_drift = drift
+            self._bar_lateness = lateness
+        self._step_no = self._step_no + 1
+
+    def record_sent(self, scheduled: float, sent: float):
+        self.sent.record(sent - scheduled)
+
+    def restart(self):
+        """
+        Playback restarted, drift is measured from the new start.
+        """
+        self._step_no = 0
+        self._bar_lateness = None
+
+    @property
+    def mean_drift(self) -> float:
+        return self._total_drift / self.bars if self.bars else 0.0
+
+    def summary(self) -> dict:
+        return {
+            'dequeued': self.dequeued.summary(),
+            'sent': self.sent.summary(),
+            'drift_per_bar_ms': {
+                'bars': self.bars,
+                'mean': round(self.mean_drift * 1000, 3),
+                'max': round(self.max_drift * 1000, 3),
+            },
+        }
+
+
+_sequences: Dict[int, SequenceTiming] = {}
+jam_latency = LatencyHistogram()
+_enabled = False
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def sequence_timing(seq_no: int, desc: str, steps_in_bar: int) -> Optional[SequenceTiming]:
+    """
+    Returns timing of a sequence, None when instrumentation is not enabled (nothing is recorded then).
+    """
+    if not _enabled:
+        return None
+    if seq_no not in _sequences:
+        _sequences[seq_no] = SequenceTiming(desc, steps_in_bar)
+    return _sequences[seq_no]
+
+
+def record_jam_latency(received: float):
+    """
+    :param received: time.monotonic() at which Jam message arrived, the action is done now
+    """
+    if _enabled:
+        jam_latency.record(time.monotonic() - received)
+
+
+def summary_lines() -> List[str]:
+    lines = []
+    for seq_no, timing in sorted(_sequences.items()):
+        summary = timing.summary()
+        lines.append(
+            f'{timing.desc} dequeued p50/p99/max {summary["dequeued"]["p50_ms"]}/{summary["dequeued"]["p99_ms"]}/'
+            f'{summary["dequeued"]["max_ms"]}ms, sent p50/p99/max {summary["sent"]["p50_ms"]}/'
+            f'{summary["sent"]["p99_ms"]}/{summary["sent"]["max_ms"]}ms, '
+            f'drift per bar mean/max {summary["drift_per_bar_ms"]["mean"]}/{summary["drift_per_bar_ms"]["max"]}ms '
+            f'({summary["dequeued"]["count"]} steps)'
+        )
+    if jam_latency.count:
+        jam = jam_latency.summary()
+        lines.append(f'Jam input to action p50/p99/max {jam["p50_ms"]}/{jam["p99_ms"]}/{jam["max_ms"]}ms '
+                     f'({jam["count"]} messages)')
+    return lines
+
+
+def summary() -> dict:
+    return {
+        'sequences': {timing.desc: timing.summary() for _, timing in sorted(_sequences.items())},
+        'jam': jam_latency.summary(),
+    }
+
+
+def log_summary():
+    for line in summary_lines():
+        _log.info('timing: %s', line)
+
+
+class TimingReporter(Thread):
+
+    def __init__(self, interval: float, desc='TimingReporter'):
+        """
+        Logs timing summary every interval seconds.
+        """
+        super().__init__(name=desc)
+        self._interval = interval
+        self._stopped = Event()
+        self.daemon = True
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            log_summary()
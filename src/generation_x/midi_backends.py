@@ -0,0 +1,252 @@
+import time
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+import mido
+
+from log import get_logger
+
+_log = get_logger('midi')
+
+# configurable port names, see configure_ports
+PORT_NAMES = {
+    'elektron_output': 'Elektron Model:Cycles',
+    'elektron_input': 'Elektron Model:Cycles',
+    'jam_output': 'Maschine Jam - 1 Output',
+    'jam_input': 'Maschine Jam - 1 Input',
+}
+
+
+class MidiBackend(ABC):
+    """
+    Opens MIDI input and output ports, every port is opened only when it is first needed.
+    Backends implement open_output and open_input, a backend missing either cannot be created.
+    """
+
+    name = 'base'
+
+    def output_names(self) -> List[str]:
+        return []
+
+    def input_names(self) -> List[str]:
+        return []
+
+    @abstractmethod
+    def open_output(self, name: str):
+        """
+        :return: port with send(msg), raises OSError when it cannot be opened
+        """
+
+    @abstractmethod
+    def open_input(self, name: str, callback: Callable[[mido.Message], None]):
+        """
+        :return: port calling callback on every received message, raises OSError when it cannot be opened
+        """
+
+    def close(self):
+        pass
+
+
+class RtMidiBackend(MidiBackend):
+    """
+    Hardware ports through the mido backend (rtmidi by default).
+    """
+
+    name = 'rtmidi'
+
+    def output_names(self) -> List[str]:
+        return mido.get_output_names()
+
+    def input_names(self) -> List[str]:
+        return mido.get_input_names()
+
+    def open_output(self, name: str):
+        return mido.open_output(name)
+
+    def open_input(self, name: str, callback: Callable[[mido.Message], None]):
+        return mido.open_input(name=name, callback=callback)
+
+
+class NullOutput:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.sent = 0
+
+    def send(self, msg: mido.Message):
+        self.sent = self.sent + 1
+
+
+class NullBackend(MidiBackend):
+    """
+    Every output accepts and drops messages, no input ever sends anything.
+    """
+
+    name = 'null'
+
+    def open_output(self, name: str):
+        return NullOutput(name)
+
+    def open_input(self, name: str, callback: Callable[[mido.Message], None]):
+        raise OSError(f'{self.name} backend has no inputs')
+
+
+class RecordingOutput:
+
+    def __init__(self, name: str, records: list):
+        self.name = name
+        self._records = records
+
+    def send(self, msg: mido.Message):
+        self._records.append((time.monotonic(), self.name, msg))
+
+
+class RecorderBackend(MidiBackend):
+    """
+    Keeps every sent message in memory as (time.monotonic(), port name, message).
+    """
+
+    name = 'recorder'
+
+    def __init__(self):
+        self.records: List[Tuple[float, str, mido.Message]] = []
+
+    def open_output(self, name: str):
+        return RecordingOutput(name, self.records)
+
+    def open_input(self, name: str, callback: Callable[[mido.Message], None]):
+        raise OSError(f'{self.name} backend has no inputs')
+
+    def messages(self, port_name: Optional[str] = None) -> List[mido.Message]:
+        return [msg for _, name, msg in self.records if port_name is None or name == port_name]
+
+
+class FileBackend(RecorderBackend):
+    """
+    Records sent messages and writes them on close into a Standard MIDI File, one track per output port.
+    """
+
+    name = 'file'
+
+    def __init__(self, path: str, tempo: float = 120, ticks_per_beat: int = 480):
+        super().__init__()
+        self._path = path
+        self._tempo = mido.bpm2tempo(tempo)
+        self._ticks_per_beat = ticks_per_beat
+
+    def close(self):
+        if not self.records:
+            return
+
+        started = self.records[0][0]
+        midi_file = mido.MidiFile(type=1, ticks_per_beat=self._ticks_per_beat)
+        conductor = mido.MidiTrack()
+        conductor.append(mido.MetaMessage('set_tempo', tempo=self._tempo, time=0))
+        midi_file.tracks.append(conductor)
+
+        tracks: Dict[str, Tuple[mido.MidiTrack, list]] = {}
+        for at, port_name, msg in self.records:
+            if port_name not in tracks:
+                track = mido.MidiTrack()
+                track.append(mido.MetaMessage('track_name', name=port_name, time=0))
+                midi_file.tracks.append(track)
+                tracks[port_name] = (track, [0])
+            track, prev_tick = tracks[port_name]
+            tick = round(mido.second2tick(at - started, self._ticks_per_beat, self._tempo))
+            track.append(msg.copy(time=max(tick - prev_tick[0], 0)))
+            prev_tick[0] = max(tick, prev_tick[0])
+
+        midi_file.save(self._path)
+        _log.info('%d recorded messages written to %s', len(self.records), self._path)
+
+
+BACKENDS = ('rtmidi', 'null', 'recorder', 'file')
+
+_backend: Optional[MidiBackend] = None
+_outputs: Dict[str, object] = {}
+_inputs: List[object] = []
+_lock = Lock()
+
+
+def set_backend(backend: MidiBackend):
+    """
+    Switches backend, outputs opened with the previous one are forgotten and its inputs are closed.
+    """
+    global _backend
+    with _lock:
+        for port in _inputs:
+            try:
+                port.close()
+            except Exception as e:
+                _log.warn('could not close MIDI input port %s! (%s)', getattr(port, 'name', port), e)
+        _inputs.clear()
+        _backend = backend
+        _outputs.clear()
+
+
+def create_backend(name: str, path: Optional[str] = None) -> MidiBackend:
+    if name == 'rtmidi':
+        return RtMidiBackend()
+    if name == 'null':
+        return NullBackend()
+    if name == 'recorder':
+        return RecorderBackend()
+    if name == 'file':
+        return FileBackend(path if path else 'generation-x-session.mid')
+    raise ValueError(f'Unsupported MIDI backend: {name}, use one of {BACKENDS}')
+
+
+def get_backend() -> MidiBackend:
+    global _backend
+    if _backend is None:
+        _backend = RtMidiBackend()
+    return _backend
+
+
+def configure_ports(**port_names: Optional[str]):
+    """
+    Overrides port names, e.g. configure_ports(elektron_output='Model:Cycles MIDI 1'), None keeps the default.
+    """
+    for key, name in port_names.items():
+        if key not in PORT_NAMES:
+            raise ValueError(f'Unknown port: {key}, use one of {list(PORT_NAMES.keys())}')
+        if name:
+            PORT_NAMES[key] = name
+
+
+def get_output(port: str):
+    """
+    Opens output port on first use, further calls return the same port.
+
+    :param port: key of PORT_NAMES
+    :return: port or None when it could not be opened (warned once)
+    """
+    with _lock:
+        if port not in _outputs:
+            name = PORT_NAMES[port]
+            try:
+                _outputs[port] = get_backend().open_output(name)
+            except Exception as e:
+                _log.warn('could not open %s MIDI output port! (%s)', name, e)
+                _outputs[port] = None
+        return _outputs[port]
+
+
+def open_input(port: str, callback: Callable[[mido.Message], None]) -> bool:
+    """
+    :param port: key of PORT_NAMES
+    :param callback: called with every received message
+    :return: True if the input was opened
+    """
+    name = PORT_NAMES[port]
+    try:
+        _inputs.append(get_backend().open_input(name, callback))
+        return True
+    except Exception as e:
+        _log.warn('Could not open input to: %s or other error: %s', name, e)
+        return False
+
+
+def close():
+    get_backend().close()
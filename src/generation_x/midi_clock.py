@@ -0,0 +1,312 @@
+import math
+import time
+from threading import Thread, Lock
+from typing import List, Optional
+
+import mido
+
+from midi_backends import open_input
+from midi_writer import MidiWriter, PRIORITY_CLOCK
+from timing_plan import TempoRamp
+from transport import Transport, TransportState
+from log import get_logger
+
+_log = get_logger('midi')
+
+PPQN = 24
+CLOCK_MODES = ('off', 'master', 'slave')
+# song position pointer counts MIDI beats (16th notes)
+CLOCKS_PER_SONG_POSITION = 6
+MAX_SONG_POSITION = 16383
+
+
+class ClockMaster(Thread):
+
+    def __init__(self,
+                 writer: MidiWriter,
+                 transport: Transport,
+                 tempo: float,
+                 ppqn: int = PPQN,
+                 lookahead: float = 0.005,
+                 desc='ClockMaster'):
+        """
+        Sends MIDI clock, start / continue / stop and song position following the transport.
+
+        Clock ticks are absolute deadlines from the play start (no accumulated sleep error), every tick is queued in
+        the port writer lookahead seconds before it is due with its exact due time and the highest priority.
+        Stop and pause both send stop, play after a pause continues from the song position.
+
+        Tempo changes and ramps may come from any thread, they are published as one (tempo, ramp) tuple and picked
+        up from the next tick, ramp ticks are closed form beat times of the ramp (see timing_plan.TempoRamp).
+
+        :param writer: writer of the output port
+        :param transport: play / pause / stop state
+        :param tempo: clock tempo, also the base tempo sequence tempos are ratios of
+        :param ppqn: clocks per quarter note
+        :param lookahead: seconds, ticks are handed to the writer this early
+        :param desc: description
+        """
+        super().__init__(name=desc)
+        self._writer = writer
+        self._transport = transport
+        self._ppqn = ppqn
+        self._lookahead = lookahead
+        # (tempo, ramp to it or None), replaced as a whole
+        self._tempo_state = (tempo, None)
+        # tempo of the last sent tick, follows a running ramp
+        self._tempo = tempo
+        self._lock = Lock()
+        self._running = False
+        # clocks sent since the last rewind
+        self.clocks = 0
+        self.base_tempo = tempo
+        self.desc = desc
+
+        self._transport.add_listener(self._on_transport_state)
+        self.daemon = True
+
+    @property
+    def tempo(self) -> float:
+        return self._tempo
+
+    @tempo.setter
+    def tempo(self, tempo: float):
+        """
+        Changes tempo from the next tick, a running ramp is cancelled.
+        """
+        with self._lock:
+            self._tempo_state = (tempo, None)
+
+    def ramp_to(self, tempo: float, beats: float, curve: str = 'linear'):
+        """
+        Glides from the current tempo to tempo over beats (quarter notes), starting with the next tick.
+        """
+        if beats <= 0 or tempo == self._tempo:
+            self.tempo = tempo
+            return
+        ramp = TempoRamp(self._tempo, tempo, beats, curve)
+        with self._lock:
+            self._tempo_state = (tempo, ramp)
+
+    def _send(self, msg: mido.Message, at: Optional[float] = None):
+        self._writer.send(msg, at=at, priority=PRIORITY_CLOCK)
+
+    def _on_transport_state(self, state: TransportState):
+        with self._lock:
+            if state != TransportState.PLAYING and self._running:
+                self._running = False
+                self._send(mido.Message('stop'))
+
+    def run(self):
+        _log.info('%s %sbpm, %d ppqn', self.desc, round(self._tempo, 2), self._ppqn)
+        rewinds = None
+        while self._transport.wait_for_play():
+            epoch = self._transport.epoch
+            with self._lock:
+                if self._transport.rewinds != rewinds:
+                    rewinds = self._transport.rewinds
+                    self.clocks = 0
+                self._send(mido.Message('songpos', pos=min(self.clocks // CLOCKS_PER_SONG_POSITION, MAX_SONG_POSITION)))
+                self._send(mido.Message('start' if self.clocks == 0 else 'continue'))
+                self._running = True
+                # a ramp interrupted by pause or stop is not resumed, play continues at its target tempo
+                self._tempo_state = (self._tempo_state[0], None)
+
+            deadline = time.monotonic()
+            ramp = None
+            ramp_start = deadline
+            ramp_clocks = 0
+            while self._transport.sleep_until(deadline - self._lookahead) and self._transport.epoch == epoch:
+                self._send(mido.Message('clock'), at=deadline)
+                self.clocks = self.clocks + 1
+
+                tempo_state = self._tempo_state
+                tempo, next_ramp = tempo_state
+                if next_ramp is not ramp:
+                    # new ramp starts at the tick just sent
+                    ramp, ramp_start, ramp_clocks = next_ramp, deadline, 0
+                if ramp is None:
+                    self._tempo = tempo
+                    deadline = deadline + 60 / (tempo * self._ppqn)
+                    continue
+
+                ramp_clocks = ramp_clocks + 1
+                beat = ramp_clocks / self._ppqn
+                deadline = ramp_start + ramp.time_at(beat)
+                self._tempo = ramp.tempo_at(beat)
+                if beat >= ramp.beats:
+                    with self._lock:
+                        # unless a newer change arrived meanwhile
+                        if self._tempo_state is tempo_state:
+                            self._tempo_state = (ramp.target_tempo, None)
+
+
+class ClockSlave:
+
+    def __init__(self,
+                 transport: Transport,
+                 sequencers: list,
+                 base_tempo: float,
+                 ppqn: int = PPQN,
+                 bandwidth: float = 0.5,
+                 update_clocks: int = CLOCKS_PER_SONG_POSITION,
+                 min_change: float = 0.1):
+        """
+        Follows incoming MIDI clock: start / continue / stop drive the transport, the clock drives tempo of all
+        sequencers.
+
+        Tick times are filtered by a second order delay locked loop (a software PLL), its period estimate is
+        smooth against the jitter of single ticks and locks to tempo changes within a few beats. Every sequencer
+        keeps its tempo as a multiple of the clock: tempo = clock tempo * original tempo / base tempo, so ratios
+        from tempo_fn are preserved. Sequencers glide to every new tempo over the update interval (a ramp, which
+        replaces the previous one), so the tempo follows the clock without steps.
+
+        :param transport: play / pause / stop state
+        :param sequencers: sequencers driven by the clock, the list can grow while running
+        :param base_tempo: tempo from which the sequence tempos were generated
+        :param ppqn: clocks per quarter note
+        :param bandwidth: loop bandwidth in Hz, lower is smoother but slower to lock
+        :param update_clocks: sequencer tempos are updated at most every update_clocks ticks
+        :param min_change: bpm, smaller tempo changes are not applied to sequencers
+        """
+        self._transport = transport
+        self._sequencers = sequencers
+        self._base_tempo = base_tempo
+        self._ppqn = ppqn
+        self._bandwidth = bandwidth
+        self._update_clocks = update_clocks
+        self._min_change = min_change
+        # DLL state: predicted time of the next tick, its period and loop coefficients
+        self._next_tick: Optional[float] = None
+        self._period: Optional[float] = None
+        self._b = 0.0
+        self._c = 0.0
+        self._clocks = 0
+        self.applied_tempo: Optional[float] = None
+        self.ticks = 0
+        self.relocks = 0
+
+    @property
+    def tempo(self) -> Optional[float]:
+        """
+        Smoothed clock tempo, None until locked.
+        """
+        return 60 / (self._period * self._ppqn) if self._period else None
+
+    def _lock_to(self, period: float, now: float):
+        omega = 2 * math.pi * self._bandwidth * period
+        self._b = math.sqrt(2) * omega
+        self._c = omega * omega
+        self._period = period
+        self._next_tick = now + period
+
+    def _on_clock(self, received: float):
+        self.ticks = self.ticks + 1
+        if self._next_tick is None:
+            self._next_tick = received
+            return
+        if self._period is None:
+            self._lock_to(received - self._next_tick, received)
+            return
+        if received - self._next_tick > 4 * self._period:
+            # clock paused, lock again from the next interval
+            self.relocks = self.relocks + 1
+            self._next_tick = received
+            self._period = None
+            return
+
+        error = received - self._next_tick
+        self._next_tick = self._next_tick + self._period + self._b * error
+        self._period = self._period + self._c * error
+
+        self._clocks = self._clocks + 1
+        if self._clocks >= self._update_clocks:
+            self._clocks = 0
+            self._apply_tempo()
+
+    def _apply_tempo(self):
+        tempo = self.tempo
+        if not tempo or (self.applied_tempo and abs(tempo - self.applied_tempo) < self._min_change):
+            return
+        self.applied_tempo = tempo
+        beats = self._update_clocks / self._ppqn
+        for sequencer in list(self._sequencers):
+            if sequencer:
+                ratio = sequencer.original_tempo / self._base_tempo
+                sequencer.ramp_tempo(tempo * ratio, beats=beats * ratio)
+        _log.debug('clock %sbpm', round(tempo, 2))
+
+    def on_message(self, message: mido.Message, received: Optional[float] = None):
+        """
+        Input callback, called from the MIDI input thread.
+
+        :param message: received message
+        :param received: time.monotonic() at which the message arrived, now when not provided
+        """
+        if message.type == 'clock':
+            self._on_clock(time.monotonic() if received is None else received)
+        elif message.type == 'start':
+            self._clocks = 0
+            self._transport.stop()
+            self._transport.play()
+        elif message.type == 'continue':
+            self._transport.play()
+        elif message.type == 'stop':
+            self._transport.pause()
+
+
+def set_tempo_ratio(clock, sequencers: List, base_tempo: float, ratio: float, beats: float = 0.0,
+                    curve: str = 'linear') -> Optional[float]:
+    """
+    Sets the shared clock tempo to base_tempo * ratio, every sequencer follows with its own tempo ratio to the clock
+    (tempo = clock tempo * original tempo / base tempo). The master clock and all sequencers glide over the same
+    time: beats of the clock are beats * original tempo / base tempo of a sequencer.
+
+    A slave follows the incoming clock, its tempo is not changed.
+
+    :param clock: ClockMaster, ClockSlave or None
+    :param sequencers: sequencers, None entries are skipped
+    :param base_tempo: tempo from which the sequence tempos were generated
+    :param ratio: new clock tempo / base tempo, the clock tempo is at least 1bpm
+    :param beats: glide length in quarter notes of the clock, 0 jumps
+    :param curve: linear or exponential
+    :return: new clock tempo, None when following a clock slave
+    """
+    if isinstance(clock, ClockSlave):
+        _log.info('tempo follows the MIDI clock, change ignored')
+        return None
+    tempo = max(base_tempo * ratio, 1)
+    if clock:
+        clock.ramp_to(tempo, beats, curve)
+    for sequencer in list(sequencers):
+        if sequencer:
+            sequencer_ratio = sequencer.original_tempo / base_tempo
+            sequencer.ramp_tempo(tempo * sequencer_ratio, curve=curve, beats=beats * sequencer_ratio)
+    return tempo
+
+
+def start_clock(mode: str,
+                writer: Optional[MidiWriter],
+                transport: Transport,
+                sequencers: List,
+                base_tempo: float):
+    """
+    Starts MIDI clock in master or slave mode, slave listens on the elektron_input port.
+
+    :return: ClockMaster, ClockSlave or None when off or not possible
+    """
+    if mode == 'master':
+        if not writer:
+            _log.warn('MIDI clock master needs the Elektron output')
+            return None
+        clock = ClockMaster(writer, transport, base_tempo)
+        clock.start()
+        return clock
+    if mode == 'slave':
+        clock = ClockSlave(transport, sequencers, base_tempo)
+        if not open_input('elektron_input', lambda message: clock.on_message(message, time.monotonic())):
+            return None
+        return clock
+    if mode != 'off':
+        raise ValueError(f'Unsupported MIDI clock mode: {mode}, use one of {CLOCK_MODES}')
+    return None
@@ -1,4 +1,4 @@
-from copy import deepcopy
+from types import MappingProxyType
 from typing import Optional
 
 from models import Note
@@ -162,8 +162,25 @@ def _full_note_name(note_name: str, octave: int):
     return f"{note_name}{octave}"
 
 
-_MIDI_DATA_BY_NO = {
-    midi_no: Note(
+_OCTAVES = 10
+
+# built on first use, see _build_tables
+_NOTES_BY_FULL_NAME = None
+_NOTES_BY_NO = None
+_NOTES_BY_NAME = None
+_MIDI_NO_BY_NAME = None
+_ALL_MIDI_DATA = None
+
+
+def _build_tables():
+    """
+    Builds the interned note tables, called once on the first lookup so importing the module stays cheap.
+    """
+    global _NOTES_BY_FULL_NAME, _NOTES_BY_NO, _NOTES_BY_NAME, _MIDI_NO_BY_NAME, _ALL_MIDI_DATA
+
+    notes_by_full_name = {
+        _full_note_name(note_name, octave_no):
+            Note(
                 midi_no=midi_no,
                 freq_hz=freq,
                 name=note_name,
@@ -171,34 +188,74 @@ _MIDI_DATA_BY_NO = {
                 full_name=_full_note_name(note_name, octave_no),
             ) for midi_no, note_name, freq, octave_no in _MIDI_DATA}
 
+    # interned notes indexed by midi number, enharmonic duplicates resolve to the sharp spelling used by scales
+    notes_by_no = [None] * 128
+    for midi_no, note_name, _, octave_no in _MIDI_DATA:
+        if notes_by_no[midi_no] is None or 'b' not in note_name:
+            notes_by_no[midi_no] = notes_by_full_name[_full_note_name(note_name, octave_no)]
 
-_MIDI_DATA_BY_FULL_NAME = {
-    _full_note_name(note_name, octave_no):
-        Note(
-            midi_no=midi_no,
-            freq_hz=freq,
-            name=note_name,
-            octave=octave_no,
-            full_name=_full_note_name(note_name, octave_no),
-        ) for midi_no, note_name, freq, octave_no in _MIDI_DATA}
+    # name -> notes / midi numbers indexed by octave, lower case names are aliases of the upper case ones
+    notes_by_name = {}
+    midi_no_by_name = {}
+    for note in notes_by_full_name.values():
+        notes_by_name.setdefault(note.name, [None] * _OCTAVES)[note.octave] = note
+    for note_name in list(notes_by_name.keys()):
+        notes = tuple(notes_by_name[note_name])
+        midi_nos = tuple(n.midi_no if n else None for n in notes)
+        for alias in (note_name, note_name.lower()):
+            notes_by_name[alias] = notes
+            midi_no_by_name[alias] = midi_nos
+
+    _NOTES_BY_FULL_NAME = notes_by_full_name
+    _NOTES_BY_NAME = notes_by_name
+    _MIDI_NO_BY_NAME = midi_no_by_name
+    _ALL_MIDI_DATA = MappingProxyType(notes_by_full_name)
+    # set last, lookups check it to know the tables are ready
+    _NOTES_BY_NO = tuple(notes_by_no)
 
 
 def midi_note_from_name_and_octave(note: str, octave=4) -> Optional[Note]:
     """
-    Return midi note data.
+    Return midi note data, returned instance is shared and immutable.
     :param note: C,C#,D,Db,D#,E,F,F#,G,G#,Gb,A,A#,Ab,B,Bb
     :param octave: 0-9
     :return: midi note data
     """
-    return deepcopy(_MIDI_DATA_BY_FULL_NAME.get(
-        _full_note_name(note, octave),
-        _MIDI_DATA_BY_FULL_NAME.get(_full_note_name(note.upper(), octave))
-    ))
+    if _NOTES_BY_NO is None:
+        _build_tables()
+    notes = _NOTES_BY_NAME.get(note)
+    if notes is None or not 0 <= octave < _OCTAVES:
+        return None
+    return notes[octave]
+
+
+def midi_no_from_name_and_octave(note: str, octave=4) -> Optional[int]:
+    """
+    Return midi number of the note.
+    :param note: C,C#,D,Db,D#,E,F,F#,G,G#,Gb,A,A#,Ab,B,Bb
+    :param octave: 0-9
+    :return: midi number
+    """
+    if _NOTES_BY_NO is None:
+        _build_tables()
+    midi_nos = _MIDI_NO_BY_NAME.get(note)
+    if midi_nos is None or not 0 <= octave < _OCTAVES:
+        return None
+    return midi_nos[octave]
 
 
 def midi_note_from_no(midi_no) -> Optional[Note]:
-    return deepcopy(_MIDI_DATA_BY_NO.get(midi_no))
+    if _NOTES_BY_NO is None:
+        _build_tables()
+    if not 0 <= midi_no < 128:
+        return None
+    return _NOTES_BY_NO[midi_no]
 
 
 def all_midi_data():
-    return deepcopy(_MIDI_DATA_BY_FULL_NAME)
+    """
+    Read-only view of all notes by full name, ordered from the highest note.
+    """
+    if _NOTES_BY_NO is None:
+        _build_tables()
+    return _ALL_MIDI_DATA
@@ -0,0 +1,139 @@
+import heapq
+import time
+from threading import Thread, Condition
+from typing import Optional
+
+import mido
+
+PRIORITY_CLOCK = -1
+PRIORITY_NOTE = 0
+PRIORITY_CC = 1
+PRIORITY_DISPLAY = 2
+
+
+def message_priority(msg: mido.Message) -> int:
+    """
+    Clock and other system real time messages go first, then notes, everything else is sent after notes due at the
+    same time.
+    """
+    if msg.type in ('note_on', 'note_off'):
+        return PRIORITY_NOTE
+    if msg.type in ('clock', 'start', 'continue', 'stop', 'songpos'):
+        return PRIORITY_CLOCK
+    return PRIORITY_CC
+
+
+class MidiWriter(Thread):
+
+    def __init__(self, outport, desc='MidiWriter', priority: Optional[int] = None, burst_window: float = 0.001):
+        """
+        The only owner of a MIDI output port, all other threads put timestamped messages into its queue.
+
+        Messages are sent at their due time, everything falling due within burst_window is sent together as one
+        burst ordered by priority (clock before notes before CC before display traffic) and then by queue order,
+        so concurrent sequencers never write to the port at the same moment.
+
+        Has the same send(msg) as mido output ports, so it can be used in their place.
+
+        :param outport: MIDI output port
+        :param desc: description
+        :param priority: priority of messages sent without one, derived from the message type when not provided
+        :param burst_window: seconds, messages due this close together are sent in one burst
+        """
+        super().__init__(name=desc)
+        self._outport = outport
+        self._priority = priority
+        self._burst_window = burst_window
+        self._condition = Condition()
+        self._queue = []
+        self._order = 0
+        self._closed = False
+
+        self.sent = 0
+        self.bursts = 0
+        self.max_depth = 0
+        self.max_lateness = 0.0
+        self._total_lateness = 0.0
+
+        self.daemon = True
+        self.start()
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def mean_lateness(self) -> float:
+        return self._total_lateness / self.sent if self.sent else 0.0
+
+    def send(self, msg: mido.Message, at: Optional[float] = None, priority: Optional[int] = None, trace=None):
+        """
+        Queues message.
+
+        :param msg: MIDI message
+        :param at: time.monotonic() at which the message is due, now when not provided
+        :param priority: PRIORITY_CLOCK, PRIORITY_NOTE, PRIORITY_CC or PRIORITY_DISPLAY
+        :param trace: optional (SequenceTiming, scheduled time) which gets the send time recorded
+        """
+        if priority is None:
+            priority = self._priority if self._priority is not None else message_priority(msg)
+        with self._condition:
+            if self._closed:
+                return
+            self._order = self._order + 1
+            event = (time.monotonic() if at is None else at, priority, self._order, msg, trace)
+            heapq.heappush(self._queue, event)
+            self.max_depth = max(self.max_depth, len(self._queue))
+            if self._queue[0] is event:
+                self._condition.notify()
+
+    def stats(self) -> dict:
+        return {
+            'sent': self.sent,
+            'bursts': self.bursts,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'mean_lateness_ms': round(self.mean_lateness * 1000, 3),
+            'max_lateness_ms': round(self.max_lateness * 1000, 3),
+        }
+
+    def close(self, timeout: float = 1.0):
+        """
+        Stops the writer, messages already due are still sent, messages not yet due are dropped.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self.join(timeout=timeout)
+
+    def _next_burst(self) -> list:
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self._queue and self._queue[0][0] <= now:
+                    burst = []
+                    while self._queue and self._queue[0][0] <= now + self._burst_window:
+                        burst.append(heapq.heappop(self._queue))
+                    # by priority, then in the order they were queued
+                    burst.sort(key=lambda event: (event[1], event[2]))
+                    return burst
+                if self._closed:
+                    return []
+                self._condition.wait(timeout=self._queue[0][0] - now if self._queue else None)
+
+    def run(self):
+        while True:
+            burst = self._next_burst()
+            if not burst:
+                return
+
+            for due, _, _, msg, trace in burst:
+                self._outport.send(msg)
+                sent = time.monotonic()
+                if trace:
+                    trace[0].record_sent(trace[1], sent)
+                lateness = max(sent - due, 0.0)
+                self._total_lateness = self._total_lateness + lateness
+                self.max_lateness = max(self.max_lateness, lateness)
+                self.sent = self.sent + 1
+            self.bursts = self.bursts + 1
@@ -1,7 +1,9 @@
 from enum import Enum
-from typing import Optional, List, Tuple
+from typing import Any, Optional, List, Tuple
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+
+from transport import Transport
 
 
 class Index(BaseModel):
@@ -9,20 +11,30 @@ class Index(BaseModel):
 
 
 class Note(BaseModel):
+    """
+    Immutable note data, instances are interned in midi_data and shared by all sequences.
+    """
+    model_config = ConfigDict(frozen=True)
+
     midi_no: int
     name: str
     full_name: str
     octave: int
     freq_hz: float
-    velocity: int = 64
 
     def __eq__(self, other):
         return self.midi_no == other.midi_no
 
+    def __hash__(self):
+        return hash(self.midi_no)
+
 
 class NoteLength(BaseModel):
     note: Optional[Note] = None
     note_length: float
+    velocity: int = 64
+    # % of note_length the note sounds
+    gate: int = 100
 
 
 class BarAndNoteLength(BaseModel):
@@ -33,6 +45,16 @@ class BarAndNoteLength(BaseModel):
         return f'note length: {round(self.note_length, 2)}, bar length: {round(self.bar_length, 2)}'
 
 
+# lower meter -> length of its note in quarter notes
+QUARTER_NOTES_PER_NOTE = {
+    1: 4.0,
+    2: 2.0,
+    4: 1.0,
+    8: 0.5,
+    16: 0.25,
+}
+
+
 class TempoAndMeter(BaseModel):
     tempo: float = 120.0
     upper_meter: int = 4
@@ -42,20 +64,9 @@ class TempoAndMeter(BaseModel):
         return f'{round(self.tempo, 2)}bpm in {self.upper_meter}/{self.lower_meter}'
 
     def to_bar_and_note_length(self) -> BarAndNoteLength:
-        quarter_note = 60 / self.tempo
-
-        if self.lower_meter == 1:
-            note_length = quarter_note * 4
-        elif self.lower_meter == 2:
-            note_length = quarter_note * 2
-        elif self.lower_meter == 4:
-            note_length = quarter_note
-        elif self.lower_meter == 8:
-            note_length = quarter_note / 2
-        elif self.lower_meter == 16:
-            note_length = quarter_note / 4
-        else:
+        if self.lower_meter not in QUARTER_NOTES_PER_NOTE:
             raise ValueError(f'Wrong lower meter value: {self.lower_meter}!')
+        note_length = 60 / self.tempo * QUARTER_NOTES_PER_NOTE[self.lower_meter]
 
         bar_length = self.upper_meter * note_length
 
@@ -76,15 +87,22 @@ class MusicScaleType(Enum):
         return [e.value for e in MusicScaleType]
 
 
+TONICS = ('c', 'c#', 'd', 'd#', 'e', 'f', 'f#', 'g', 'g#', 'a', 'a#', 'b')
+
+
 class MusicScale(BaseModel):
     tonic: str = 'c'
     scale: MusicScaleType = MusicScaleType.MAJOR
 
 
 class RunSettings(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     sequencers: list
-    sequence_play: bool
+    transport: Transport
     quantize_to_scale: Optional[MusicScale]
+    quantize_table: Optional[bytes] = None
     music_scale: MusicScale
     sequences_config_params: List[dict]
-    generated_sequences: List[Tuple[TempoAndMeter, List[List[NoteLength]]]]
+    # (tempo and meter, pattern.PackedPattern) per sequence, kept unvalidated
+    generated_sequences: List[Tuple[TempoAndMeter, Any]]
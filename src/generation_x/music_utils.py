@@ -1,10 +1,32 @@
 import itertools
 import random
-from copy import deepcopy
-from typing import List
-
-from models import Note, NoteLength, TempoAndMeter, MusicScale, MusicScaleType
-from midi_data import midi_note_from_name_and_octave, all_midi_data
+from bisect import bisect_left
+from typing import List, Tuple
+
+from models import Note, TempoAndMeter, MusicScale, MusicScaleType
+from midi_data import midi_note_from_name_and_octave, midi_no_from_name_and_octave, midi_note_from_no, all_midi_data
+from pattern import PackedPattern
+from log import get_logger
+
+_log = get_logger('gen')
+
+KEYS = [
+    'c',
+    'c#',
+    'd',
+    'd#',
+    'e',
+    'f',
+    'f#',
+    'g',
+    'g#',
+    'a',
+    'a#',
+    'b',
+]
+
+_QUANTIZE_TABLES = None
+_SCALE_PITCHES = {}
 
 
 def get_key_frequency(key_in_octave: int, octave: int = 4) -> float:
@@ -31,20 +53,7 @@ def get_scale(music_scale: MusicScale) -> (dict, list, int):
     :param music_scale: root note and scale
     :return: dict of all octave notes with status if such note is in scale, list of scale notes, index on which octave increase
     """
-    keys = [
-        'c',
-        'c#',
-        'd',
-        'd#',
-        'e',
-        'f',
-        'f#',
-        'g',
-        'g#',
-        'a',
-        'a#',
-        'b',
-    ]
+    keys = KEYS
 
     if music_scale.tonic.lower() not in keys:
         raise ValueError(f"{music_scale.tonic} is not a key!")
@@ -164,13 +173,52 @@ def get_closes_note(note: str, notes_with_scale_status: dict) -> (str, str):
     return down_note, up_note
 
 
+def _build_quantize_table(music_scale: MusicScale, down=True) -> bytes:
+    notes_with_scale_status, _, _ = get_scale(music_scale)
+
+    key_targets = []
+    for key in KEYS:
+        down_note, up_note = get_closes_note(key, notes_with_scale_status)
+        key_targets.append(KEYS.index(down_note if down else up_note))
+
+    table = bytearray(128)
+    for midi_no in range(0, 128):
+        quantized = midi_no - midi_no % 12 + key_targets[midi_no % 12]
+        table[midi_no] = quantized if quantized < 128 else midi_no
+    return bytes(table)
+
+
+def quantize_tables() -> dict:
+    """
+    Returns quantization tables for every tonic x MusicScaleType x direction, built once on first use.
+
+    :return: dict (tonic, MusicScaleType, down) -> 128 bytes table, midi number -> quantized midi number
+    """
+    global _QUANTIZE_TABLES
+    if _QUANTIZE_TABLES is None:
+        _QUANTIZE_TABLES = {
+            (tonic, scale, down): _build_quantize_table(MusicScale(tonic=tonic, scale=scale), down)
+            for tonic in KEYS for scale in MusicScaleType for down in (True, False)
+        }
+    return _QUANTIZE_TABLES
+
+
+def quantize_table(music_scale: MusicScale, down=True) -> bytes:
+    """
+    Returns quantization table for the scale, quantizing is a single index: table[note.midi_no].
+
+    Note out of scale is moved to the closest scale note below (down) or above (up) the note, within the same
+    octave number.
+
+    :param music_scale: tonic and scale
+    :param down: direction
+    :return: 128 bytes table, midi number -> quantized midi number
+    """
+    return quantize_tables()[(music_scale.tonic.lower(), music_scale.scale, down)]
+
+
 def quantize(note: Note, music_scale: MusicScale, down=True) -> Note:
-    notes_with_scale_status, scale_notes, _ = get_scale(music_scale)
-    down_note, up_note = get_closes_note(note.name.lower(), notes_with_scale_status)
-    if down:
-        return midi_note_from_name_and_octave(down_note, note.octave)
-    else:
-        return midi_note_from_name_and_octave(up_note, note.octave)
+    return midi_note_from_no(quantize_table(music_scale, down)[note.midi_no])
 
 
 def get_next_scale_from_circle(music_scale: MusicScale) -> MusicScale:
@@ -216,8 +264,8 @@ def generate_arpeggio_in_same_octave(root_note: str, music_scale: MusicScale, mo
     if direction not in ['up', 'down']:
         raise ValueError(f'Unsupported direction: {direction}')
 
-    print(
-        f'{scale_notes} -> {mode_offset}th -> {direction} from {closes_note_down} -> {total_notes} in octave {main_octave}')
+    _log.debug('%s -> %dth -> %s from %s -> %s in octave %s',
+               scale_notes, mode_offset, direction, closes_note_down, total_notes, main_octave)
     arpeggio_notes = []
 
     if direction == 'down':
@@ -261,8 +309,8 @@ def generate_arpeggio(root_note: str, music_scale: MusicScale, mode="3th up", to
     if direction == 'up':
         all_midi_octaves_in_scale.reverse()
 
-    print(f'Arpeggio: {scale_notes} -> {mode_offset}th -> {direction} from {closes_note_down} -> {total_notes} notes starting '
-          f'in octave {root_octave}')
+    _log.debug('Arpeggio: %s -> %dth -> %s from %s -> %s notes starting in octave %s',
+               scale_notes, mode_offset, direction, closes_note_down, total_notes, root_octave)
 
     root_note_idx = None
     for idx, note in enumerate(all_midi_octaves_in_scale):
@@ -283,26 +331,22 @@ def generate_arpeggio_in_tempo(
         mode="3th",
         total_notes=4,
         root_octave=4
-):
+) -> PackedPattern:
     arpeggio_notes = generate_arpeggio(root_note, music_scale, mode, total_notes, root_octave)
     note_and_bar_length = tempo_and_meter.to_bar_and_note_length()
 
-    full_melody = list()
+    full_melody = PackedPattern()
 
     arp_note_idx = 0
     for bar_id in range(0, bars):
-        bar_melody = list()
-
         for note_idx in range(0, tempo_and_meter.upper_meter):
             note = arpeggio_notes[arp_note_idx]
             arp_note_idx = arp_note_idx + 1
             if arp_note_idx >= len(arpeggio_notes):
                 arp_note_idx = 0
-            bar_melody.append(
-                NoteLength(note=note, note_length=note_and_bar_length.note_length)
-            )
+            full_melody.append_note(note.midi_no, 64, note_and_bar_length.note_length)
 
-        full_melody.append(bar_melody)
+        full_melody.end_bar()
 
     return full_melody
 
@@ -313,8 +357,9 @@ def generate_random_melody(
         bars=1,
         tempo_and_meter: TempoAndMeter = TempoAndMeter(),
         pause_fn=lambda: random.randint(0, 1) == 0,
-        velocity_fn=lambda n, t: get_random_velocity(n, t)
-) -> List[List[NoteLength]]:
+        velocity_fn=lambda n, t: get_random_velocity(n, t),
+        rng=random
+) -> PackedPattern:
     """
     Generates random melody in a given scale starting in specified octave.
     Note generated from the scale with: random.randint(0, len(scale_notes) - 1)
@@ -325,35 +370,30 @@ def generate_random_melody(
     :param tempo_and_meter: melody tempo and meter (used to calculate note length)
     :param pause_fn: function which determine if there will be a note or pause
     :param velocity_fn: function which generate velocity
-    :return:list of size=bars where every bar has a list of random notes of size = upper meter
+    :param rng: random number generator (random.Random instance or the random module)
+    :return: pattern of size=bars where every bar has random notes of size = upper meter
     """
     _, scale_notes, octave_change_at = get_scale(music_scale)
-    full_melody = list()
+    full_melody = PackedPattern()
     note_and_bar_length = tempo_and_meter.to_bar_and_note_length()
     for step in range(0, bars):
-        bar_melody = list()
         for note_no in range(0, tempo_and_meter.upper_meter):
             if pause_fn():
-                bar_melody.append(
-                    NoteLength(note=None, note_length=note_and_bar_length.note_length)
-                )
+                full_melody.append_rest(note_and_bar_length.note_length)
                 continue
 
-            random_note_idx = random.randint(0, len(scale_notes) - 1)
+            random_note_idx = rng.randint(0, len(scale_notes) - 1)
             if random_note_idx >= octave_change_at:
                 octave_offset = 1
             else:
                 octave_offset = 0
 
-            note = midi_note_from_name_and_octave(scale_notes[random_note_idx], octave + octave_offset)
-
-            if velocity_fn:
-                note.velocity = velocity_fn(note_no + 1, tempo_and_meter)
-
-            bar_melody.append(
-                NoteLength(note=note, note_length=note_and_bar_length.note_length)
+            full_melody.append_note(
+                midi_no_from_name_and_octave(scale_notes[random_note_idx], octave + octave_offset),
+                velocity_fn(note_no + 1, tempo_and_meter) if velocity_fn else 64,
+                note_and_bar_length.note_length,
             )
-        full_melody.append(bar_melody)
+        full_melody.end_bar()
 
     return full_melody
 
@@ -379,7 +419,7 @@ def generate_random_melody_sequences(
     :param base_octave: base octave from which octave_fn will deviate
     :param pause_factor: pause will be triggered if rand(0,100) will be above this value
 
-    :return: list[(TEMPO, list[list[notes]])]
+    :return: list[(TEMPO, PackedPattern)]
     """
     sequence = list()
 
@@ -402,17 +442,110 @@ def generate_random_melody_sequences(
     return sequence
 
 
+def scale_pitches(music_scale: MusicScale) -> Tuple[int, ...]:
+    """
+    Midi numbers of all scale notes in all octaves, ascending, computed once per scale.
+    Random walks operate on integer positions in this array.
+
+    :param music_scale: tonic and scale
+    :return: ascending midi numbers
+    """
+    key = (music_scale.tonic.lower(), music_scale.scale)
+    pitches = _SCALE_PITCHES.get(key)
+    if pitches is None:
+        _, scale_notes, _ = get_scale(music_scale)
+        pitches = tuple(sorted(note.midi_no for note in all_midi_data().values() if note.name.lower() in scale_notes))
+        _SCALE_PITCHES[key] = pitches
+    return pitches
+
+
+def scale_position(music_scale: MusicScale, note: str, octave: int) -> int:
+    """
+    Position of the note in scale_pitches, if note is not in scale the closest position above is returned.
+    """
+    return bisect_left(scale_pitches(music_scale), midi_no_from_name_and_octave(note, octave))
+
+
+def _reflect(position: int, min_idx: int, max_idx: int) -> int:
+    width = max_idx - min_idx
+    if width <= 0:
+        return min_idx
+    folded = (position - min_idx) % (2 * width)
+    return min_idx + (folded if folded <= width else 2 * width - folded)
+
+
+def walk_positions(start: int, steps: List[int], min_idx: int = None, max_idx: int = None,
+                   boundary='clip') -> List[int]:
+    """
+    Cumulative sum of steps starting at start, kept in [min_idx, max_idx].
+
+    Example:
+    >>> walk_positions(2, [2, 2, -1], 0, 3)
+    [2, 3, 3, 2]
+    >>> walk_positions(2, [2, 2, -1], 0, 3, boundary='reflect')
+    [2, 2, 0, 1]
+
+    :param start: initial position
+    :param steps: steps to take
+    :param min_idx: lower bound, None for unbounded
+    :param max_idx: upper bound, None for unbounded
+    :param boundary: 'clip' stops at the bound, 'reflect' bounces back from it
+    :return: list of len(steps) + 1 positions
+    """
+    if min_idx is None or max_idx is None:
+        return list(itertools.accumulate(steps, initial=start))
+    if boundary == 'reflect':
+        return [_reflect(p, min_idx, max_idx) for p in itertools.accumulate(steps, initial=start)]
+    if boundary == 'clip':
+        return list(itertools.accumulate(steps, lambda p, s: min(max(p + s, min_idx), max_idx), initial=start))
+    raise ValueError(f'Unsupported boundary: {boundary}')
+
+
+def _walk_to_pattern(
+        pitches: Tuple[int, ...],
+        positions: List[int],
+        tempo_and_meter: TempoAndMeter,
+        velocity_fn
+) -> PackedPattern:
+    note_length = tempo_and_meter.to_bar_and_note_length().note_length
+    upper_meter = tempo_and_meter.upper_meter
+    pitches_count = len(pitches)
+
+    full_melody = PackedPattern()
+    for step_no, position in enumerate(positions):
+        note_no = step_no % upper_meter
+        if 0 <= position < pitches_count:
+            full_melody.append_note(
+                pitches[position],
+                velocity_fn(note_no + 1, tempo_and_meter) if velocity_fn else 64,
+                note_length,
+            )
+        else:
+            full_melody.append_rest(note_length)
+        if note_no == upper_meter - 1:
+            full_melody.end_bar()
+    full_melody.end_bar()
+
+    return full_melody
+
+
+def _pitch_range(pitches: Tuple[int, ...], start_idx: int, min_pitch: int, max_pitch: int) -> (int, int):
+    return max(start_idx + min_pitch, 0), min(start_idx + max_pitch, len(pitches) - 1)
+
+
 def generate_random_walk_melody(
         music_scale: MusicScale,
         octave=4,
         bars=1,
         tempo_and_meter: TempoAndMeter = TempoAndMeter(),
         steps_deviation=3,
-        velocity_fn=lambda n, t: get_random_velocity(n, t)
-):
+        velocity_fn=lambda n, t: get_random_velocity(n, t),
+        rng=random
+) -> PackedPattern:
     """
     Generate melody with "random walk" algorithm, uses random gauss function:
     random.gauss(mu=1, sigma=steps_deviation)
+    Walk leaving the scale range produces rests.
 
     :param music_scale: Music scale
     :param octave: initial octave
@@ -420,39 +553,16 @@ def generate_random_walk_melody(
     :param tempo_and_meter: tempo and meter
     :param steps_deviation: deviation for random steps
     :param velocity_fn: function to generate velocity
-    :return: list[list[notes]]
+    :param rng: random number generator (random.Random instance or the random module)
+    :return: pattern
     """
-    full_scale_notes = get_all_octaves_in_scale(music_scale)
-    note_and_bar_length = tempo_and_meter.to_bar_and_note_length()
-
-    full_melody = list()
+    pitches = scale_pitches(music_scale)
+    total_steps = bars * tempo_and_meter.upper_meter
 
-    start_idx = 0
-    full_scale_notes.reverse()
-    for note in full_scale_notes:
-        if note.octave == octave and note.name == music_scale.tonic.upper():
-            break
-        start_idx = start_idx + 1
-
-    steps = start_idx
-    for bar in range(0, bars):
-        bar_melody = list()
-        for note_no in range(0, tempo_and_meter.upper_meter):
-            note = deepcopy(full_scale_notes[steps]) if len(full_scale_notes) > steps else None
-
-            if note and velocity_fn:
-                note.velocity = velocity_fn(note_no + 1, tempo_and_meter)
-
-            bar_melody.append(
-                NoteLength(note=note, note_length=note_and_bar_length.note_length)
-            )
-            gg = int(random.gauss(mu=1, sigma=steps_deviation))
+    steps = [int(rng.gauss(mu=1, sigma=steps_deviation)) for _ in range(1, total_steps)]
+    positions = walk_positions(scale_position(music_scale, music_scale.tonic, octave), steps)
 
-            steps = steps + gg
-
-        full_melody.append(bar_melody)
-
-    return full_melody
+    return _walk_to_pattern(pitches, positions, tempo_and_meter, velocity_fn)
 
 
 def generate_random_walk_melody_in_range(
@@ -463,8 +573,10 @@ def generate_random_walk_melody_in_range(
         max_pitch=8,
         tempo_and_meter: TempoAndMeter = TempoAndMeter(),
         steps_deviation=3,
-        velocity_fn=lambda n, t: get_random_velocity(n, t)
-):
+        velocity_fn=lambda n, t: get_random_velocity(n, t),
+        boundary='clip',
+        rng=random
+) -> PackedPattern:
     """
     Generate melody with "random walk" algorithm but keeps notes in the given range.
     Step with function: random.randint(-1, 1) * steps_deviation
@@ -477,52 +589,19 @@ def generate_random_walk_melody_in_range(
     :param tempo_and_meter: tempo and meter
     :param steps_deviation: deviation for random steps
     :param velocity_fn: function to generate velocity
-    :return: list[list[notes]]
+    :param boundary: 'clip' stops at the range bounds, 'reflect' bounces back from them
+    :param rng: random number generator (random.Random instance or the random module)
+    :return: pattern
     """
-    full_scale_notes = get_all_octaves_in_scale(music_scale)
-    note_and_bar_length = tempo_and_meter.to_bar_and_note_length()
+    pitches = scale_pitches(music_scale)
+    start_idx = scale_position(music_scale, music_scale.tonic, octave)
+    min_pitch_idx, max_pitch_idx = _pitch_range(pitches, start_idx, min_pitch, max_pitch)
+    total_steps = bars * tempo_and_meter.upper_meter
 
-    start_idx = 0
-    full_scale_notes.reverse()
-    for note in full_scale_notes:
-        if note.octave == octave and note.name == music_scale.tonic.upper():
-            break
-        start_idx = start_idx + 1
+    steps = [rng.randint(-1, 1) * steps_deviation for _ in range(1, total_steps)]
+    positions = walk_positions(start_idx, steps, min_pitch_idx, max_pitch_idx, boundary)
 
-    full_melody = list()
-
-    min_pitch_idx = start_idx + min_pitch
-    if min_pitch_idx < 0:
-        min_pitch_idx = 0
-
-    max_pitch_idx = start_idx + max_pitch
-    if max_pitch_idx > len(full_scale_notes):
-        max_pitch_idx = len(full_scale_notes)
-
-    steps = start_idx
-    for bar in range(0, bars):
-        bar_melody = list()
-        for note_no in range(0, tempo_and_meter.upper_meter):
-            note = deepcopy(full_scale_notes[steps]) if len(full_scale_notes) > steps else None
-
-            if note and velocity_fn:
-                note.velocity = velocity_fn(note_no + 1, tempo_and_meter)
-
-            bar_melody.append(
-                NoteLength(note=note, note_length=note_and_bar_length.note_length)
-            )
-
-            gg = random.randint(-1, 1) * steps_deviation
-
-            steps = steps + gg
-            if steps > max_pitch_idx:
-                steps = max_pitch_idx
-            if steps < min_pitch_idx:
-                steps = min_pitch_idx
-
-        full_melody.append(bar_melody)
-
-    return full_melody
+    return _walk_to_pattern(pitches, positions, tempo_and_meter, velocity_fn)
 
 
 def generate_random_walk_melody_in_range_and_mean(
@@ -533,8 +612,9 @@ def generate_random_walk_melody_in_range_and_mean(
         max_pitch=8,
         tempo_and_meter: TempoAndMeter = TempoAndMeter(),
         steps_deviation=3,
-        velocity_fn=lambda n, t: get_random_velocity(n, t)
-):
+        velocity_fn=lambda n, t: get_random_velocity(n, t),
+        rng=random
+) -> PackedPattern:
     """
     Generate melody with "random walk" algorithm but keeps notes in the given range.
     Nest step is taken by random from mean value selected between the previous step and the middle of the range and
@@ -547,67 +627,23 @@ def generate_random_walk_melody_in_range_and_mean(
     :param max_pitch: max pitch from music scale tonic
     :param tempo_and_meter: tempo and meter
     :param steps_deviation: deviation for random steps
-    :param velocity_fn: deviation for random steps
-    :return: list[list[notes]]
+    :param velocity_fn: function to generate velocity
+    :param rng: random number generator (random.Random instance or the random module)
+    :return: pattern
     """
-    full_scale_notes = get_all_octaves_in_scale(music_scale)
-    note_and_bar_length = tempo_and_meter.to_bar_and_note_length()
-
-    start_idx = 0
-    full_scale_notes.reverse()
-    for note in full_scale_notes:
-        if note.octave == octave and note.name == music_scale.tonic.upper():
-            break
-        start_idx = start_idx + 1
-
-    min_pitch_idx = start_idx + min_pitch
-    if min_pitch_idx < 0:
-        min_pitch_idx = 0
-
-    max_pitch_idx = start_idx + max_pitch
-    if max_pitch_idx > len(full_scale_notes):
-        max_pitch_idx = len(full_scale_notes)
-
+    pitches = scale_pitches(music_scale)
+    start_idx = scale_position(music_scale, music_scale.tonic, octave)
+    min_pitch_idx, max_pitch_idx = _pitch_range(pitches, start_idx, min_pitch, max_pitch)
     middle_pitch_idx = int((min_pitch_idx + max_pitch_idx) / 2.0)
 
-    print(f'min note: {full_scale_notes[min_pitch_idx]}')
-    print(f'max note: {full_scale_notes[max_pitch_idx]}')
-    print(f'middle note: {full_scale_notes[middle_pitch_idx]}')
-    print(f'start note: {full_scale_notes[start_idx]}')
-
-    note = deepcopy(full_scale_notes[start_idx])
-    note.velocity = velocity_fn(1, tempo_and_meter)
-    full_melody = list()
-    full_melody.append(
-        NoteLength(
-            note=note,
-            note_length=note_and_bar_length.note_length,
-        )
-    )
-    for note_no in range(1, bars * tempo_and_meter.upper_meter):
-        prev_note = full_melody[-1]
-        prev_note_idx = full_scale_notes.index(prev_note.note)
-
-        step_idx = random.randint(
-            int((prev_note_idx + middle_pitch_idx) / 2.0),
-            int((prev_note_idx + middle_pitch_idx) / 2.0) + steps_deviation
-        )
-
-        if step_idx > max_pitch_idx:
-            step_idx = max_pitch_idx
-        if step_idx < min_pitch_idx:
-            step_idx = min_pitch_idx
-
-        note = deepcopy(full_scale_notes[step_idx])
-
-        if velocity_fn:
-            note.velocity = velocity_fn(((note_no + 1) % bars), tempo_and_meter)
-
-        full_melody.append(
-            NoteLength(note=note, note_length=note_and_bar_length.note_length)
-        )
+    positions = [start_idx]
+    position = start_idx
+    for _ in range(1, bars * tempo_and_meter.upper_meter):
+        mean_idx = int((position + middle_pitch_idx) / 2.0)
+        position = min(max(rng.randint(mean_idx, mean_idx + steps_deviation), min_pitch_idx), max_pitch_idx)
+        positions.append(position)
 
-    return [full_melody[x:x + bars] for x in range(0, len(full_melody), bars)]
+    return _walk_to_pattern(pitches, positions, tempo_and_meter, velocity_fn)
 
 
 def get_random_velocity(
@@ -616,10 +652,11 @@ def get_random_velocity(
         velocity: int = 64,
         min_deviation: int = 0,
         max_deviation: int = 10,
-        accent_fn=lambda n, t: get_accent(n, t)
+        accent_fn=lambda n, t: get_accent(n, t),
+        rng=random
 ):
     acc_value = accent_fn(note_in_bar_idx, tempo_and_meter)
-    velocity = velocity + random.randint(min_deviation, max_deviation) + acc_value
+    velocity = velocity + rng.randint(min_deviation, max_deviation) + acc_value
     if velocity > 127:
         velocity = 127
     return velocity
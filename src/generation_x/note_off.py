@@ -0,0 +1,202 @@
+import time
+from threading import Thread, Condition
+from typing import Dict, List, Optional, Tuple
+
+import mido
+
+from midi_writer import PRIORITY_NOTE
+
+
+class TimerWheel:
+
+    def __init__(self, tick: float = 0.005, slots: int = 256):
+        """
+        Hashed timer wheel, O(1) add, expiring costs only the visited slots and the expired entries.
+
+        Entry due at tick t is stored in slot t % slots together with t, so entries more than one lap ahead wait in
+        their slot until their tick comes. Not thread safe, the owner guards it.
+
+        Example:
+        >>> wheel = TimerWheel(tick=1.0, slots=4)
+        >>> wheel.add(wheel.origin + 1.5, 'a')
+        >>> wheel.add(wheel.origin + 9.5, 'b')
+        >>> [item for _, item in wheel.advance(wheel.origin + 2.0)]
+        ['a']
+        >>> [item for _, item in wheel.advance(wheel.origin + 10.0)]
+        ['b']
+        >>> len(wheel)
+        0
+
+        :param tick: slot resolution in seconds
+        :param slots: amount of slots
+        """
+        self._tick = tick
+        self._slots: List[list] = [[] for _ in range(slots)]
+        self._current = 0
+        self._size = 0
+        self.origin = time.monotonic()
+
+    def __len__(self):
+        return self._size
+
+    def _tick_of(self, at: float) -> int:
+        return int((at - self.origin) / self._tick)
+
+    def add(self, at: float, item):
+        """
+        :param at: time.monotonic() at which the item expires
+        :param item: anything
+        """
+        tick = max(self._tick_of(at), self._current)
+        self._slots[tick % len(self._slots)].append((tick, at, item))
+        self._size = self._size + 1
+
+    def advance(self, until: float) -> List[Tuple[float, object]]:
+        """
+        Expires all items due until given time.
+
+        :return: (due time, item) of expired items
+        """
+        target = self._tick_of(until)
+        if target < self._current:
+            return []
+
+        expired = []
+        if self._size:
+            # one lap at most, every slot sees all its entries due until target
+            for tick in range(self._current, min(target + 1, self._current + len(self._slots))):
+                slot = self._slots[tick % len(self._slots)]
+                if not slot:
+                    continue
+                keep = []
+                for entry in slot:
+                    if entry[0] <= target:
+                        expired.append((entry[1], entry[2]))
+                    else:
+                        keep.append(entry)
+                slot[:] = keep
+            self._size = self._size - len(expired)
+        self._current = target + 1
+        return expired
+
+
+class NoteOffScheduler(Thread):
+
+    def __init__(self, writer, tick: float = 0.005, slots: int = 256, desc='NoteOffScheduler'):
+        """
+        Sends note_on and schedules the matching note_off after the gated note length.
+
+        Offs are kept in a TimerWheel and handed over to the writer one tick ahead with their exact due time,
+        so the wheel resolution does not affect timing. Every sounding (channel, note) has a token, a retriggered
+        or flushed note gets a new one and its old pending off is dropped when it expires. Sounding notes remember
+        the track which played them, tracks sharing a channel are released separately (see track_off).
+
+        :param writer: MidiWriter of the output port
+        :param tick: wheel resolution in seconds
+        :param slots: wheel slots
+        :param desc: description
+        """
+        super().__init__(name=desc)
+        self._writer = writer
+        self._tick = tick
+        self._wheel = TimerWheel(tick=tick, slots=slots)
+        # (channel, note) -> (token, track)
+        self._sounding: Dict[Tuple[int, int], Tuple[int, Optional[int]]] = {}
+        # offs already handed over to the writer, but not yet due
+        self._releasing: Dict[Tuple[int, int], float] = {}
+        self._token = 0
+        self._condition = Condition()
+        self._closed = False
+
+        self.daemon = True
+        self.start()
+
+    @property
+    def pending(self) -> int:
+        return len(self._wheel)
+
+    @property
+    def sounding(self) -> int:
+        return len(self._sounding)
+
+    def note_on(self, channel: int, note: int, velocity: int, length: float, gate: int = 100, trace=None,
+                track: Optional[int] = None):
+        """
+        :param channel: MIDI channel
+        :param note: midi number
+        :param velocity: velocity
+        :param length: step length in seconds
+        :param gate: % of the step length the note sounds
+        :param trace: optional (SequenceTiming, scheduled time) of the step, see MidiWriter.send
+        :param track: sequence number which played the note, a retrigger by another track takes the note over
+        """
+        now = time.monotonic()
+        key = (channel, note)
+        with self._condition:
+            # retriggered within the lookahead, the note_on must not overtake its note_off
+            at = max(now, self._releasing.pop(key, now))
+            if key in self._sounding:
+                # retrigger, close the sounding note first, its pending off is now stale
+                self._writer.send(mido.Message('note_off', channel=channel, note=note), priority=PRIORITY_NOTE)
+            self._token = self._token + 1
+            self._sounding[key] = (self._token, track)
+            self._writer.send(
+                mido.Message('note_on', channel=channel, note=note, velocity=velocity), at=at, priority=PRIORITY_NOTE,
+                trace=trace,
+            )
+            self._wheel.add(at + length * min(max(gate, 1), 100) / 100, (channel, note, self._token))
+            if len(self._wheel) == 1:
+                self._condition.notify()
+
+    def notes_off(self, channel: Optional[int] = None):
+        """
+        Releases all sounding notes (of channel) straight away and sends all notes off, used on stop.
+
+        :param channel: MIDI channel, None for all channels
+        """
+        with self._condition:
+            keys = [key for key in self._sounding if channel is None or key[0] == channel]
+            for key in keys:
+                del self._sounding[key]
+                self._writer.send(mido.Message('note_off', channel=key[0], note=key[1]), priority=PRIORITY_NOTE)
+            for ch in (range(0, 16) if channel is None else [channel]):
+                self._writer.send(mido.Message('control_change', channel=ch, control=123, value=0),
+                                  priority=PRIORITY_NOTE)
+
+    def track_off(self, track: int):
+        """
+        Releases the sounding notes of one track straight away, used on mute. Other tracks may share its channel,
+        so only its own notes get note_off and no all notes off is sent.
+
+        :param track: sequence number given to note_on
+        """
+        with self._condition:
+            keys = [key for key, (_, owner) in self._sounding.items() if owner == track]
+            for key in keys:
+                del self._sounding[key]
+                self._writer.send(mido.Message('note_off', channel=key[0], note=key[1]), priority=PRIORITY_NOTE)
+
+    def close(self, timeout: float = 1.0):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self.join(timeout=timeout)
+
+    def run(self):
+        with self._condition:
+            while not self._closed:
+                if not len(self._wheel):
+                    # nothing pending, sleep until the next note
+                    self._condition.wait()
+                    continue
+
+                for due, (channel, note, token) in self._wheel.advance(time.monotonic() + self._tick):
+                    key = (channel, note)
+                    if self._sounding.get(key, (None, None))[0] != token:
+                        continue
+                    del self._sounding[key]
+                    self._releasing[key] = due
+                    self._writer.send(mido.Message('note_off', channel=channel, note=note), at=due,
+                                      priority=PRIORITY_NOTE)
+
+                self._condition.wait(timeout=self._tick)
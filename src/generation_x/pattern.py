@@ -0,0 +1,130 @@
+from array import array
+from typing import List, Optional
+
+from models import NoteLength
+from midi_data import midi_note_from_no
+
+
+class PackedPattern:
+    """
+    Generated sequence stored as parallel typed columns, one entry per step:
+    midi number, velocity, rest flag, length and gate (% of length the note sounds),
+    plus offsets of the first step of every bar.
+
+    Example:
+    >>> pattern = PackedPattern()
+    >>> pattern.append_note(60, 94, 0.5)
+    >>> pattern.append_rest(0.5)
+    >>> pattern.end_bar()
+    >>> print(pattern)
+    PackedPattern(['C4,-'])
+    """
+
+    __slots__ = ('midi_no', 'velocity', 'rest', 'length', 'gate', 'bar_offsets')
+
+    def __init__(self):
+        self.midi_no = array('B')
+        self.velocity = array('B')
+        self.rest = array('B')
+        self.length = array('d')
+        self.gate = array('B')
+        self.bar_offsets = array('I', [0])
+
+    def __len__(self):
+        return len(self.midi_no)
+
+    def __repr__(self):
+        return f'PackedPattern({self.bar_names()})'
+
+    @property
+    def bars_count(self) -> int:
+        return len(self.bar_offsets) - 1
+
+    def append_note(self, midi_no: int, velocity: int, length: float, gate: int = 100):
+        self.midi_no.append(midi_no)
+        self.velocity.append(velocity)
+        self.rest.append(0)
+        self.length.append(length)
+        self.gate.append(gate)
+
+    def append_rest(self, length: float):
+        self.midi_no.append(0)
+        self.velocity.append(0)
+        self.rest.append(1)
+        self.length.append(length)
+        self.gate.append(0)
+
+    def append(self, note_length: NoteLength):
+        if note_length.note:
+            self.append_note(note_length.note.midi_no, note_length.velocity, note_length.note_length, note_length.gate)
+        else:
+            self.append_rest(note_length.note_length)
+
+    def end_bar(self):
+        """
+        Closes current bar, next appended step starts a new one.
+        """
+        if self.bar_offsets[-1] != len(self.midi_no):
+            self.bar_offsets.append(len(self.midi_no))
+
+    def set_gate(self, gate: int):
+        """
+        Sets gate of all notes.
+
+        :param gate: % of step length the note sounds, 1-100
+        """
+        gate = min(max(gate, 1), 100)
+        self.gate = array('B', (0 if rest else gate for rest in self.rest))
+
+    def bar_range(self, bar_idx: int) -> range:
+        return range(self.bar_offsets[bar_idx], self.bar_offsets[bar_idx + 1])
+
+    def step(self, idx: int) -> NoteLength:
+        """
+        Returns step as NoteLength event, built without validation from interned notes.
+        """
+        return NoteLength.model_construct(
+            note=None if self.rest[idx] else midi_note_from_no(self.midi_no[idx]),
+            note_length=self.length[idx],
+            velocity=self.velocity[idx],
+            gate=self.gate[idx],
+        )
+
+    def step_name(self, idx: int) -> str:
+        if self.rest[idx]:
+            return '-'
+        note = midi_note_from_no(self.midi_no[idx])
+        return note.full_name if note else str(self.midi_no[idx])
+
+    def bar_names(self) -> List[str]:
+        """
+        Returns every bar as comma separated note names, '-' for rests.
+        """
+        return [
+            ','.join(self.step_name(idx) for idx in self.bar_range(bar_idx)) for bar_idx in range(0, self.bars_count)
+        ]
+
+    def to_bars(self) -> List[List[NoteLength]]:
+        return [[self.step(idx) for idx in self.bar_range(bar_idx)] for bar_idx in range(0, self.bars_count)]
+
+    def to_dict(self) -> dict:
+        return {column: list(getattr(self, column)) for column in self.__slots__}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'PackedPattern':
+        """
+        Builds pattern from to_dict() output, raises KeyError when a column is missing.
+        """
+        pattern = PackedPattern()
+        for column in PackedPattern.__slots__:
+            setattr(pattern, column, array(getattr(pattern, column).typecode, data[column]))
+        return pattern
+
+    @staticmethod
+    def from_bars(bars: List[List[Optional[NoteLength]]]) -> 'PackedPattern':
+        pattern = PackedPattern()
+        for bar in bars:
+            for note_length in bar:
+                pattern.append(note_length)
+            pattern.end_bar()
+        return pattern
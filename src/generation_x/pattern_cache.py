@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+from typing import Optional, Tuple
+
+from models import TempoAndMeter, MusicScale
+from pattern import PackedPattern
+from log import get_logger
+
+_log = get_logger('gen')
+
+# bump whenever generators produce different output for the same config and seed
+GENERATOR_VERSION = 2
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'generation_x')
+
+
+class PatternCache:
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR):
+        """
+        On-disk cache of generated sequences, content-addressed by hash of
+        (sequence config, music scale, sequence seed, generator version).
+
+        Next to the pattern also the state of the sequence RNG after generation is stored, so a warm start continues
+        the same random stream as the cold one (e.g. for dice regenerations).
+
+        :param directory: cache directory, created on first write
+        """
+        self._directory = directory
+
+    @staticmethod
+    def key(config: str, music_scale: MusicScale, seed: int) -> str:
+        content = json.dumps([config, music_scale.tonic.lower(), music_scale.scale.value, seed, GENERATOR_VERSION])
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, f'{key}.json')
+
+    def get(self, key: str) -> Optional[Tuple[TempoAndMeter, PackedPattern, tuple]]:
+        """
+        :return: (tempo and meter, pattern, rng state) or None if not cached
+        """
+        try:
+            with open(self._path(key)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            version, internal_state, gauss_next = data['rng_state']
+            return (
+                TempoAndMeter(**data['tempo_and_meter']),
+                PackedPattern.from_dict(data['pattern']),
+                (version, tuple(internal_state), gauss_next),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            _log.warn('skipping malformed pattern cache %s: %s', self._path(key), e)
+            return None
+
+    def put(self, key: str, tempo_and_meter: TempoAndMeter, pattern: PackedPattern, rng_state: tuple):
+        data = {
+            'tempo_and_meter': tempo_and_meter.model_dump(),
+            'pattern': pattern.to_dict(),
+            'rng_state': rng_state,
+        }
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            tmp_path = f'{self._path(key)}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            _log.warn('could not write pattern cache %s: %s', self._path(key), e)
@@ -0,0 +1,163 @@
+from collections import deque
+from queue import SimpleQueue, Empty
+from threading import Thread, Lock
+from typing import Callable, Set, Any, Optional
+
+from log import get_logger
+
+_log = get_logger('gen')
+
+# wakes the worker to recompute its refill timeout
+_REFILL = -1
+
+
+class RegenerationWorker(Thread):
+
+    def __init__(self,
+                 generate: Callable[[int], Any],
+                 apply: Callable[[int, Any], None],
+                 sequences: int = 0,
+                 pool_size: int = 0,
+                 refill_rate: float = 4.0,
+                 desc='RegenerationWorker'):
+        """
+        Builds new patterns off the input thread.
+
+        Every sequence keeps a bounded pool of ready-made variations, a dice press pops the next one and applies it
+        straight away, so its cost never depends on the generator. The worker serves pool misses first (generates
+        on demand), only when idle it tops the pools up, at most refill_rate variations per second. All generation
+        runs in this one thread, so a sequence RNG stream is never shared between threads.
+
+        Repeated on demand requests of a sequence which is still waiting are merged into one. A variation generated
+        while its sequence was invalidated (its config changed) is dropped, pooled or on demand.
+
+        :param generate: function(sequence number) returning a new variation
+        :param apply: function(sequence number, variation) queueing the variation to the sequence back buffer
+        :param sequences: number of sequences
+        :param pool_size: variations kept per sequence, 0 disables the pools
+        :param refill_rate: max generated pool variations per second
+        :param desc: description
+        """
+        super().__init__(name=desc)
+        self._generate = generate
+        self._apply = apply
+        self._pool_size = pool_size
+        self._refill_interval = 1 / refill_rate if refill_rate > 0 else None
+        self._pools = [deque() for _ in range(0, sequences if pool_size > 0 else 0)]
+        # incremented on invalidate, variations generated from an old config are dropped
+        self._versions = [0] * sequences
+        self._queue = SimpleQueue()
+        self._waiting: Set[int] = set()
+        self._lock = Lock()
+        self.requests = 0
+        self.merged = 0
+        self.hits = [0] * len(self._pools)
+        self.misses = [0] * len(self._pools)
+        self.produced = 0
+        self.dropped = 0
+        self.daemon = True
+
+    def request(self, seq_no: int):
+        """
+        Regenerates a sequence, returns straight away, called from any thread.
+        """
+        if seq_no < len(self._pools):
+            try:
+                variation = self._pools[seq_no].popleft()
+            except IndexError:
+                self.misses[seq_no] = self.misses[seq_no] + 1
+            else:
+                self.hits[seq_no] = self.hits[seq_no] + 1
+                self._queue.put(_REFILL)
+                self._apply_variation(seq_no, variation)
+                return
+
+        with self._lock:
+            self.requests = self.requests + 1
+            if seq_no in self._waiting:
+                self.merged = self.merged + 1
+                return
+            self._waiting.add(seq_no)
+        self._queue.put(seq_no)
+
+    def invalidate(self, seq_no: int):
+        """
+        Drops pooled and generating variations of a sequence, e.g. after its config changed.
+        """
+        if seq_no < len(self._versions):
+            self._versions[seq_no] = self._versions[seq_no] + 1
+        if seq_no < len(self._pools):
+            self._pools[seq_no].clear()
+            self._queue.put(_REFILL)
+
+    def pooled(self, seq_no: int) -> int:
+        return len(self._pools[seq_no]) if seq_no < len(self._pools) else 0
+
+    def stats(self) -> dict:
+        return {
+            'hits': sum(self.hits),
+            'misses': sum(self.misses),
+            'produced': self.produced,
+            'pooled': [len(pool) for pool in self._pools],
+            'merged': self.merged,
+            'dropped': self.dropped,
+        }
+
+    def stop(self):
+        self._queue.put(None)
+
+    def _version(self, seq_no: int) -> int:
+        return self._versions[seq_no] if seq_no < len(self._versions) else 0
+
+    def _apply_variation(self, seq_no: int, variation):
+        try:
+            self._apply(seq_no, variation)
+        except Exception as e:
+            _log.error('SEQ%d variation not applied: %s', seq_no, e)
+
+    def _emptiest_pool(self) -> Optional[int]:
+        seq_no = min(range(0, len(self._pools)), key=lambda idx: len(self._pools[idx]), default=None)
+        if seq_no is None or len(self._pools[seq_no]) >= self._pool_size:
+            return None
+        return seq_no
+
+    def _refill(self, seq_no: int):
+        version = self._versions[seq_no]
+        try:
+            variation = self._generate(seq_no)
+        except Exception as e:
+            _log.error('SEQ%d variation generation failed: %s', seq_no, e)
+            return
+        if version != self._versions[seq_no]:
+            self.dropped = self.dropped + 1
+        elif len(self._pools[seq_no]) < self._pool_size:
+            self._pools[seq_no].append(variation)
+            self.produced = self.produced + 1
+
+    def run(self):
+        while True:
+            refill = self._emptiest_pool() if self._refill_interval else None
+            try:
+                seq_no = self._queue.get(timeout=self._refill_interval if refill is not None else None)
+            except Empty:
+                self._refill(refill)
+                continue
+            if seq_no is None:
+                return
+            if seq_no == _REFILL:
+                continue
+
+            with self._lock:
+                self._waiting.discard(seq_no)
+            version = self._version(seq_no)
+            try:
+                variation = self._generate(seq_no)
+            except Exception as e:
+                _log.error('SEQ%d regeneration failed: %s', seq_no, e)
+                continue
+            if version != self._version(seq_no):
+                # config changed while generating, the reload already swapped in its new pattern
+                self.dropped = self.dropped + 1
+                _log.info('SEQ%d variation of the previous config dropped', seq_no)
+                continue
+            self._apply_variation(seq_no, variation)
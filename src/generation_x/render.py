@@ -0,0 +1,112 @@
+from typing import List, Optional, Sequence, Tuple
+
+import mido
+
+from generators import NoteGeneratorFromSequence
+from models import TempoAndMeter
+from pattern import PackedPattern
+
+
+def _sequence_track(
+        seq_no: int,
+        tempo_and_meter: TempoAndMeter,
+        pattern: PackedPattern,
+        duration: float,
+        ticks_per_beat: int,
+        file_tempo: int,
+        channel: int,
+) -> mido.MidiTrack:
+    """
+    Runs sequence generator against a virtual clock and writes its notes as a track.
+    """
+    track = mido.MidiTrack()
+    track.append(mido.MetaMessage('track_name', name=f'SEQ{seq_no} {tempo_and_meter}', time=0))
+    track.append(mido.MetaMessage(
+        'time_signature',
+        numerator=tempo_and_meter.upper_meter,
+        denominator=tempo_and_meter.lower_meter,
+        time=0,
+    ))
+
+    note_length = tempo_and_meter.to_bar_and_note_length().note_length
+    generator = NoteGeneratorFromSequence(bars=pattern)
+
+    prev_tick = 0
+
+    def append(message_type: str, at: float, **kwargs):
+        nonlocal prev_tick
+        tick = round(mido.second2tick(at, ticks_per_beat, file_tempo))
+        track.append(mido.Message(message_type, channel=channel, time=tick - prev_tick, **kwargs))
+        prev_tick = tick
+
+    now = 0.0
+    step_no = 0
+    while now < duration and len(pattern):
+        next_note = generator.next()
+        if next_note and next_note.note:
+            append('note_on', now, note=next_note.note.midi_no, velocity=next_note.velocity)
+            append('note_off', now + note_length * next_note.gate / 100, note=next_note.note.midi_no, velocity=0)
+        step_no = step_no + 1
+        # absolute time from the step count, no accumulated float error
+        now = step_no * note_length
+
+    track.append(mido.MetaMessage('end_of_track', time=0))
+    return track
+
+
+def render_sequences(
+        generated_sequences: List[Tuple[TempoAndMeter, PackedPattern]],
+        duration: float,
+        base_tempo: float = 120,
+        ticks_per_beat: int = 480,
+        channels: Optional[Sequence[int]] = None,
+) -> mido.MidiFile:
+    """
+    Renders generated sequences faster than real time into a multi-track Standard MIDI File.
+
+    Track 0 holds the base tempo, every sequence gets its own track with its meter, notes are placed in absolute
+    time so sequences with different tempos keep their own speed.
+
+    :param generated_sequences: (tempo and meter, pattern) per sequence
+    :param duration: rendered length in seconds
+    :param base_tempo: tempo of the file in bpm
+    :param ticks_per_beat: file resolution
+    :param channels: MIDI channel (0-15) of every sequence as played live, see app.sequence_channels,
+                     sequence number wrapped after 16 when None
+    :return: midi file
+    """
+    file_tempo = mido.bpm2tempo(base_tempo)
+
+    midi_file = mido.MidiFile(type=1, ticks_per_beat=ticks_per_beat)
+    conductor = mido.MidiTrack()
+    conductor.append(mido.MetaMessage('track_name', name='Generation-X', time=0))
+    conductor.append(mido.MetaMessage('set_tempo', tempo=file_tempo, time=0))
+    conductor.append(mido.MetaMessage('end_of_track', time=0))
+    midi_file.tracks.append(conductor)
+
+    for seq_no, (tempo_and_meter, pattern) in enumerate(generated_sequences):
+        midi_file.tracks.append(
+            _sequence_track(
+                seq_no=seq_no,
+                tempo_and_meter=tempo_and_meter,
+                pattern=pattern,
+                duration=duration,
+                ticks_per_beat=ticks_per_beat,
+                file_tempo=file_tempo,
+                channel=channels[seq_no] if channels is not None else seq_no % 16,
+            )
+        )
+
+    return midi_file
+
+
+def render_to_file(
+        generated_sequences: List[Tuple[TempoAndMeter, PackedPattern]],
+        path: str,
+        duration: float,
+        base_tempo: float = 120,
+        channels: Optional[Sequence[int]] = None,
+) -> mido.MidiFile:
+    midi_file = render_sequences(generated_sequences, duration=duration, base_tempo=base_tempo, channels=channels)
+    midi_file.save(path)
+    return midi_file
@@ -0,0 +1,126 @@
+import heapq
+import time
+from threading import Thread, Condition
+from typing import Callable, List, Optional
+
+from sequencer import SequenceControl
+from transport import Transport, TransportState
+from log import get_logger
+
+_log = get_logger('seq')
+
+
+class Scheduler(Thread):
+
+    def __init__(self, transport: Transport, desc='Scheduler', clock: Callable[[], float] = time.monotonic):
+        """
+        Single timing thread firing all sequences from a priority queue of deadlines.
+
+        Deadlines are absolute values of the monotonic clock, every next deadline is the previous one plus the step
+        length, so the sleep error is never accumulated. All sequences are anchored to the same start time on play,
+        which keeps them phase locked.
+
+        :param transport: play / pause / stop state
+        :param desc: description
+        :param clock: monotonic clock of the deadlines
+        """
+        super().__init__(name=desc)
+        self._transport = transport
+        self._clock = clock
+        self._condition = Condition()
+        self._sequences: List[SequenceControl] = []
+        self._queue = []
+        self._playing = False
+        self._epoch = transport.epoch
+        self._rewinds = transport.rewinds
+        self.desc = desc
+
+        self._transport.add_listener(self._on_transport_state)
+        self.daemon = True
+
+    @property
+    def sequences(self) -> List[SequenceControl]:
+        return list(self._sequences)
+
+    def add(self, sequence: SequenceControl) -> SequenceControl:
+        with self._condition:
+            self._sequences.append(sequence)
+            if self._playing:
+                heapq.heappush(self._queue, (self._clock(), len(self._sequences) - 1, sequence))
+            self._condition.notify()
+        return sequence
+
+    def _on_transport_state(self, state: TransportState):
+        with self._condition:
+            self._condition.notify()
+
+    def _wait(self, timeout: Optional[float] = None):
+        """
+        Waits for a state change or the timeout, must be called with the condition acquired.
+        """
+        self._condition.wait(timeout)
+
+    def _anchor(self, start: float):
+        self._queue = [(start, order, sequence) for order, sequence in enumerate(self._sequences)]
+        heapq.heapify(self._queue)
+        for sequence in self._sequences:
+            sequence.started()
+
+    def _next_due(self):
+        """
+        Waits for the earliest deadline, must be called with the condition acquired.
+
+        :return: (deadline, order, sequence) which is due or None on shutdown
+        """
+        while not self._transport.is_shutdown:
+            if not self._transport.is_playing:
+                self._playing = False
+                self._wait()
+                continue
+
+            if not self._playing or self._epoch != self._transport.epoch:
+                if self._rewinds != self._transport.rewinds:
+                    self._rewinds = self._transport.rewinds
+                    for sequence in self._sequences:
+                        sequence.reset()
+                self._anchor(self._clock())
+                self._epoch = self._transport.epoch
+                self._playing = True
+
+            if not self._queue:
+                self._wait()
+                continue
+
+            deadline = self._queue[0][0]
+            now = self._clock()
+            if deadline > now:
+                self._wait(deadline - now)
+                continue
+
+            return heapq.heappop(self._queue)
+
+        return None
+
+    def run(self):
+        for sequence in self._sequences:
+            _log.info('%s %s: %s', sequence.desc, sequence.tempo_and_meter, sequence.tempo_and_meter.to_bar_and_note_length())
+
+        while True:
+            with self._condition:
+                due = self._next_due()
+                if not due:
+                    return
+                deadline, order, sequence = due
+                epoch = self._epoch
+
+            step_length = sequence.step(deadline)
+
+            next_deadline = deadline + step_length
+            now = self._clock()
+            if next_deadline + step_length < now:
+                # fell behind more than a whole step (e.g. process was suspended), re-anchor instead of bursting
+                next_deadline = now
+
+            with self._condition:
+                if self._playing and epoch == self._epoch:
+                    heapq.heappush(self._queue, (next_deadline, order, sequence))
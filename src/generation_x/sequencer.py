@@ -1,37 +1,45 @@
 import time
 from threading import Thread
+from typing import Optional
 
 from models import TempoAndMeter
+from transport import Transport
 from generators import NoteGenerator, NoteGeneratorFromSequence
+from metrics import SequenceTiming
+from timing_plan import TimingPlan
+from log import get_logger
 
+_log = get_logger('seq')
 
-class Sequencer(Thread):
+
+class SequenceControl:
 
     def __init__(self,
                  generator: NoteGenerator,
                  play_target,
-                 play_fn,
-                 tempo_and_meter: TempoAndMeter(tempo=120, upper_meter=4, lower_meter=16),
-                 desc='Sequencer'):
+                 tempo_and_meter: TempoAndMeter,
+                 desc='Sequence',
+                 timing: Optional[SequenceTiming] = None):
         """
-        Simple sequencer which executes play_target with note from generator.
+        Controls shared by every sequence regardless of what drives its timing.
 
         :param generator: note generator, returns next note on every sequence cycle
         :param play_target: function responsible for playing note from generator
-        :param play_fn: function for indicating stop/play
         :param tempo_and_meter: tempo and meter
         :param desc: description
+        :param timing: records scheduled / dequeued times of the steps, None disables instrumentation
         """
-        super(Sequencer, self).__init__(name=desc)
         self._generator = generator
         self._play_target = play_target
         self._tempo_and_meter = tempo_and_meter
+        self._plan = TimingPlan(tempo_and_meter)
         self.original_tempo = tempo_and_meter.tempo
-        self._play = play_fn
         self.desc = desc
+        self.timing = timing
 
-        self.daemon = True
-        self.start()
+    @property
+    def tempo_and_meter(self) -> TempoAndMeter:
+        return self._tempo_and_meter
 
     @property
     def tempo(self):
@@ -39,34 +47,125 @@ class Sequencer(Thread):
 
     @tempo.setter
     def tempo(self, tempo):
-        self._tempo_and_meter.tempo = tempo
+        self._plan.set_tempo(tempo)
+
+    @property
+    def plan(self) -> TimingPlan:
+        return self._plan
+
+    def ramp_tempo(self, tempo: float, bars: float = 1.0, curve: str = 'linear', beats: Optional[float] = None):
+        """
+        Glides to tempo over bars (or quarter note beats), see TimingPlan.ramp_to.
+        """
+        self._plan.ramp_to(tempo, bars, curve, beats)
 
     def set_generator_bars_notes(self, bars_with_notes):
         if isinstance(self._generator, NoteGeneratorFromSequence):
             self._generator.set_new_bars(bars_with_notes)
 
+    def swap_at_bar(self, pattern, tempo_and_meter: Optional[TempoAndMeter] = None):
+        """
+        Replaces the playing pattern on its next bar boundary, the other sequences are not affected.
+
+        :param pattern: new pattern
+        :param tempo_and_meter: new tempo and meter, applied together with the pattern, None keeps the current one
+        """
+        if not isinstance(self._generator, NoteGeneratorFromSequence):
+            return
+        on_swap = (lambda: self._set_tempo_and_meter(tempo_and_meter)) if tempo_and_meter else None
+        self._generator.swap_at_bar(pattern, on_swap)
+
+    def _set_tempo_and_meter(self, tempo_and_meter: TempoAndMeter):
+        # updated in place, the timing plan recompiles on the next step
+        self._tempo_and_meter.upper_meter = tempo_and_meter.upper_meter
+        self._tempo_and_meter.lower_meter = tempo_and_meter.lower_meter
+        self._plan.set_tempo(tempo_and_meter.tempo)
+        self.original_tempo = tempo_and_meter.tempo
+        if self.timing:
+            self.timing.steps_in_bar = tempo_and_meter.upper_meter
+
     def inc_tempo(self):
-        self._tempo_and_meter.tempo = self._tempo_and_meter.tempo + 1
+        self._plan.set_tempo(self._tempo_and_meter.tempo + 1)
 
     def dec_tempo(self):
-        self._tempo_and_meter.tempo = self._tempo_and_meter.tempo - 1
-        if self._tempo_and_meter.tempo < 0:
-            self._tempo_and_meter.tempo = 0
+        self._plan.set_tempo(max(self._tempo_and_meter.tempo - 1, 1))
 
-    def run(self):
-        note_and_bar_length = self._tempo_and_meter.to_bar_and_note_length()
-        print(f'{self.desc} {self._tempo_and_meter}: {note_and_bar_length}')
-        while True:
-            if self._play():
-                next_note = self._generator.next()
+    def reset(self):
+        """
+        Rewinds the sequence to its beginning.
+        """
+        self._generator.reset()
 
-                if next_note and self._play_target:
-                    if next_note.note_length != note_and_bar_length.note_length:
-                        next_note.note_length = note_and_bar_length.note_length
-                    self._play_target(next_note)
-                    # time.sleep(next_note.note_length)
-                    # continue
+    def started(self):
+        """
+        Playback (re)started, timing is measured from the new start.
+        """
+        if self.timing:
+            self.timing.restart()
 
-                time.sleep(note_and_bar_length.note_length)
-                note_and_bar_length = self._tempo_and_meter.to_bar_and_note_length()
+    def step(self, scheduled: Optional[float] = None) -> float:
+        """
+        Plays next note from the generator.
 
+        :param scheduled: time.monotonic() at which the step was due
+        :return: length of the step in seconds, at the current tempo
+        """
+        if self.timing and scheduled is not None:
+            self.timing.record_dequeued(scheduled, time.monotonic())
+
+        # a pattern swap may change tempo and meter, so the step length is taken after the note
+        next_note = self._generator.next()
+        step_length = self._plan.next_step_length()
+
+        if next_note and self._play_target:
+            if next_note.note_length != step_length:
+                next_note.note_length = step_length
+            self._play_target(next_note)
+
+        return step_length
+
+
+class Sequencer(SequenceControl, Thread):
+
+    def __init__(self,
+                 generator: NoteGenerator,
+                 play_target,
+                 transport: Transport,
+                 tempo_and_meter: TempoAndMeter(tempo=120, upper_meter=4, lower_meter=16),
+                 desc='Sequencer',
+                 timing: Optional[SequenceTiming] = None):
+        """
+        Simple sequencer which executes play_target with note from generator.
+
+        :param generator: note generator, returns next note on every sequence cycle
+        :param play_target: function responsible for playing note from generator
+        :param transport: play / pause / stop state
+        :param tempo_and_meter: tempo and meter
+        :param desc: description
+        :param timing: records scheduled / dequeued times of the steps, None disables instrumentation
+        """
+        SequenceControl.__init__(self, generator, play_target, tempo_and_meter, desc, timing)
+        Thread.__init__(self, name=desc)
+        self._transport = transport
+
+        self.daemon = True
+        self.start()
+
+    def run(self):
+        note_and_bar_length = self._tempo_and_meter.to_bar_and_note_length()
+        _log.info('%s %s: %s', self.desc, self._tempo_and_meter, note_and_bar_length)
+        rewinds = self._transport.rewinds
+        epoch = None
+        scheduled = None
+        while self._transport.wait_for_play():
+            if self._transport.rewinds != rewinds:
+                rewinds = self._transport.rewinds
+                self.reset()
+            if self._transport.epoch != epoch:
+                # steps are slept one after another, ideal grid from the play start shows the accumulated drift
+                epoch = self._transport.epoch
+                scheduled = time.monotonic()
+                self.started()
+            step_length = self.step(scheduled)
+            scheduled = scheduled + step_length
+            self._transport.sleep(step_length)
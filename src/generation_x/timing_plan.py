@@ -0,0 +1,173 @@
+import math
+from threading import Lock
+from typing import Optional
+
+from models import TempoAndMeter, QUARTER_NOTES_PER_NOTE
+
+RAMP_CURVES = ('linear', 'exponential')
+
+
+class TempoRamp:
+
+    def __init__(self, start_tempo: float, target_tempo: float, beats: float, curve: str = 'linear'):
+        """
+        Continuous tempo change from start to target tempo over beats (quarter notes).
+
+        Tempo changes linearly or exponentially with the played beats, the time of any beat is the closed form
+        integral of 60 / tempo, so step times are exact however the steps divide the ramp.
+
+        :param start_tempo: tempo at the ramp start
+        :param target_tempo: tempo at the ramp end, kept after it
+        :param beats: ramp length in quarter notes
+        :param curve: linear or exponential
+        """
+        if curve not in RAMP_CURVES:
+            raise ValueError(f'Unsupported tempo ramp curve: {curve}, use one of {RAMP_CURVES}')
+        if start_tempo <= 0 or target_tempo <= 0:
+            raise ValueError(f'Tempo ramp needs positive tempos: {start_tempo} -> {target_tempo}')
+        self.start_tempo = start_tempo
+        self.target_tempo = target_tempo
+        self.beats = beats
+        self.curve = curve
+        if start_tempo == target_tempo:
+            self._rate = 0.0
+        elif curve == 'linear':
+            # tempo grows by rate bpm every beat
+            self._rate = (target_tempo - start_tempo) / beats
+        else:
+            # tempo grows e ** rate times every beat
+            self._rate = math.log(target_tempo / start_tempo) / beats
+        self.duration = self._time_in_ramp(beats)
+
+    def _time_in_ramp(self, beat: float) -> float:
+        if self._rate == 0.0:
+            return beat * 60 / self.start_tempo
+        if self.curve == 'linear':
+            return 60 / self._rate * math.log((self.start_tempo + self._rate * beat) / self.start_tempo)
+        return 60 / (self.start_tempo * self._rate) * (1 - math.exp(-self._rate * beat))
+
+    def tempo_at(self, beat: float) -> float:
+        if beat >= self.beats:
+            return self.target_tempo
+        if self.curve == 'linear':
+            return self.start_tempo + self._rate * beat
+        return self.start_tempo * math.exp(self._rate * beat)
+
+    def time_at(self, beat: float) -> float:
+        """
+        :return: seconds from the ramp start to beat, beats after the ramp are played at the target tempo
+        """
+        if beat >= self.beats:
+            return self.duration + (beat - self.beats) * 60 / self.target_tempo
+        return self._time_in_ramp(beat)
+
+
+class TimingPlan:
+
+    def __init__(self, tempo_and_meter: TempoAndMeter):
+        """
+        Compiled timing of one sequence, step and bar lengths are computed once and only recompiled when tempo or
+        meter changes. During a tempo ramp every step length is the difference of two closed form beat times.
+
+        The plan keeps tempo_and_meter.tempo at the tempo of the next step, changes of tempo_and_meter made from
+        outside are picked up on the next step (and cancel a running ramp). Tempo and ramp may be changed from any
+        thread, ramp and compiled state are only changed under a lock, so a step never sees half of a change.
+
+        Example:
+        >>> plan = TimingPlan(TempoAndMeter(tempo=120, upper_meter=4, lower_meter=16))
+        >>> plan.next_step_length(), plan.bar_length
+        (0.125, 0.5)
+        >>> plan.ramp_to(240, bars=2, curve='exponential')
+        >>> steps = [plan.next_step_length() for _ in range(0, 8)]
+        >>> round(sum(steps), 6) == round(TempoRamp(120, 240, 2, 'exponential').duration, 6), plan.tempo
+        (True, 240)
+        >>> plan.next_step_length()
+        0.0625
+
+        :param tempo_and_meter: tempo and meter of the sequence
+        """
+        self._tempo_and_meter = tempo_and_meter
+        self._ramp: Optional[TempoRamp] = None
+        # quarter notes played since the ramp start
+        self._beat = 0.0
+        self.step_beats = 0.0
+        self.step_length = 0.0
+        self.bar_length = 0.0
+        self.compiles = 0
+        self._lock = Lock()
+        self._compile()
+
+    def _compile(self):
+        tempo_and_meter = self._tempo_and_meter
+        if tempo_and_meter.lower_meter not in QUARTER_NOTES_PER_NOTE:
+            raise ValueError(f'Wrong lower meter value: {tempo_and_meter.lower_meter}!')
+        self.step_beats = QUARTER_NOTES_PER_NOTE[tempo_and_meter.lower_meter]
+        self.step_length = 60 / tempo_and_meter.tempo * self.step_beats
+        self.bar_length = self.step_length * tempo_and_meter.upper_meter
+        self._key = (tempo_and_meter.tempo, tempo_and_meter.upper_meter, tempo_and_meter.lower_meter)
+        self.compiles = self.compiles + 1
+
+    @property
+    def tempo(self) -> float:
+        return self._tempo_and_meter.tempo
+
+    @property
+    def ramping(self) -> bool:
+        return self._ramp is not None
+
+    def set_tempo(self, tempo: float):
+        """
+        Changes tempo from the next step, a running ramp is cancelled.
+        """
+        with self._lock:
+            self._ramp = None
+            self._tempo_and_meter.tempo = tempo
+            self._compile()
+
+    def ramp_to(self, tempo: float, bars: float = 1.0, curve: str = 'linear', beats: Optional[float] = None):
+        """
+        Glides from the current tempo to tempo over bars, starting with the next step.
+
+        :param tempo: target tempo
+        :param bars: ramp length in bars of the sequence meter, tempo is set straight away when not positive
+        :param curve: linear or exponential
+        :param beats: ramp length in quarter notes, overrides bars
+        """
+        if beats is None:
+            beats = bars * self._tempo_and_meter.upper_meter * self.step_beats
+        if beats <= 0 or tempo == self._tempo_and_meter.tempo:
+            self.set_tempo(tempo)
+            return
+        with self._lock:
+            self._ramp = TempoRamp(self._tempo_and_meter.tempo, tempo, beats, curve)
+            self._beat = 0.0
+
+    def next_step_length(self) -> float:
+        """
+        :return: length of the next step in seconds, advances a running ramp by one step
+        """
+        tempo_and_meter = self._tempo_and_meter
+        if self._ramp is None and \
+                (tempo_and_meter.tempo, tempo_and_meter.upper_meter, tempo_and_meter.lower_meter) == self._key:
+            return self.step_length
+
+        with self._lock:
+            if (tempo_and_meter.tempo, tempo_and_meter.upper_meter, tempo_and_meter.lower_meter) != self._key:
+                self._ramp = None
+                self._compile()
+
+            ramp = self._ramp
+            if ramp is None:
+                return self.step_length
+
+            beat = self._beat + self.step_beats
+            step_length = ramp.time_at(beat) - ramp.time_at(self._beat)
+            self._beat = beat
+            if beat >= ramp.beats:
+                self._ramp = None
+                tempo_and_meter.tempo = ramp.target_tempo
+                self._compile()
+            else:
+                tempo_and_meter.tempo = ramp.tempo_at(beat)
+                self._key = (tempo_and_meter.tempo, tempo_and_meter.upper_meter, tempo_and_meter.lower_meter)
+            return step_length
@@ -0,0 +1,155 @@
+import signal
+import time
+from enum import Enum
+from threading import Condition
+from typing import Callable, List, Optional
+
+from log import get_logger
+
+_log = get_logger('app')
+
+
+class TransportState(Enum):
+    STOPPED = 'stopped'
+    PLAYING = 'playing'
+    PAUSED = 'paused'
+
+
+class Transport:
+
+    def __init__(self):
+        """
+        Play / pause / stop state shared by all sequencers.
+
+        Built on a Condition, so waiting sequencers are woken straight away on every state change and nothing is
+        busy-waiting while stopped. Stop rewinds the sequences, pause keeps their position.
+        """
+        self._condition = Condition()
+        self._state = TransportState.STOPPED
+        self._shutdown = False
+        self._epoch = 0
+        self._rewinds = 0
+        self._listeners: List[Callable[[TransportState], None]] = []
+
+    @property
+    def state(self) -> TransportState:
+        return self._state
+
+    @property
+    def is_playing(self) -> bool:
+        return self._state == TransportState.PLAYING and not self._shutdown
+
+    @property
+    def is_shutdown(self) -> bool:
+        return self._shutdown
+
+    @property
+    def epoch(self) -> int:
+        """
+        Incremented on every playback start, sequencers use it to re-anchor their timing.
+        """
+        return self._epoch
+
+    @property
+    def rewinds(self) -> int:
+        """
+        Incremented on every stop, sequencers use it to reset their generators to the beginning.
+        """
+        return self._rewinds
+
+    def add_listener(self, listener: Callable[[TransportState], None]):
+        """
+        Registers function called with the new state on every state change (also on shutdown).
+        Listeners are called from the thread changing the state and must not block.
+        """
+        self._listeners.append(listener)
+
+    def _set_state(self, state: TransportState):
+        with self._condition:
+            if self._shutdown or self._state == state:
+                return
+            if state == TransportState.PLAYING:
+                self._epoch = self._epoch + 1
+            if state == TransportState.STOPPED:
+                self._rewinds = self._rewinds + 1
+            self._state = state
+            self._condition.notify_all()
+
+        for listener in self._listeners:
+            listener(state)
+
+    def play(self):
+        self._set_state(TransportState.PLAYING)
+
+    def pause(self):
+        self._set_state(TransportState.PAUSED)
+
+    def stop(self):
+        self._set_state(TransportState.STOPPED)
+
+    def shutdown(self):
+        with self._condition:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            self._state = TransportState.STOPPED
+            self._condition.notify_all()
+
+        for listener in self._listeners:
+            listener(TransportState.STOPPED)
+
+    def wait_for_play(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until playback is started or transport is shut down.
+
+        :param timeout: max time to wait in seconds, None waits forever
+        :return: True if playing
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.is_playing or self._shutdown, timeout)
+            return self.is_playing
+
+    def sleep_until(self, deadline: float) -> bool:
+        """
+        Sleeps until the monotonic clock deadline, returns early if playback is stopped, paused or restarted.
+
+        :param deadline: time.monotonic() value
+        :return: True if still playing in the same epoch after the sleep
+        """
+        with self._condition:
+            epoch = self._epoch
+            while self.is_playing and self._epoch == epoch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self._condition.wait(remaining)
+            return False
+
+    def sleep(self, seconds: float) -> bool:
+        """
+        Sleeps given time, returns early if playback is stopped, paused or restarted.
+
+        :param seconds: time to sleep
+        :return: True if still playing in the same epoch after the sleep
+        """
+        return self.sleep_until(time.monotonic() + seconds)
+
+    def wait_shutdown(self, poll_interval: float = 1.0):
+        """
+        Blocks until transport is shut down, replacement for busy `while True: pass` in the main thread.
+        Wait is split into poll_interval chunks so signal handlers are always served on time.
+        """
+        with self._condition:
+            while not self._shutdown:
+                self._condition.wait(poll_interval)
+
+    def install_signal_handlers(self):
+        """
+        Shuts the transport down on SIGINT / SIGTERM, must be called from the main thread.
+        """
+        def handler(signum, frame):
+            _log.info('%s received, shutting down', signal.Signals(signum).name)
+            self.shutdown()
+
+        signal.signal(signal.SIGINT, handler)
+        signal.signal(signal.SIGTERM, handler)
@@ -0,0 +1,11 @@
+import pytest
+
+import log
+
+
+@pytest.fixture(autouse=True)
+def flush_log():
+    # records are written by the consumer thread, pending ones belong to the test output and must not be left
+    # for the exit, when the captured stream is already closed
+    yield
+    log.flush()
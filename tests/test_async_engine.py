@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from async_engine import AsyncTransport, AsyncSequencer
+from generators import NoteGeneratorFromSequence
+from models import TempoAndMeter
+from pattern import PackedPattern
+from transport import Transport
+
+NOTES = [60, 61, 62, 63]
+
+
+def _sequencer(name: str, tempo: float, fired: list, loop_time) -> AsyncSequencer:
+    pattern = PackedPattern()
+    for midi_no in NOTES:
+        pattern.append_note(midi_no, 100, 1.0)
+    pattern.end_bar()
+
+    def play(note):
+        # when() of the executed handle is the deadline given to call_at
+        fired.append((loop_time(), sequencer._pending.when(), name, note.note.midi_no))
+
+    sequencer = AsyncSequencer(
+        generator=NoteGeneratorFromSequence(bars=pattern),
+        play_target=play,
+        tempo_and_meter=TempoAndMeter(tempo=tempo, upper_meter=4, lower_meter=16),
+        desc=name,
+    )
+    return sequencer
+
+
+def test_play_pause_play_shutdown():
+    transport = Transport()
+    async_transport = AsyncTransport(transport=transport)
+    loop = async_transport.loop
+    fired = []
+    sequencers = {
+        'A': async_transport.add(_sequencer('A', 600, fired, loop.time)),
+        'B': async_transport.add(_sequencer('B', 400, fired, loop.time)),
+    }
+    steps = {'A': 0.025, 'B': 0.0375}
+    events = {}
+
+    def pause():
+        transport.pause()
+        # runs right after the bridged state change
+        loop.call_soon(lambda: events.setdefault('fired_when_paused', len(fired)))
+
+    def check_cancelled():
+        events['cancelled'] = [sequencer._pending.cancelled() for sequencer in sequencers.values()]
+        events['fired_while_paused'] = len(fired)
+
+    def play():
+        events['resumed_fired'] = len(fired)
+        transport.play()
+
+    loop.call_later(0.2, pause)
+    loop.call_later(0.25, check_cancelled)
+    loop.call_later(0.35, play)
+    loop.call_later(0.6, transport.shutdown)
+    # never hangs the test run
+    watchdog = threading.Timer(5.0, transport.shutdown)
+    watchdog.start()
+    transport.play()
+    try:
+        async_transport.run_until_shutdown()
+    finally:
+        watchdog.cancel()
+        loop.close()
+
+    # pause cancelled the pending steps, nothing fired until play
+    assert events['cancelled'] == [True, True]
+    assert events['fired_when_paused'] == events['fired_while_paused'] == events['resumed_fired']
+    before, after = fired[:events['resumed_fired']], fired[events['resumed_fired']:]
+
+    for name, step in steps.items():
+        first, second = [[entry for entry in part if entry[2] == name] for part in (before, after)]
+        assert len(first) >= 3 and len(second) >= 3
+        for part in (first, second):
+            # call_at deadlines on an exact grid from the (re)start, fired on time
+            start = part[0][1]
+            assert [when for _, when, _, _ in part] == pytest.approx(
+                [start + idx * step for idx in range(0, len(part))], abs=1e-9)
+            # the loop runs handles due within its clock resolution
+            assert all(when - 0.001 <= at < when + 0.05 for at, when, _, _ in part)
+        # pause keeps the position
+        assert [midi_no for _, _, _, midi_no in first + second] == \
+               [NOTES[idx % len(NOTES)] for idx in range(0, len(first) + len(second))]
+
+    # both sequences are anchored to the same restart time
+    assert after[0][1] == next(when for _, when, name, _ in after if name == 'B')
+    assert async_transport.started_at == after[0][1]
@@ -0,0 +1,96 @@
+import random
+from collections import Counter
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from batch import walk_positions_batch, generate_random_melody_batch, pause_probability, \
+    CLIP_COLUMNS_MIN_CANDIDATES  # noqa: E402
+from models import MusicScale, MusicScaleType, TempoAndMeter  # noqa: E402
+from music_utils import walk_positions, generate_random_melody, get_random_velocity  # noqa: E402
+
+# max total variation distance between the histograms of the batch and the pure Python melodies
+MAX_DISTANCE = 0.03
+
+
+def _steps(candidates: int, count: int, deviation: int, seed: int = 1) -> np.ndarray:
+    rng = random.Random(seed)
+    return np.array([[rng.randint(-1, 1) * deviation for _ in range(0, count)] for _ in range(0, candidates)],
+                    dtype=np.int64).reshape(candidates, count)
+
+
+@pytest.mark.parametrize('boundary', ['clip', 'reflect'])
+@pytest.mark.parametrize('candidates', [1, 7, CLIP_COLUMNS_MIN_CANDIDATES])
+@pytest.mark.parametrize('count', [0, 1, 2, 5, 64, 300])
+@pytest.mark.parametrize('start, min_idx, max_idx', [(5, 0, 10), (3, 3, 3), (25, 0, 20), (0, 5, 9)])
+def test_walk_positions_batch_matches_python(boundary, candidates, count, start, min_idx, max_idx):
+    for deviation in (1, 3, 7):
+        steps = _steps(candidates, count, deviation)
+        positions = walk_positions_batch(steps, start, min_idx, max_idx, boundary)
+        assert positions.shape == (candidates, count + 1)
+        assert positions.tolist() == [
+            walk_positions(start, row.tolist(), min_idx, max_idx, boundary) for row in steps
+        ]
+
+
+def test_unbounded_walk():
+    steps = _steps(3, 50, 2)
+    assert walk_positions_batch(steps, 4).tolist() == [walk_positions(4, row.tolist()) for row in steps]
+
+
+def test_melody_batch_to_pattern():
+    tempo_and_meter = TempoAndMeter(tempo=120, upper_meter=5, lower_meter=8)
+    batch = generate_random_melody_batch(
+        MusicScale(tonic='f', scale=MusicScaleType.MAJOR), np.random.default_rng(3), bars=3,
+        tempo_and_meter=tempo_and_meter, rest_probability=0.3, candidates=4,
+    )
+    assert len(batch) == 4
+    pattern = batch.to_pattern(2)
+    assert (len(pattern), pattern.bars_count) == (15, 3)
+    assert list(pattern.rest) == batch.rest[2].reshape(-1).astype(int).tolist()
+    assert all(velocity == 0 for velocity, rest in zip(pattern.velocity, pattern.rest) if rest)
+    assert all(0 < velocity <= 127 for velocity, rest in zip(pattern.velocity, pattern.rest) if not rest)
+    assert set(pattern.length) == {tempo_and_meter.to_bar_and_note_length().note_length}
+
+
+def _distance(a: Counter, b: Counter) -> float:
+    a_total, b_total = sum(a.values()), sum(b.values())
+    return sum(abs(a[key] / a_total - b[key] / b_total) for key in a.keys() | b.keys()) / 2
+
+
+def _histograms(pattern) -> dict:
+    notes = [idx for idx, rest in enumerate(pattern.rest) if not rest]
+    return {
+        'rest': Counter(pattern.rest),
+        'midi_no': Counter(pattern.midi_no[idx] for idx in notes),
+        'velocity': Counter(pattern.velocity[idx] for idx in notes),
+        'length': Counter(pattern.length),
+        'gate': Counter(pattern.gate),
+    }
+
+
+@pytest.mark.parametrize('pause_factor', [0, 30, 70])
+@pytest.mark.parametrize('scale, upper_meter', [(MusicScaleType.NATURAL_MINOR, 5), (MusicScaleType.MAJOR, 4)])
+def test_melody_batch_matches_python_distributions(pause_factor, scale, upper_meter):
+    music_scale = MusicScale(tonic='d', scale=scale)
+    tempo_and_meter = TempoAndMeter(tempo=90, upper_meter=upper_meter, lower_meter=8)
+    bars = 20000
+    rng = random.Random(7)
+    python_pattern = generate_random_melody(
+        music_scale, octave=3, bars=bars, tempo_and_meter=tempo_and_meter,
+        pause_fn=lambda: rng.randint(0, 100) < pause_factor,
+        velocity_fn=lambda n, t: get_random_velocity(n, t, rng=rng),
+        rng=rng,
+    )
+    batch_pattern = generate_random_melody_batch(
+        music_scale, np.random.default_rng(7), octave=3, bars=bars, tempo_and_meter=tempo_and_meter,
+        rest_probability=pause_probability(pause_factor),
+    ).to_pattern()
+    python_pattern.set_gate(100)
+
+    assert len(batch_pattern) == len(python_pattern) == bars * upper_meter
+    python_histograms = _histograms(python_pattern)
+    for name, histogram in _histograms(batch_pattern).items():
+        assert histogram.keys() == python_histograms[name].keys(), name
+        assert _distance(histogram, python_histograms[name]) < MAX_DISTANCE, name
@@ -0,0 +1,63 @@
+import pytest
+
+import machine_jam
+from benchmarks import compare, track_scaling, _playback
+from log import configure
+
+
+@pytest.fixture
+def quiet_steps():
+    configure(levels={'seq': 'warn', 'gen': 'warn'})
+    yield
+    configure()
+
+
+def test_compare_throughput():
+    baseline = {'generate': {'ops_per_sec': 1000.0}}
+    assert compare({'generate': {'ops_per_sec': 800.0}}, baseline) == []
+    assert compare({'generate': {'ops_per_sec': 700.0}}, baseline) == ['generate.ops_per_sec: 1000.0 -> 700.0']
+
+
+def test_compare_latency_ignores_noise():
+    baseline = {'playback': {'p99_ms': 0.5, 'max_ms': 10.0}}
+    assert compare({'playback': {'p99_ms': 1.5, 'max_ms': 12.0}}, baseline) == []
+    assert compare({'playback': {'p99_ms': 0.5, 'max_ms': 20.0}}, baseline) == ['playback.max_ms: 10.0 -> 20.0']
+
+
+def test_compare_cpu_percent():
+    baseline = {'playback': {'cpu_percent': 10.0}}
+    assert compare({'playback': {'cpu_percent': 5.0}}, baseline) == []
+    assert compare({'playback': {'cpu_percent': 20.0}}, baseline) == ['playback.cpu_percent: 10.0 -> 20.0']
+
+
+def _timing(lateness_ms: float, drift_ms: float = 0.5) -> dict:
+    return {'dequeued_p99_ms': lateness_ms, 'dequeued_max_ms': lateness_ms, 'sent_p99_ms': lateness_ms,
+            'sent_max_ms': lateness_ms, 'drift_per_bar_max_ms': drift_ms}
+
+
+def test_track_scaling_bounds():
+    results = {
+        'playback_scheduler': _timing(1.0),
+        'playback_scheduler_16_tracks': _timing(11.9),
+        'playback_scheduler_64_tracks': _timing(2.0, drift_ms=12.0),
+        # no 6 track result to compare with
+        'playback_asyncio_16_tracks': _timing(100.0),
+    }
+    assert track_scaling(results) == [
+        'playback_scheduler_64_tracks.drift_per_bar_max_ms: 12.0 > 11.0 (6 tracks: 0.5)',
+    ]
+    assert len(track_scaling(results, factor=1.0, slack_ms=1.0)) == 5
+
+
+def test_track_playback_stays_stable(quiet_steps):
+    results = {
+        'playback_scheduler': _playback('scheduler', 0.5),
+        'playback_scheduler_16_tracks': _playback('scheduler', 0.5, sequences=16),
+    }
+    assert track_scaling(results) == []
+
+    tracks = results['playback_scheduler_16_tracks']
+    assert tracks['messages'] > results['playback_scheduler']['messages']
+    # steps go through the Jam display, muted tracks (0 and 8) keep showing theirs
+    assert tracks['display_messages'] > 0
+    assert machine_jam.track_steps(8) != [0] * machine_jam.JAM_ROWS
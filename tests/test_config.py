@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from app import sequence_channels
+from config import parse_sequences_config, sequences_config_parser
+
+
+def test_walk_config():
+    seq_cfg = parse_sequences_config('w|2|3|40|2|-5.7|3/8')
+    assert seq_cfg['generation_type'] == 'walk'
+    assert seq_cfg['bars_length_fn']() == 2
+    assert seq_cfg['root_octave_fn']() == 3
+    assert seq_cfg['tempo_fn']() == 40
+    assert seq_cfg['steps_deviation'] == 2
+    assert (seq_cfg['min_pitch'], seq_cfg['max_pitch']) == (-5, 7)
+    assert (int(seq_cfg['upper_meter']), int(seq_cfg['lower_meter'])) == (3, 8)
+
+
+def test_walk_config_defaults():
+    seq_cfg = parse_sequences_config('w|2|4|30')
+    assert seq_cfg['generation_type'] == 'walk'
+    assert seq_cfg['steps_deviation'] == 1
+    assert (seq_cfg['min_pitch'], seq_cfg['max_pitch']) == (-8, 8)
+    assert seq_cfg['gate'] == 90
+
+
+def test_walk_config_randomized_values_use_sequence_rng():
+    config = 'w|2:-1.1|4|30:-5.5|2|-8.8|4/4'
+    first = parse_sequences_config(config, random.Random(7))
+    second = parse_sequences_config(config, random.Random(7))
+    tempos = [first['tempo_fn']() for _ in range(0, 20)]
+    assert tempos == [second['tempo_fn']() for _ in range(0, 20)]
+    assert all(25 <= tempo <= 35 for tempo in tempos)
+
+
+def test_gate_part_anywhere_after_type():
+    assert parse_sequences_config('w|gate=60|2|4|30|2|-8.8|4/4')['gate'] == 60
+    seq_cfg = parse_sequences_config('r|2|4|30|20|4/4|gate=75')
+    assert seq_cfg['gate'] == 75
+    assert seq_cfg['pause_factor'] == 20
+
+
+def test_unsupported_type():
+    with pytest.raises(ValueError):
+        parse_sequences_config('x|2|4|30')
+
+
+def test_seeded_sequences_are_reproducible():
+    configs = ['w|2|4|30:-5.5|2|-8.8|4/4', 'r|2|4|30:-5.5|30|4/4']
+    first = sequences_config_parser(configs, seed=3)
+    second = sequences_config_parser(configs, seed=3)
+    assert [seq_cfg['seed'] for seq_cfg in first] == [seq_cfg['seed'] for seq_cfg in second]
+    assert first[0]['seed'] != first[1]['seed']
+    assert [seq_cfg['tempo_fn']() for seq_cfg in first] == [seq_cfg['tempo_fn']() for seq_cfg in second]
+    assert all(seq_cfg['seed'] is None for seq_cfg in sequences_config_parser(configs))
+
+
+def test_channel_part():
+    seq_cfg = parse_sequences_config('r|2|4|30|20|4/4|ch=10')
+    assert seq_cfg['channel'] == 9
+    assert seq_cfg['pause_factor'] == 20
+    assert parse_sequences_config('w|ch=1|gate=50|2|4|30|2|-8.8|4/4')['channel'] == 0
+    assert 'channel' not in parse_sequences_config('r|2|4|30|20|4/4')
+
+
+@pytest.mark.parametrize('channel', ['0', '17'])
+def test_channel_out_of_range(channel):
+    with pytest.raises(ValueError):
+        parse_sequences_config(f'r|2|4|30|20|4/4|ch={channel}')
+
+
+def test_sequence_channels():
+    configs = ['r|2|4|30|20|4/4'] * 18
+    configs[2] = 'r|2|4|30|20|4/4|ch=16'
+    channels = sequence_channels(sequences_config_parser(configs))
+    assert list(channels[:4]) == [0, 1, 15, 3]
+    assert list(channels[16:]) == [0, 1]
@@ -0,0 +1,166 @@
+import os
+import time
+
+from app import reload_sequences, generate_sequences_by_config_params
+from config import sequences_config_parser
+from config_watcher import ConfigWatcher, diff_sequences_config, load_sequences_config
+from generators import NoteGeneratorFromSequence
+from models import MusicScale, MusicScaleType, RunSettings
+from sequencer import SequenceControl
+from transport import Transport
+
+CONFIG = ['w|2|4|{tempo}|1|-5.5|4/4', 'r|1|3|40|{rest_factor}|3/4']
+VALUES = {'tempo': 30, 'rest_factor': 50}
+
+
+def _write(path, lines):
+    path.write_text('\n'.join(lines) + '\n')
+
+
+def _formatted(sequences_config):
+    return [config.format(**VALUES) for config in sequences_config]
+
+
+def _run_settings(sequences_config):
+    music_scale = MusicScale(tonic='c', scale=MusicScaleType.MAJOR)
+    config_params = sequences_config_parser(sequences_config, seed=3)
+    run_settings = RunSettings(
+        sequencers=[], transport=Transport(), quantize_to_scale=None, music_scale=music_scale,
+        sequences_config_params=config_params,
+        generated_sequences=generate_sequences_by_config_params(config_params, music_scale),
+    )
+    played = [[] for _ in sequences_config]
+    for seq_no, (tempo_and_meter, pattern) in enumerate(run_settings.generated_sequences):
+        run_settings.sequencers.append(SequenceControl(
+            NoteGeneratorFromSequence(pattern), played[seq_no].append, tempo_and_meter.model_copy(),
+            desc=f'SEQ{seq_no}'
+        ))
+    return run_settings, played
+
+
+def _notes(steps):
+    return [(step.note, step.velocity) for step in steps]
+
+
+def test_load_replaces_placeholders_and_skips_comments(tmp_path):
+    path = tmp_path / 'sequences.txt'
+    _write(path, ['# walk and random', CONFIG[0], '', CONFIG[1]])
+    assert load_sequences_config(str(path), **VALUES) == ['w|2|4|30|1|-5.5|4/4', 'r|1|3|40|50|3/4']
+
+
+def test_diff_sequences_config():
+    config_params = [{'config': 'a'}, {'config': 'b'}, {'config': 'c'}]
+    assert diff_sequences_config(config_params, ['a', 'x', 'c']) == ([1], [], [])
+    assert diff_sequences_config(config_params, ['a', 'b', 'c', 'd']) == ([], [3], [])
+    assert diff_sequences_config(config_params, ['y', 'b']) == ([0], [], [2])
+
+
+def test_watcher_detects_changes(tmp_path):
+    path = tmp_path / 'sequences.txt'
+    _write(path, CONFIG)
+    changes = []
+    watcher = ConfigWatcher(str(path), changes.append, values=VALUES)
+    assert not watcher.check()
+
+    _write(path, [CONFIG[0], 'r|1|3|45|{rest_factor}|3/4'])
+    assert watcher.check()
+    assert changes == [['w|2|4|30|1|-5.5|4/4', 'r|1|3|45|50|3/4']]
+    # signature is taken once per change
+    assert not watcher.check()
+
+    # same size, only the modification time changes
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert watcher.check()
+    assert len(changes) == 2 and watcher.reloads == 2
+
+    # a missing file is not a change, the next good version is
+    path.unlink()
+    assert not watcher.check()
+    _write(path, CONFIG)
+    assert watcher.check()
+    assert len(changes) == 3
+
+
+def test_watcher_thread_polls(tmp_path):
+    path = tmp_path / 'sequences.txt'
+    _write(path, CONFIG)
+    changes = []
+    watcher = ConfigWatcher(str(path), changes.append, values=VALUES, interval=0.005)
+    watcher.start()
+    try:
+        _write(path, CONFIG + ['w|1|3|{tempo}'])
+        deadline = time.monotonic() + 2
+        while not changes and time.monotonic() < deadline:
+            time.sleep(0.005)
+        assert changes == [['w|2|4|30|1|-5.5|4/4', 'r|1|3|40|50|3/4', 'w|1|3|30']]
+    finally:
+        watcher.stop()
+        watcher.join(timeout=1)
+    assert not watcher.is_alive()
+
+
+def test_unreadable_config_is_not_applied(tmp_path):
+    path = tmp_path / 'sequences.txt'
+    _write(path, CONFIG)
+    changes = []
+    watcher = ConfigWatcher(str(path), changes.append, values=VALUES)
+    _write(path, CONFIG + ['w|1|3|{unknown_placeholder}'])
+    assert not watcher.check()
+    assert changes == [] and watcher.reloads == 0
+
+
+def test_reload_swaps_on_the_next_bar():
+    run_settings, played = _run_settings(_formatted(CONFIG))
+    old_tempo_and_meter, old_pattern = run_settings.generated_sequences[0]
+    other = run_settings.generated_sequences[1]
+    first, second = run_settings.sequencers
+    bar = old_pattern.bar_offsets[1]
+    assert bar > 1
+
+    old_step = first.step()
+    second.step()
+    regenerated = reload_sequences(run_settings, ['w|1|4|45|1|-5.5|4/4', 'r|1|3|40|50|3/4'])
+    assert regenerated == [0]
+    new_tempo_and_meter, new_pattern = run_settings.generated_sequences[0]
+    assert new_tempo_and_meter.tempo == 45 and old_tempo_and_meter.tempo == 30
+    assert run_settings.generated_sequences[1] is other
+
+    # the rest of the playing bar keeps the old pattern and tempo
+    assert [first.step() for _ in range(1, bar)] == [old_step] * (bar - 1)
+    assert first.tempo == 30
+    assert _notes(played[0]) == _notes(old_pattern.step(idx) for idx in range(0, bar))
+
+    # the new pattern starts from its beginning with its tempo on the bar boundary
+    assert first.step() < old_step
+    assert first.tempo == 45
+    assert _notes(played[0][bar:]) == _notes([new_pattern.step(0)])
+
+    # the unchanged sequence plays on untouched
+    second.step()
+    assert not second._generator.swap_pending
+    assert _notes(played[1]) == _notes(other[1].step(idx) for idx in range(0, 2))
+
+
+def test_invalid_config_keeps_running_sequences():
+    run_settings, played = _run_settings(_formatted(CONFIG))
+    config_params = list(run_settings.sequences_config_params)
+    generated_sequences = list(run_settings.generated_sequences)
+
+    # only the broken sequence keeps its pattern, the valid change is still applied
+    regenerated = reload_sequences(run_settings, ['w|x|4|30|1|-5.5|4/4', 'r|1|3|45|50|3/4'])
+    assert regenerated == [1]
+    assert run_settings.sequences_config_params[0] is config_params[0]
+    assert run_settings.generated_sequences[0] is generated_sequences[0]
+    assert not run_settings.sequencers[0]._generator.swap_pending
+    assert run_settings.sequencers[1]._generator.swap_pending
+
+    pattern = generated_sequences[0][1]
+    for _ in range(0, len(pattern) + 1):
+        run_settings.sequencers[0].step()
+    assert run_settings.sequencers[0].tempo == 30
+    assert _notes(played[0]) == _notes(pattern.step(idx % len(pattern)) for idx in range(0, len(pattern) + 1))
+
+    # number of sequences changes only on restart
+    assert reload_sequences(run_settings, ['w|x|4|30|1|-5.5|4/4']) == []
+    assert len(run_settings.generated_sequences) == 2
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from corpus import corpus_tasks, generate_chunk, generate_corpus
+from models import MusicScale, MusicScaleType
+from music_utils import scale_pitches
+from pattern import PackedPattern
+
+RANDOM_CONFIG = 'r|2:-1.1|3|60:-10.10|40|5/8|gate=80'
+ARP_CONFIG = 'a|2|5|4|60|3th|d|4/4'
+
+
+def _records(task) -> list:
+    count, lines = generate_chunk(task)
+    records = [json.loads(line) for line in lines.splitlines()]
+    assert len(records) == count
+    return records
+
+
+def test_corpus_tasks_chunks():
+    tasks = corpus_tasks([RANDOM_CONFIG, ARP_CONFIG], ['c', 'a'], ['major'], 10, 7, 4, batch=True)
+    assert len(tasks) == 2 * 2 * 3
+    assert sum(task[5] for task in tasks) == 40
+    assert [task[4] for task in tasks[:3]] == [0, 4, 8]
+    assert all(task[-1] for task in tasks)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 10])
+def test_chunks_do_not_depend_on_chunk_size(chunk_size):
+    expected = _records((RANDOM_CONFIG, 'c', 'major', 5, 0, 10, False))
+    records = []
+    for task in corpus_tasks([RANDOM_CONFIG], ['c'], ['major'], 10, 5, chunk_size):
+        records.extend(_records(task))
+    assert records == expected
+
+
+def test_batch_random_chunk():
+    pytest.importorskip('numpy')
+    python_records = _records((RANDOM_CONFIG, 'f', 'minor', 3, 0, 50, False))
+    records = _records((RANDOM_CONFIG, 'f', 'minor', 3, 0, 50, True))
+
+    assert records == _records((RANDOM_CONFIG, 'f', 'minor', 3, 0, 50, True))
+    assert all(record['batch'] for record in records)
+    scale = set(scale_pitches(MusicScale(tonic='f', scale=MusicScaleType('minor'))))
+    for record, python_record in zip(records, python_records):
+        # tempo, octave and bars are drawn from the same pattern RNG streams
+        assert (record['seed'], record['tempo'], record['upper_meter']) == \
+               (python_record['seed'], python_record['tempo'], python_record['upper_meter'])
+        pattern = PackedPattern.from_dict(record['pattern'])
+        python_pattern = PackedPattern.from_dict(python_record['pattern'])
+        assert pattern.bars_count == python_pattern.bars_count
+        assert list(pattern.length) == list(python_pattern.length)
+        assert {midi_no for midi_no, rest in zip(pattern.midi_no, pattern.rest) if not rest} <= scale
+        assert all(gate == (0 if rest else 80) for gate, rest in zip(pattern.gate, pattern.rest))
+
+
+def test_batch_keeps_other_types():
+    pytest.importorskip('numpy')
+    assert _records((ARP_CONFIG, 'c', 'major', 3, 0, 4, True)) == _records((ARP_CONFIG, 'c', 'major', 3, 0, 4, False))
+
+
+def test_generate_corpus(tmp_path):
+    path = tmp_path / 'corpus.jsonl'
+    stats = generate_corpus(str(path), [RANDOM_CONFIG, ARP_CONFIG], ['c'], ['major', 'minor'], 6, 11, jobs=1,
+                            chunk_size=4)
+    lines = path.read_text().splitlines()
+    assert stats['patterns'] == len(lines) == 2 * 2 * 6
+    assert [json.loads(line)['config'] for line in lines].count(ARP_CONFIG) == 12
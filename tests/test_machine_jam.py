@@ -0,0 +1,163 @@
+import time
+
+import mido
+import pytest
+
+import machine_jam
+from jam_display import JamFramebuffer
+from machine_jam import JAM_BANK_SIZE, JAM_ROWS
+from models import MusicScale, MusicScaleType, RunSettings
+from transport import Transport, TransportState
+
+
+class RecordingPort:
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+def _framebuffer(monkeypatch, tracks: int) -> JamFramebuffer:
+    machine_jam.init_tracks(tracks)
+    framebuffer = JamFramebuffer(RecordingPort(), machine_jam.tracker_midi_notes)
+    monkeypatch.setattr(machine_jam, '_jam_framebuffer', framebuffer)
+    return framebuffer
+
+
+def test_control_map_of_a_bank():
+    control_map = machine_jam.generate_control_map()
+    assert [control_map[control] for control in machine_jam.mute_controls] == \
+           [('mute', column) for column in range(0, JAM_BANK_SIZE)]
+    assert [control_map[control] for control in machine_jam.dice_controls] == \
+           [('regenerate', column) for column in range(0, JAM_BANK_SIZE)]
+    assert control_map[machine_jam.bank_controls[1]] == 'bank_next'
+
+
+def test_tracks_of_banks(monkeypatch):
+    _framebuffer(monkeypatch, 12)
+    assert len(machine_jam.mute) == 12
+    assert machine_jam.track_of_column(3) == 3
+    assert machine_jam.set_bank(5) == 1
+    assert machine_jam.track_of_column(3) == 11
+    assert machine_jam.track_of_column(4) is None
+    assert machine_jam.set_bank(-1) == 0
+
+
+def test_hidden_tracks_keep_their_steps(monkeypatch):
+    framebuffer = _framebuffer(monkeypatch, 16)
+    for step in range(0, JAM_ROWS + 2):
+        machine_jam.show_step(10, 100 if step % 3 == 0 else 0)
+    machine_jam.show_step(1, 90)
+
+    expected = [100 if step % 3 == 0 else 0 for step in range(JAM_ROWS + 1, 1, -1)]
+    assert machine_jam.track_steps(10) == [127 if value else 0 for value in expected]
+    assert framebuffer.column_values(1)[0] == 127
+    # track 10 is hidden, its column shows track 2
+    assert framebuffer.column_values(2) == [0] * JAM_ROWS
+
+    machine_jam.set_bank(1)
+    assert framebuffer.column_values(2) == machine_jam.track_steps(10)
+    assert framebuffer.column_values(1) == [0] * JAM_ROWS
+    machine_jam.set_bank(0)
+    assert framebuffer.column_values(1)[0] == 127
+
+
+def _control_table(monkeypatch, tracks: int, control_map=None):
+    _framebuffer(monkeypatch, tracks)
+    calls = []
+    functions = {
+        'notes_off': lambda seq_no: calls.append(('notes_off', seq_no)),
+        'regenerate_seq': lambda seq_no: calls.append(('regenerate_seq', seq_no)),
+        'set_tempo_ratio': lambda ratio, beats: calls.append(('set_tempo_ratio', ratio, beats)),
+    }
+    run_settings = RunSettings(
+        sequencers=[], transport=Transport(), quantize_to_scale=None,
+        music_scale=MusicScale(tonic='c', scale=MusicScaleType.MAJOR), sequences_config_params=[{}] * tracks,
+        generated_sequences=[],
+    )
+    return machine_jam.build_control_table(run_settings, functions, control_map), run_settings, calls
+
+
+def test_control_table_dispatch(monkeypatch):
+    table, run_settings, calls = _control_table(monkeypatch, 12)
+
+    table[94](127)
+    assert run_settings.transport.is_playing
+    table[94](0)
+    assert run_settings.transport.state == TransportState.STOPPED
+
+    table[machine_jam.mute_controls[2]](0)
+    table[machine_jam.dice_controls[3]](127)
+    table[machine_jam.bank_controls[1]](127)
+    table[machine_jam.mute_controls[2]](0)
+    table[machine_jam.dice_controls[3]](127)
+    # no track 12 in the second bank
+    table[machine_jam.dice_controls[4]](127)
+    assert machine_jam.mute[2] == 0 and machine_jam.mute[10] == 0
+    assert calls == [('notes_off', 2), ('regenerate_seq', 3), ('notes_off', 10), ('regenerate_seq', 11)]
+
+    calls.clear()
+    table[42](126)
+    assert calls == [('set_tempo_ratio', 2.0, machine_jam.TEMPO_GLIDE_BEATS)]
+
+    table[92](127)
+    assert run_settings.quantize_to_scale is not None and run_settings.quantize_table is not None
+    assert table[43] is None and table[93] is None
+
+
+def test_parse_control_map():
+    control_map = machine_jam.parse_control_map(['43=tempo', '42=none', '20=mute:3', '21=scale_next'])
+    assert control_map[43] == 'tempo'
+    assert 42 not in control_map
+    assert control_map[20] == ('mute', 3)
+    assert control_map[21] == 'scale_next'
+    assert control_map[94] == 'transport'
+    assert machine_jam.parse_control_map(None) == machine_jam.DEFAULT_CONTROL_MAP
+    assert machine_jam.coalesced_controls(control_map) == (43,)
+    assert machine_jam.coalesced_controls() == (42,)
+
+    for value in ('x=tempo', '43', '128=tempo', '43=knob', '20=mute', '20=mute:8', '20=mute:a'):
+        with pytest.raises(ValueError):
+            machine_jam.parse_control_map([value])
+
+
+def test_remapped_control_table(monkeypatch):
+    control_map = machine_jam.parse_control_map(['43=tempo', '42=none', '20=regenerate:1'])
+    table, _, calls = _control_table(monkeypatch, 4, control_map)
+    assert table[42] is None
+    table[43](0)
+    table[20](127)
+    assert calls == [('set_tempo_ratio', 0.0, machine_jam.TEMPO_GLIDE_BEATS), ('regenerate_seq', 1)]
+
+
+def test_knob_burst_applies_the_last_value():
+    applied = []
+    table = [None] * 128
+    table[42] = applied.append
+    table[94] = lambda value: applied.append(('transport', value))
+    control = machine_jam.JamControl(table, control_period=0.05)
+    for value in range(60, 80):
+        control.put(mido.Message('control_change', control=42, value=value))
+    control.put(mido.Message('control_change', control=94, value=127))
+    control.put(mido.Message('control_change', control=43, value=1))
+    control.start()
+    try:
+        deadline = time.monotonic() + 2
+        while len(applied) < 2 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        # buttons are never coalesced, the knob only applies the latest value of the burst
+        assert applied == [('transport', 127), 79]
+        assert control.received == 21
+        assert control.coalesced == 19
+
+        # a later burst still ends on its latest value
+        for value in (10, 11, 12):
+            control.put(mido.Message('control_change', control=42, value=value))
+        while applied[-1] != 12 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        assert applied[-1] == 12
+    finally:
+        control.stop()
+        control.join(timeout=1)
@@ -0,0 +1,78 @@
+import pytest
+
+import midi_backends
+from midi_backends import MidiBackend, NullBackend, RecorderBackend
+
+
+class InputPort:
+
+    def __init__(self, name: str, fail: bool = False):
+        self.name = name
+        self.closed = False
+        self._fail = fail
+
+    def close(self):
+        if self._fail:
+            raise OSError('port is gone')
+        self.closed = True
+
+
+class InputBackend(MidiBackend):
+
+    name = 'inputs'
+
+    def __init__(self):
+        self.inputs = []
+
+    def open_output(self, name: str):
+        return None
+
+    def open_input(self, name: str, callback):
+        port = InputPort(name, fail=bool(self.inputs))
+        self.inputs.append(port)
+        return port
+
+
+@pytest.fixture(autouse=True)
+def restore_backend():
+    yield
+    midi_backends.set_backend(NullBackend())
+    midi_backends._backend = None
+
+
+def test_set_backend_closes_inputs():
+    backend = InputBackend()
+    midi_backends.set_backend(backend)
+    assert midi_backends.open_input('jam_input', lambda msg: None)
+    assert midi_backends.open_input('elektron_input', lambda msg: None)
+    assert len(midi_backends._inputs) == 2
+
+    # a port failing to close is only warned about
+    midi_backends.set_backend(NullBackend())
+    assert midi_backends._inputs == []
+    assert backend.inputs[0].closed
+
+
+def test_set_backend_forgets_outputs():
+    first = RecorderBackend()
+    midi_backends.set_backend(first)
+    output = midi_backends.get_output('elektron_output')
+    assert midi_backends.get_output('elektron_output') is output
+
+    midi_backends.set_backend(RecorderBackend())
+    assert midi_backends.get_output('elektron_output') is not output
+
+
+def test_backend_without_inputs():
+    midi_backends.set_backend(NullBackend())
+    assert not midi_backends.open_input('jam_input', lambda msg: None)
+    assert midi_backends._inputs == []
+
+
+def test_backend_must_implement_ports():
+    class OutputOnly(MidiBackend):
+        def open_output(self, name: str):
+            return None
+
+    with pytest.raises(TypeError):
+        OutputOnly()
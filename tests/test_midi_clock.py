@@ -0,0 +1,110 @@
+import time
+
+import mido
+import pytest
+
+from generators import NoteGeneratorFromSequence
+from midi_clock import ClockMaster, ClockSlave, PPQN, set_tempo_ratio
+from models import TempoAndMeter
+from pattern import PackedPattern
+from sequencer import SequenceControl
+from transport import Transport
+
+
+class RecordingWriter:
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg, at=None, priority=None, trace=None):
+        self.sent.append((msg, at))
+
+    def clock_times(self) -> list:
+        return [at for msg, at in self.sent if msg.type == 'clock']
+
+
+def _sequence(tempo: float, upper_meter=4, lower_meter=16) -> SequenceControl:
+    pattern = PackedPattern()
+    for _ in range(0, upper_meter):
+        pattern.append_rest(1.0)
+    pattern.end_bar()
+    return SequenceControl(
+        generator=NoteGeneratorFromSequence(bars=pattern),
+        play_target=lambda note: None,
+        tempo_and_meter=TempoAndMeter(tempo=tempo, upper_meter=upper_meter, lower_meter=lower_meter),
+    )
+
+
+def _ramp_time(sequence: SequenceControl, target: float) -> float:
+    # seconds the sequence plays until it reaches the target tempo
+    seconds = 0.0
+    while sequence.plan.ramping:
+        seconds = seconds + sequence.plan.next_step_length()
+    assert sequence.tempo == pytest.approx(target)
+    return seconds
+
+
+def test_tempo_ratio_drives_clock_and_sequences():
+    transport = Transport()
+    clock = ClockMaster(RecordingWriter(), transport, tempo=120)
+    sequences = [_sequence(120), _sequence(60, 3, 8), _sequence(180, 5, 4)]
+
+    assert set_tempo_ratio(clock, sequences, 120, 1.5, beats=4) == 180
+    # picked up by the clock thread from its next tick
+    tempo, ramp = clock._tempo_state
+    assert tempo == 180
+    assert (ramp.start_tempo, ramp.target_tempo, ramp.beats) == (120, 180, 4)
+
+    # every sequence keeps its ratio to the clock and glides over the same time as the clock
+    for sequence, original in zip(sequences, (120, 60, 180)):
+        assert _ramp_time(sequence, original * 1.5) == pytest.approx(ramp.duration, rel=1e-6)
+
+
+def test_tempo_ratio_without_ramp_and_minimum():
+    sequences = [_sequence(120), None, _sequence(30)]
+    assert set_tempo_ratio(None, sequences, 120, 0.5) == 60
+    assert (sequences[0].tempo, sequences[2].tempo) == (60, 15)
+    assert set_tempo_ratio(None, sequences, 120, 0.0) == 1
+
+
+def test_slave_ignores_tempo_ratio():
+    sequence = _sequence(100)
+    slave = ClockSlave(Transport(), [sequence], base_tempo=100)
+    assert set_tempo_ratio(slave, [sequence], 100, 2.0, beats=4) is None
+    assert sequence.tempo == 100
+    assert not sequence.plan.ramping
+
+
+def test_slave_glides_sequences_to_clock_tempo():
+    sequence = _sequence(60)
+    slave = ClockSlave(Transport(), [sequence], base_tempo=120)
+    received = 0.0
+    for _ in range(0, PPQN * 8):
+        slave.on_message(mido.Message('clock'), received)
+        received = received + 60 / (150 * PPQN)
+    assert slave.tempo == pytest.approx(150, rel=1e-3)
+    # the sequence glides instead of jumping, and ends at its ratio of the clock
+    assert sequence.plan.ramping
+    _ramp_time(sequence, slave.applied_tempo / 2)
+
+
+def test_master_ticks_follow_ramp():
+    transport = Transport()
+    writer = RecordingWriter()
+    clock = ClockMaster(writer, transport, tempo=600, lookahead=0.0)
+    clock.start()
+    transport.play()
+    try:
+        time.sleep(0.05)
+        clock.ramp_to(1200, beats=2)
+        time.sleep(0.3)
+    finally:
+        transport.shutdown()
+        clock.join(timeout=1.0)
+
+    intervals = [b - a for a, b in zip(writer.clock_times(), writer.clock_times()[1:])]
+    assert intervals[0] == pytest.approx(60 / (600 * PPQN))
+    assert intervals[-1] == pytest.approx(60 / (1200 * PPQN))
+    # monotonic glide in between
+    assert all(b <= a + 1e-9 for a, b in zip(intervals, intervals[1:]))
+    assert clock.tempo == 1200
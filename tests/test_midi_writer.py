@@ -0,0 +1,97 @@
+import time
+
+import mido
+
+from midi_backends import RecorderBackend
+from midi_writer import MidiWriter, PRIORITY_CLOCK, PRIORITY_NOTE, PRIORITY_CC, PRIORITY_DISPLAY, message_priority
+
+
+def _writer(**kwargs) -> (MidiWriter, RecorderBackend):
+    backend = RecorderBackend()
+    return MidiWriter(backend.open_output('out'), **kwargs), backend
+
+
+def _wait_sent(writer: MidiWriter, count: int, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while writer.sent < count:
+        assert time.monotonic() < deadline, 'messages not sent in time'
+        time.sleep(0.001)
+
+
+def _note(note: int, msg_type='note_on') -> mido.Message:
+    return mido.Message(msg_type, note=note)
+
+
+def test_message_priority():
+    assert message_priority(mido.Message('clock')) == PRIORITY_CLOCK
+    assert message_priority(mido.Message('songpos', pos=0)) == PRIORITY_CLOCK
+    assert message_priority(_note(60)) == message_priority(_note(60, 'note_off')) == PRIORITY_NOTE
+    assert message_priority(mido.Message('control_change', control=1)) == PRIORITY_CC
+
+
+def test_burst_is_ordered_by_priority_then_queue_order():
+    writer, backend = _writer()
+    try:
+        at = time.monotonic() + 0.05
+        writer.send(_note(100), at=at, priority=PRIORITY_DISPLAY)
+        writer.send(mido.Message('control_change', control=7, value=1), at=at)
+        writer.send(_note(60), at=at)
+        writer.send(_note(101), at=at, priority=PRIORITY_DISPLAY)
+        writer.send(_note(61, 'note_off'), at=at)
+        # due within the burst window, still sent after the notes
+        writer.send(mido.Message('control_change', control=7, value=2), at=at + 0.0005)
+        writer.send(mido.Message('clock'), at=at + 0.0005)
+        writer.send(_note(62), at=at)
+        _wait_sent(writer, 8)
+
+        assert [str(msg) for msg in backend.messages()] == [str(msg) for msg in [
+            mido.Message('clock'),
+            _note(60), _note(61, 'note_off'), _note(62),
+            mido.Message('control_change', control=7, value=1), mido.Message('control_change', control=7, value=2),
+            _note(100), _note(101),
+        ]]
+        assert writer.bursts == 1
+        # nothing is sent before it is due
+        assert all(sent_at >= at for sent_at, _, _ in backend.records)
+    finally:
+        writer.close()
+
+
+def test_bursts_keep_time_order():
+    writer, backend = _writer()
+    try:
+        at = time.monotonic() + 0.05
+        writer.send(mido.Message('clock'), at=at + 0.02)
+        writer.send(_note(100), at=at, priority=PRIORITY_DISPLAY)
+        writer.send(_note(60), at=at + 0.01)
+        _wait_sent(writer, 3)
+        assert [msg.type for msg in backend.messages()] == ['note_on', 'note_on', 'clock']
+        assert [msg.note for msg in backend.messages()[:2]] == [100, 60]
+        assert writer.bursts == 3
+    finally:
+        writer.close()
+
+
+def test_writer_priority_overrides_message_type():
+    writer, backend = _writer(priority=PRIORITY_DISPLAY)
+    try:
+        at = time.monotonic() + 0.05
+        writer.send(_note(100), at=at)
+        writer.send(_note(60), at=at, priority=PRIORITY_NOTE)
+        writer.send(mido.Message('control_change', control=1), at=at, priority=PRIORITY_CC)
+        _wait_sent(writer, 3)
+        assert [msg.type for msg in backend.messages()] == ['note_on', 'control_change', 'note_on']
+        assert backend.messages()[0].note == 60
+    finally:
+        writer.close()
+
+
+def test_close_drops_messages_not_yet_due():
+    writer, backend = _writer()
+    writer.send(_note(60))
+    writer.send(_note(61), at=time.monotonic() + 10)
+    _wait_sent(writer, 1)
+    writer.close()
+    writer.send(_note(62))
+    assert [msg.note for msg in backend.messages()] == [60]
+    assert not writer.is_alive()
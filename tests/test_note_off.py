@@ -0,0 +1,157 @@
+import random
+import time
+
+from note_off import TimerWheel, NoteOffScheduler
+
+
+class RecordingWriter:
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg, at=None, priority=None, trace=None):
+        self.sent.append((msg, at))
+
+    def of_type(self, msg_type: str) -> list:
+        return [(msg, at) for msg, at in self.sent if msg.type == msg_type]
+
+
+def test_wheel_expires_every_entry_with_its_tick():
+    wheel = TimerWheel(tick=0.01, slots=8)
+    rng = random.Random(1)
+    dues = [wheel.origin + rng.uniform(0, 1) for _ in range(0, 200)]
+    for idx, due in enumerate(dues):
+        wheel.add(due, idx)
+    assert len(wheel) == len(dues)
+
+    expired = []
+    until = wheel.origin
+    while len(wheel):
+        until = until + 0.01
+        for due, idx in wheel.advance(until):
+            assert due == dues[idx]
+            # expired with the tick it is due in: at most one tick ahead, never left behind
+            assert until - 0.01 - 1e-9 <= due < until + 0.01
+            expired.append(idx)
+    assert sorted(expired) == list(range(0, len(dues)))
+
+
+def test_wheel_keeps_entries_more_than_one_lap_ahead():
+    wheel = TimerWheel(tick=1.0, slots=4)
+    wheel.add(wheel.origin + 1.5, 'near')
+    wheel.add(wheel.origin + 5.5, 'next lap')
+    wheel.add(wheel.origin + 21.5, 'far')
+    assert [item for _, item in wheel.advance(wheel.origin + 2.0)] == ['near']
+    assert [item for _, item in wheel.advance(wheel.origin + 6.0)] == ['next lap']
+    assert wheel.advance(wheel.origin + 20.0) == []
+    assert [item for _, item in wheel.advance(wheel.origin + 30.0)] == ['far']
+    assert len(wheel) == 0
+
+
+def test_wheel_past_entries_expire_on_next_advance():
+    wheel = TimerWheel(tick=1.0, slots=4)
+    wheel.advance(wheel.origin + 10.0)
+    wheel.add(wheel.origin + 2.0, 'late')
+    assert wheel.advance(wheel.origin + 5.0) == []
+    assert [item for _, item in wheel.advance(wheel.origin + 11.0)] == ['late']
+
+
+def _wait_for_offs(writer: RecordingWriter, count: int, timeout: float = 1.0):
+    deadline = time.monotonic() + timeout
+    while len(writer.of_type('note_off')) < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_note_off_after_gated_length():
+    writer = RecordingWriter()
+    scheduler = NoteOffScheduler(writer, tick=0.005)
+    try:
+        scheduler.note_on(0, 60, 100, length=0.1, gate=50)
+        _wait_for_offs(writer, 1)
+        (note_on, on_at), = writer.of_type('note_on')
+        (note_off, off_at), = writer.of_type('note_off')
+        assert (note_off.channel, note_off.note) == (0, 60)
+        assert abs(off_at - on_at - 0.05) < 1e-6
+        assert scheduler.sounding == 0
+    finally:
+        scheduler.close()
+
+
+def test_retriggered_note_drops_stale_off():
+    writer = RecordingWriter()
+    scheduler = NoteOffScheduler(writer, tick=0.005)
+    try:
+        scheduler.note_on(1, 64, 100, length=0.05)
+        scheduler.note_on(1, 64, 100, length=0.2)
+        # the retrigger closes the first note straight away, only the second off is scheduled
+        assert len(writer.of_type('note_off')) == 1
+        time.sleep(0.1)
+        assert len(writer.of_type('note_off')) == 1
+        assert scheduler.sounding == 1
+        _wait_for_offs(writer, 2)
+        assert len(writer.of_type('note_off')) == 2
+        assert scheduler.sounding == 0
+    finally:
+        scheduler.close()
+
+
+def test_notes_off_releases_channel():
+    writer = RecordingWriter()
+    scheduler = NoteOffScheduler(writer, tick=0.005)
+    try:
+        scheduler.note_on(0, 60, 100, length=10)
+        scheduler.note_on(2, 62, 100, length=10)
+        scheduler.notes_off(channel=2)
+        assert [(msg.channel, msg.note) for msg, _ in writer.of_type('note_off')] == [(2, 62)]
+        assert [msg.channel for msg, _ in writer.of_type('control_change')] == [2]
+        assert scheduler.sounding == 1
+    finally:
+        scheduler.close()
+
+
+def test_track_off_releases_only_the_track():
+    writer = RecordingWriter()
+    scheduler = NoteOffScheduler(writer, tick=0.005)
+    try:
+        # two tracks sharing channel 3
+        scheduler.note_on(3, 60, 100, length=10, track=0)
+        scheduler.note_on(3, 64, 100, length=10, track=1)
+        scheduler.note_on(3, 67, 100, length=10, track=0)
+        scheduler.track_off(0)
+        assert sorted(msg.note for msg, _ in writer.of_type('note_off')) == [60, 67]
+        assert writer.of_type('control_change') == []
+        assert scheduler.sounding == 1
+
+        # a note retriggered by another track belongs to it
+        scheduler.note_on(3, 64, 100, length=10, track=0)
+        scheduler.track_off(1)
+        assert scheduler.sounding == 1
+        scheduler.track_off(0)
+        assert scheduler.sounding == 0
+    finally:
+        scheduler.close()
+
+
+def test_play_target_tags_notes_with_the_track():
+    from app import play_note_from_sequence_to_midi_msg
+    from models import MusicScale, MusicScaleType, NoteLength, RunSettings
+    from midi_data import midi_note_from_no
+    from transport import Transport
+
+    writer = RecordingWriter()
+    scheduler = NoteOffScheduler(writer, tick=0.005)
+    run_settings = RunSettings(
+        sequencers=[], transport=Transport(), quantize_to_scale=None,
+        music_scale=MusicScale(tonic='c', scale=MusicScaleType.MAJOR), sequences_config_params=[{}, {}],
+        generated_sequences=[],
+    )
+    try:
+        for seq_no, midi_no in ((0, 60), (1, 62)):
+            note = NoteLength(note=midi_note_from_no(midi_no), note_length=10, velocity=100)
+            play_note_from_sequence_to_midi_msg(seq_no, note, writer, run_settings, note_offs=scheduler, channel=9)
+        assert scheduler.sounding == 2
+        scheduler.track_off(1)
+        assert [(msg.channel, msg.note) for msg, _ in writer.of_type('note_off')] == [(9, 62)]
+        assert scheduler.sounding == 1
+    finally:
+        scheduler.close()
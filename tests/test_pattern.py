@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from app import generate_sequence
+from config import parse_sequences_config
+from midi_data import midi_note_from_no
+from models import MusicScale, MusicScaleType, NoteLength
+from pattern import PackedPattern
+
+MUSIC_SCALE = MusicScale(tonic='a', scale=MusicScaleType.NATURAL_MINOR)
+
+
+def _generated(config: str) -> PackedPattern:
+    _, pattern = generate_sequence(parse_sequences_config(config, random.Random(11)), MUSIC_SCALE)
+    return pattern
+
+
+def _columns(pattern: PackedPattern) -> dict:
+    return {column: list(getattr(pattern, column)) for column in PackedPattern.__slots__}
+
+
+def test_bars():
+    pattern = PackedPattern()
+    pattern.append_note(60, 94, 0.5)
+    pattern.append_rest(0.5)
+    pattern.end_bar()
+    pattern.append_note(62, 80, 1.0, gate=50)
+    pattern.end_bar()
+    # closing an empty bar does nothing
+    pattern.end_bar()
+
+    assert len(pattern) == 3
+    assert pattern.bars_count == 2
+    assert list(pattern.bar_range(1)) == [2]
+    assert pattern.bar_names() == ['C4,-', 'D4']
+    assert pattern.step(1).note is None
+    assert pattern.step(2).note is midi_note_from_no(62)
+    assert (pattern.step(2).velocity, pattern.step(2).gate) == (80, 50)
+
+
+def test_set_gate_skips_rests_and_clamps():
+    pattern = PackedPattern()
+    pattern.append_note(60, 94, 0.5)
+    pattern.append_rest(0.5)
+    pattern.set_gate(150)
+    assert list(pattern.gate) == [100, 0]
+    pattern.set_gate(0)
+    assert list(pattern.gate) == [1, 0]
+
+
+def test_dict_round_trip():
+    for config in ('r|2|4|30|30|4/4', 'a|2|6|4|30|3th|g|4/4', 'w|2|4|30|2|-8.8|4/4|gate=70'):
+        pattern = _generated(config)
+        restored = PackedPattern.from_dict(pattern.to_dict())
+        assert _columns(restored) == _columns(pattern)
+        assert {column: getattr(restored, column).typecode for column in PackedPattern.__slots__} == \
+               {column: getattr(pattern, column).typecode for column in PackedPattern.__slots__}
+
+
+def test_bars_round_trip():
+    pattern = _generated('r|3|4|30|30|4/4')
+    bars = pattern.to_bars()
+    assert [len(bar) for bar in bars] == [len(pattern.bar_range(idx)) for idx in range(0, pattern.bars_count)]
+    assert all(isinstance(step, NoteLength) for bar in bars for step in bar)
+    assert _columns(PackedPattern.from_bars(bars)) == _columns(pattern)
+
+
+def test_from_dict_needs_every_column():
+    data = _generated('r|2|4|30|30|4/4').to_dict()
+    del data['gate']
+    with pytest.raises(KeyError):
+        PackedPattern.from_dict(data)
@@ -0,0 +1,56 @@
+import json
+
+from app import generate_sequences_by_config_params
+from config import sequences_config_parser
+from models import MusicScale, MusicScaleType
+from pattern_cache import PatternCache
+
+CONFIGS = ['r|2|4|30:-5.5|30|4/4', 'a|2|6|4|30|3th|g|4/4', 'w|2|4|30|2|-8.8|4/4|gate=70']
+MUSIC_SCALE = MusicScale(tonic='d', scale=MusicScaleType.MAJOR)
+
+
+def _generate(cache, seed=5):
+    config_params = sequences_config_parser(CONFIGS, seed=seed)
+    sequences = generate_sequences_by_config_params(config_params, MUSIC_SCALE, cache)
+    # next values of every sequence RNG stream, e.g. what a dice regeneration would draw
+    streams = [seq_cfg['rng'].random() for seq_cfg in config_params]
+    return [(tempo_and_meter.model_dump(), pattern.to_dict()) for tempo_and_meter, pattern in sequences], streams
+
+
+def test_warm_start_equals_cold_start(tmp_path):
+    cache = PatternCache(str(tmp_path))
+    cold = _generate(cache)
+    assert len(list(tmp_path.glob('*.json'))) == len(CONFIGS)
+    assert _generate(cache) == cold
+    assert _generate(None) == cold
+
+
+def test_key_depends_on_config_scale_and_seed():
+    keys = {
+        PatternCache.key(CONFIGS[0], MUSIC_SCALE, 1),
+        PatternCache.key(CONFIGS[1], MUSIC_SCALE, 1),
+        PatternCache.key(CONFIGS[0], MusicScale(tonic='d', scale=MusicScaleType.NATURAL_MINOR), 1),
+        PatternCache.key(CONFIGS[0], MUSIC_SCALE, 2),
+    }
+    assert len(keys) == 4
+    assert PatternCache.key(CONFIGS[0], MusicScale(tonic='D', scale=MusicScaleType.MAJOR), 1) == \
+           PatternCache.key(CONFIGS[0], MUSIC_SCALE, 1)
+
+
+def test_unseeded_sequences_are_not_cached(tmp_path):
+    cache = PatternCache(str(tmp_path))
+    generate_sequences_by_config_params(sequences_config_parser(CONFIGS), MUSIC_SCALE, cache)
+    assert not list(tmp_path.glob('*.json'))
+
+
+def test_malformed_entry_is_regenerated(tmp_path):
+    cache = PatternCache(str(tmp_path))
+    cold = _generate(cache)
+    for path in tmp_path.glob('*.json'):
+        data = json.loads(path.read_text())
+        del data['pattern']['gate']
+        path.write_text(json.dumps(data))
+    assert _generate(cache) == cold
+
+    (tmp_path / f'{PatternCache.key(CONFIGS[0], MUSIC_SCALE, 1)}.json').write_text('{not json')
+    assert cache.get(PatternCache.key(CONFIGS[0], MUSIC_SCALE, 1)) is None
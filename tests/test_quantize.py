@@ -0,0 +1,49 @@
+import pytest
+
+from midi_data import midi_note_from_no, midi_note_from_name_and_octave
+from models import MusicScale, MusicScaleType
+from music_utils import KEYS, get_scale, get_closes_note, quantize, quantize_table
+
+# lowest midi number with note data, see midi_data
+LOWEST_NOTE = min(midi_no for midi_no in range(0, 128) if midi_note_from_no(midi_no))
+SCALES = [MusicScale(tonic=tonic, scale=scale) for tonic in KEYS for scale in MusicScaleType]
+
+
+def _quantize_by_name(note, music_scale: MusicScale, down: bool):
+    # the note name lookup the tables replaced
+    notes_with_scale_status, _, _ = get_scale(music_scale)
+    down_note, up_note = get_closes_note(note.name.lower(), notes_with_scale_status)
+    return midi_note_from_name_and_octave(down_note if down else up_note, note.octave)
+
+
+@pytest.mark.parametrize('music_scale', SCALES, ids=lambda s: f'{s.tonic}-{s.scale.value}')
+@pytest.mark.parametrize('down', [True, False], ids=['down', 'up'])
+def test_table_matches_note_name_quantize(music_scale, down):
+    assert len(quantize_table(music_scale, down)) == 128
+    for midi_no in range(LOWEST_NOTE, 128):
+        note = midi_note_from_no(midi_no)
+        expected = _quantize_by_name(note, music_scale, down)
+        if expected is None:
+            # target note is above G9 (the table keeps the note) or below A0
+            continue
+        assert quantize(note, music_scale, down) is expected, note.full_name
+
+
+@pytest.mark.parametrize('music_scale', SCALES, ids=lambda s: f'{s.tonic}-{s.scale.value}')
+def test_scale_notes_are_kept(music_scale):
+    notes_with_scale_status, _, _ = get_scale(music_scale)
+    for down in (True, False):
+        table = quantize_table(music_scale, down)
+        for midi_no in range(0, 128):
+            name = KEYS[midi_no % 12]
+            if notes_with_scale_status[name]:
+                assert table[midi_no] == midi_no
+            else:
+                assert notes_with_scale_status[KEYS[table[midi_no] % 12]] or table[midi_no] == midi_no
+
+
+def test_quantize_returns_interned_note():
+    music_scale = MusicScale(tonic='c', scale=MusicScaleType.MAJOR)
+    c_sharp = midi_note_from_name_and_octave('c#', 4)
+    assert quantize(c_sharp, music_scale) is midi_note_from_name_and_octave('c', 4)
+    assert quantize(c_sharp, music_scale, down=False) is midi_note_from_name_and_octave('d', 4)
@@ -0,0 +1,129 @@
+import time
+from threading import Event
+
+import pytest
+
+from regeneration import RegenerationWorker
+
+
+def _wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not met in time'
+        time.sleep(0.001)
+
+
+class Generator:
+    """
+    Generates variations of the current config, optionally blocks until released.
+    """
+
+    def __init__(self, block: bool = False):
+        self.config = 'old'
+        self.calls = 0
+        self.started = Event()
+        self.release = Event()
+        if not block:
+            self.release.set()
+
+    def __call__(self, seq_no: int):
+        self.calls = self.calls + 1
+        self.started.set()
+        assert self.release.wait(timeout=2.0)
+        return seq_no, self.config, self.calls
+
+
+@pytest.fixture
+def applied():
+    return []
+
+
+def _worker(generate, applied: list, **kwargs) -> RegenerationWorker:
+    worker = RegenerationWorker(generate=generate, apply=lambda seq_no, variation: applied.append(variation),
+                                sequences=2, **kwargs)
+    worker.start()
+    return worker
+
+
+def test_pool_hit_applies_pooled_variation(applied):
+    generate = Generator()
+    worker = _worker(generate, applied, pool_size=2, refill_rate=1000)
+    try:
+        _wait_for(lambda: worker.pooled(0) == 2 and worker.pooled(1) == 2)
+        worker.request(1)
+        # applied straight away from the pool, the pool is topped up again
+        assert [variation[0] for variation in applied] == [1]
+        assert worker.stats()['hits'] == 1 and worker.stats()['misses'] == 0
+        _wait_for(lambda: worker.pooled(1) == 2)
+    finally:
+        worker.stop()
+
+
+def test_pool_miss_generates_on_demand(applied):
+    generate = Generator()
+    worker = _worker(generate, applied, pool_size=1, refill_rate=0)
+    try:
+        worker.request(0)
+        _wait_for(lambda: len(applied) == 1)
+        assert applied == [(0, 'old', 1)]
+        assert worker.stats()['misses'] == 1 and worker.stats()['hits'] == 0
+        assert worker.pooled(0) == 0
+    finally:
+        worker.stop()
+
+
+def test_waiting_requests_are_merged(applied):
+    generate = Generator(block=True)
+    worker = _worker(generate, applied)
+    try:
+        worker.request(0)
+        assert generate.started.wait(timeout=2.0)
+        # first is being generated, the second waits and the third is merged into it
+        worker.request(0)
+        worker.request(0)
+        worker.request(1)
+        generate.release.set()
+        _wait_for(lambda: len(applied) == 3)
+        assert worker.requests == 4
+        assert worker.merged == worker.stats()['merged'] == 1
+        assert sorted(variation[0] for variation in applied) == [0, 0, 1]
+    finally:
+        worker.stop()
+
+
+def test_invalidate_during_on_demand_generation(applied):
+    generate = Generator(block=True)
+    worker = _worker(generate, applied)
+    try:
+        worker.request(0)
+        assert generate.started.wait(timeout=2.0)
+        generate.config = 'new'
+        worker.invalidate(0)
+        generate.release.set()
+        _wait_for(lambda: worker.stats()['dropped'] == 1)
+        assert applied == []
+
+        worker.request(0)
+        _wait_for(lambda: len(applied) == 1)
+        assert applied[0][1] == 'new'
+    finally:
+        worker.stop()
+
+
+def test_invalidate_during_pool_refill(applied):
+    generate = Generator(block=True)
+    worker = _worker(generate, applied, pool_size=2, refill_rate=1000)
+    try:
+        assert generate.started.wait(timeout=2.0)
+        generate.config = 'new'
+        worker.invalidate(0)
+        worker.invalidate(1)
+        generate.release.set()
+        _wait_for(lambda: worker.pooled(0) == 2 and worker.pooled(1) == 2)
+        assert worker.stats()['dropped'] == 1
+
+        worker.request(0)
+        worker.request(1)
+        assert [variation[1] for variation in applied] == ['new', 'new']
+    finally:
+        worker.stop()
@@ -0,0 +1,39 @@
+from app import generate_sequences_by_config_params, sequence_channels
+from config import sequences_config_parser
+from models import MusicScale, MusicScaleType
+from render import render_sequences
+
+CONFIGS = ['r|2|4|60|0|4/4|ch=10', 'a|2|6|4|60|3th|g|4/4', 'w|2|4|60|2|-8.8|4/4|ch=3|gate=50']
+
+
+def _rendered(live_channels: bool = False):
+    config_params = sequences_config_parser(CONFIGS, seed=1)
+    sequences = generate_sequences_by_config_params(config_params, MusicScale(tonic='e', scale=MusicScaleType.MAJOR))
+    channels = sequence_channels(config_params) if live_channels else None
+    return render_sequences(sequences, duration=10, base_tempo=60, channels=channels)
+
+
+def _track_channels(midi_file) -> list:
+    return [{msg.channel for msg in track if not msg.is_meta} for track in midi_file.tracks[1:]]
+
+
+def test_render_uses_live_channels():
+    assert _track_channels(_rendered(live_channels=True)) == [{9}, {1}, {2}]
+
+
+def test_render_default_channels():
+    assert _track_channels(_rendered()) == [{0}, {1}, {2}]
+
+
+def test_notes_are_closed_after_gate():
+    midi_file = _rendered(live_channels=True)
+    for track in midi_file.tracks[1:]:
+        sounding = {}
+        tick = 0
+        for msg in track:
+            tick = tick + msg.time
+            if msg.type == 'note_on' and msg.velocity:
+                sounding[msg.note] = tick
+            elif msg.type == 'note_off':
+                assert tick > sounding.pop(msg.note)
+        assert not sounding
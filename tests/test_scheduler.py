@@ -0,0 +1,154 @@
+import threading
+import time
+
+import pytest
+
+from generators import NoteGeneratorFromSequence
+from models import TempoAndMeter
+from pattern import PackedPattern
+from scheduler import Scheduler
+from sequencer import SequenceControl
+from transport import Transport
+
+# exact binary fractions, deadlines of both sequences meet without rounding errors
+STEP_A = 0.125
+STEP_B = 0.1875
+# simulated work of every step, advances the virtual clock
+WORK = 0.01
+
+
+class VirtualTimeScheduler(Scheduler):
+    """
+    Scheduler run on a virtual clock: waiting for a deadline jumps straight to it, waiting for a state change
+    calls on_idle (e.g. resumes playback).
+    """
+
+    def __init__(self, transport: Transport, on_idle=lambda: None):
+        self.now = 100.0
+        self._on_idle = on_idle
+        super().__init__(transport, clock=lambda: self.now)
+
+    def _wait(self, timeout=None):
+        if timeout is None:
+            self._on_idle()
+        else:
+            self.now = self.now + timeout
+
+
+def _sequence(name: str, tempo: float, fired: list, scheduler: VirtualTimeScheduler, on_step) -> SequenceControl:
+    pattern = PackedPattern()
+    for midi_no in range(60, 64):
+        pattern.append_note(midi_no, 100, 1.0)
+    pattern.end_bar()
+
+    def play(note):
+        fired.append((scheduler.now, name, note.note.midi_no))
+        scheduler.now = scheduler.now + WORK
+        on_step(len(fired))
+
+    return SequenceControl(
+        generator=NoteGeneratorFromSequence(bars=pattern),
+        play_target=play,
+        tempo_and_meter=TempoAndMeter(tempo=tempo, upper_meter=4, lower_meter=16),
+        desc=name,
+    )
+
+
+def _run(steps: int,
+         on_step=lambda transport, count: None,
+         on_idle=lambda transport, scheduler: None) -> (list, VirtualTimeScheduler):
+    transport = Transport()
+    fired = []
+    scheduler = VirtualTimeScheduler(transport, on_idle=lambda: on_idle(transport, scheduler))
+
+    def step(count: int):
+        on_step(transport, count)
+        if count == steps:
+            transport.shutdown()
+
+    scheduler.add(_sequence('A', 120, fired, scheduler, step))
+    scheduler.add(_sequence('B', 80, fired, scheduler, step))
+    transport.play()
+    # run in the calling thread, deterministic
+    scheduler.run()
+    return fired, scheduler
+
+
+def _grid(start: float, until: float) -> list:
+    grid = [(start + idx * STEP_A, 0, 'A') for idx in range(0, int((until - start) / STEP_A) + 1)]
+    grid.extend((start + idx * STEP_B, 1, 'B') for idx in range(0, int((until - start) / STEP_B) + 1))
+    return [(due, name) for due, _, name in sorted(grid)]
+
+
+def test_firing_order_and_no_drift():
+    fired, _ = _run(200)
+    assert (STEP_A, STEP_B) == (
+        TempoAndMeter(tempo=120, upper_meter=4, lower_meter=16).to_bar_and_note_length().note_length,
+        TempoAndMeter(tempo=80, upper_meter=4, lower_meter=16).to_bar_and_note_length().note_length,
+    )
+
+    start = fired[0][0]
+    expected = _grid(start, fired[-1][0])[:len(fired)]
+    # deadlines in time order, A before B when both are due at once
+    assert [name for _, name, _ in fired] == [name for _, name in expected]
+    # every step fires late only by the work of the steps due at the same time, lateness never accumulates
+    lateness = [at - due for (at, _, _), (due, _) in zip(fired, expected)]
+    assert min(lateness) == 0
+    assert max(lateness) == pytest.approx(WORK)
+    assert lateness[-20:] == pytest.approx(lateness[:20])
+    # both sequences play their pattern in order
+    assert [midi_no for _, name, midi_no in fired if name == 'A'][:6] == [60, 61, 62, 63, 60, 61]
+
+
+def test_pause_re_anchors_and_keeps_position():
+    def on_step(transport: Transport, count: int):
+        if count == 7:
+            transport.pause()
+
+    def on_idle(transport: Transport, scheduler: VirtualTimeScheduler):
+        scheduler.now = scheduler.now + 10.0
+        transport.play()
+
+    fired, _ = _run(20, on_step, on_idle)
+    resumed = fired[7][0]
+    assert resumed - fired[6][0] > 10.0
+    # both sequences start together again from the resume time and continue where they were paused
+    assert [(at, name) for at, name, _ in fired[7:9]] == [(resumed, 'A'), (resumed + WORK, 'B')]
+    played_a = [midi_no for _, name, midi_no in fired if name == 'A']
+    assert played_a[:8] == [60, 61, 62, 63, 60, 61, 62, 63]
+    expected = _grid(resumed, fired[-1][0])[:len(fired) - 7]
+    assert [name for _, name, _ in fired[7:]] == [name for _, name in expected]
+
+
+def test_stop_rewinds():
+    def on_step(transport: Transport, count: int):
+        if count == 5:
+            transport.stop()
+
+    def on_idle(transport: Transport, scheduler: VirtualTimeScheduler):
+        scheduler.now = scheduler.now + 1.0
+        transport.play()
+
+    fired, _ = _run(8, on_step, on_idle)
+    assert [(name, midi_no) for _, name, midi_no in fired[5:7]] == [('A', 60), ('B', 60)]
+
+
+def test_shutdown_wakes_the_scheduler():
+    transport = Transport()
+    scheduler = Scheduler(transport)
+    played = threading.Event()
+    pattern = PackedPattern()
+    pattern.append_note(60, 100, 1.0)
+    pattern.end_bar()
+    # one step per 6 seconds
+    scheduler.add(SequenceControl(NoteGeneratorFromSequence(bars=pattern), lambda note: played.set(),
+                                  TempoAndMeter(tempo=10, upper_meter=1, lower_meter=4)))
+    scheduler.start()
+    transport.play()
+    assert played.wait(timeout=1.0)
+
+    started = time.monotonic()
+    transport.shutdown()
+    scheduler.join(timeout=1.0)
+    assert not scheduler.is_alive()
+    assert time.monotonic() - started < 0.5
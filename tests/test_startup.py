@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks import STARTUP_MODULES
+
+# seconds from interpreter start to the imported live path
+STARTUP_BUDGET = 1.0
+
+SOURCES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'generation_x')
+SCRIPT = f'''
+import {', '.join(STARTUP_MODULES)}
+import midi_backends
+print(len(midi_backends._outputs), len(midi_backends._inputs), midi_backends._backend)
+'''
+
+
+def _import_app() -> float:
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', SCRIPT], cwd=SOURCES, capture_output=True, text=True, check=True)
+    taken = time.perf_counter() - started
+    outputs, inputs, backend = completed.stdout.split()
+    assert (outputs, inputs, backend) == ('0', '0', 'None'), 'importing the app opened MIDI ports'
+    return taken
+
+
+def test_import_opens_no_ports():
+    _import_app()
+
+
+def test_startup_within_budget():
+    # best of three, the first run also pays for cold file caches
+    taken = min(_import_app() for _ in range(0, 3))
+    assert taken <= STARTUP_BUDGET, f'startup took {taken:.3f}s, budget is {STARTUP_BUDGET}s'
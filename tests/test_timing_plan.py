@@ -0,0 +1,47 @@
+import pytest
+
+from models import TempoAndMeter
+from timing_plan import TempoRamp, TimingPlan
+
+
+@pytest.mark.parametrize('curve', ['linear', 'exponential'])
+def test_ramp_steps_add_up_to_closed_form(curve):
+    plan = TimingPlan(TempoAndMeter(tempo=90, upper_meter=3, lower_meter=8))
+    plan.ramp_to(150, bars=2, curve=curve)
+    steps = [plan.next_step_length() for _ in range(0, 6)]
+    assert sum(steps) == pytest.approx(TempoRamp(90, 150, 3, curve).duration)
+    assert steps == sorted(steps, reverse=True)
+    assert not plan.ramping
+    assert plan.tempo == 150
+    assert plan.next_step_length() == pytest.approx(60 / 150 / 2)
+
+
+def test_set_tempo_cancels_ramp():
+    plan = TimingPlan(TempoAndMeter(tempo=120, upper_meter=4, lower_meter=16))
+    plan.ramp_to(60, bars=4)
+    plan.next_step_length()
+    plan.set_tempo(100)
+    assert not plan.ramping
+    assert plan.next_step_length() == pytest.approx(0.15)
+
+
+def test_outside_tempo_change_is_picked_up():
+    tempo_and_meter = TempoAndMeter(tempo=120, upper_meter=4, lower_meter=4)
+    plan = TimingPlan(tempo_and_meter)
+    compiles = plan.compiles
+    plan.ramp_to(60, bars=1)
+    tempo_and_meter.tempo = 240
+    assert plan.next_step_length() == pytest.approx(0.25)
+    assert not plan.ramping
+    assert plan.compiles == compiles + 1
+
+
+def test_new_ramp_starts_from_current_tempo():
+    plan = TimingPlan(TempoAndMeter(tempo=100, upper_meter=4, lower_meter=4))
+    plan.ramp_to(200, bars=1)
+    plan.next_step_length()
+    plan.next_step_length()
+    mid_tempo = plan.tempo
+    plan.ramp_to(100, bars=1)
+    first = plan.next_step_length()
+    assert first == pytest.approx(TempoRamp(mid_tempo, 100, 4).time_at(1))
@@ -0,0 +1,163 @@
+import os
+import signal
+import threading
+import time
+
+from generators import NoteGeneratorFromSequence
+from models import TempoAndMeter
+from pattern import PackedPattern
+from sequencer import Sequencer
+from transport import Transport, TransportState
+
+# notes of the played pattern, two bars of four steps
+NOTES = list(range(60, 68))
+
+
+def _wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not met in time'
+        time.sleep(0.001)
+
+
+def _in_thread(target, *args) -> (threading.Thread, list):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(target(*args)), daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_wait_for_play_blocks_until_play():
+    transport = Transport()
+    thread, result = _in_thread(transport.wait_for_play)
+    thread.join(timeout=0.05)
+    assert thread.is_alive()
+
+    transport.play()
+    thread.join(timeout=1.0)
+    assert result == [True]
+    # already playing, returns straight away
+    assert transport.wait_for_play(timeout=0)
+
+
+def test_wait_for_play_released_by_shutdown_and_timeout():
+    transport = Transport()
+    assert transport.wait_for_play(timeout=0.01) is False
+
+    thread, result = _in_thread(transport.wait_for_play)
+    transport.shutdown()
+    thread.join(timeout=1.0)
+    assert result == [False]
+    # shut down transport never plays again
+    transport.play()
+    assert not transport.is_playing
+
+
+def test_sleep_returns_early_on_state_change():
+    transport = Transport()
+    transport.play()
+    started = time.monotonic()
+    assert transport.sleep(0.02)
+    assert time.monotonic() - started >= 0.02
+
+    for change in (transport.pause, transport.stop, transport.shutdown):
+        transport.play()
+        thread, result = _in_thread(transport.sleep, 5.0)
+        time.sleep(0.02)
+        change()
+        thread.join(timeout=1.0)
+        assert result == [False], change.__name__
+
+
+def test_sleep_returns_early_on_restart():
+    transport = Transport()
+    transport.play()
+    epoch = transport.epoch
+    thread, result = _in_thread(transport.sleep, 5.0)
+    time.sleep(0.02)
+    transport.pause()
+    transport.play()
+    thread.join(timeout=1.0)
+    assert result == [False]
+    assert transport.epoch == epoch + 1
+
+
+def test_listeners_fire_on_every_change():
+    transport = Transport()
+    states = []
+    transport.add_listener(states.append)
+    transport.play()
+    transport.play()
+    transport.pause()
+    transport.play()
+    transport.stop()
+    transport.shutdown()
+    transport.shutdown()
+    transport.play()
+    assert states == [TransportState.PLAYING, TransportState.PAUSED, TransportState.PLAYING,
+                      TransportState.STOPPED, TransportState.STOPPED]
+    assert transport.rewinds == 1
+
+
+def test_wait_shutdown_returns_after_shutdown():
+    transport = Transport()
+    timer = threading.Timer(0.05, transport.shutdown)
+    timer.start()
+    started = time.monotonic()
+    transport.wait_shutdown(poll_interval=0.01)
+    assert transport.is_shutdown
+    assert time.monotonic() - started < 1.0
+
+
+def test_stop_rewinds_and_pause_keeps_position():
+    pattern = PackedPattern()
+    for bar in (NOTES[:4], NOTES[4:]):
+        for midi_no in bar:
+            pattern.append_note(midi_no, 100, 0.1)
+        pattern.end_bar()
+    played = []
+    transport = Transport()
+    sequencer = Sequencer(
+        generator=NoteGeneratorFromSequence(bars=pattern),
+        play_target=lambda note: played.append(note.note.midi_no),
+        transport=transport,
+        tempo_and_meter=TempoAndMeter(tempo=1200, upper_meter=4, lower_meter=16),
+    )
+    try:
+        transport.play()
+        _wait_for(lambda: len(played) >= 3)
+        transport.pause()
+        time.sleep(0.05)
+        paused_at = len(played)
+        time.sleep(0.05)
+        assert len(played) == paused_at
+
+        # pause keeps the position, playback continues with the next step
+        transport.play()
+        _wait_for(lambda: len(played) > paused_at)
+        assert played == [NOTES[idx % len(NOTES)] for idx in range(0, len(played))]
+
+        # stop rewinds the generator to the first step
+        transport.stop()
+        time.sleep(0.05)
+        stopped_at = len(played)
+        transport.play()
+        _wait_for(lambda: len(played) > stopped_at + 1)
+        assert played[stopped_at:stopped_at + 2] == NOTES[:2]
+    finally:
+        transport.shutdown()
+        sequencer.join(timeout=1.0)
+
+
+def test_signal_shuts_down():
+    transport = Transport()
+    previous = signal.getsignal(signal.SIGTERM), signal.getsignal(signal.SIGINT)
+    try:
+        transport.install_signal_handlers()
+        transport.play()
+        os.kill(os.getpid(), signal.SIGTERM)
+        transport.wait_shutdown(poll_interval=0.01)
+        assert transport.state == TransportState.STOPPED
+    finally:
+        signal.signal(signal.SIGTERM, previous[0])
+        signal.signal(signal.SIGINT, previous[1])